@@ -83,6 +83,38 @@ class ServicoAImpl {
     }
   }
 
+  /**
+   * Implementa o método RealizarTarefaALote
+   * Processa um lote de requisições (micro-batching do Módulo P) e devolve as
+   * respostas na mesma ordem. Uma falha em um item não derruba o lote.
+   * @param {Object} call - Objeto da chamada gRPC contendo o lote
+   * @param {Function} callback - Callback para retornar as respostas
+   */
+  realizarTarefaALote(call, callback) {
+    const requests = call.request.requests || [];
+    const responses = requests.map((request) => {
+      try {
+        return {
+          id: request.id,
+          result: this.processarDados(request.data, request.operation),
+          message: `Tarefa A executada com sucesso para ID ${request.id}`,
+          status_code: 200,
+        };
+      } catch (error) {
+        console.error(`❌ [ServicoA] Erro no item ${request.id} do lote:`, error);
+        return {
+          id: request.id,
+          result: "",
+          message: `Erro no processamento: ${error.message}`,
+          status_code: 500,
+        };
+      }
+    });
+
+    console.log(`📦 [ServicoA] Lote processado: ${responses.length} requisição(ões)`);
+    callback(null, { responses });
+  }
+
   /**
    * Mapa para contagem de palavras mais faladas
    */
@@ -171,6 +203,53 @@ class ServicoAImpl {
   }
 }
 
+/**
+ * Implementação do serviço de chat
+ * Stream bidirecional de longa duração aberto pelo Módulo P: cada ChatMessage
+ * recebida é processada e devolvida no mesmo stream com o mesmo message_id
+ * (correlação do lado do gateway), sem o custo de um RPC por mensagem.
+ */
+class ChatServiceImpl {
+  /**
+   * @param {ServicoAImpl} servicoA - Processamento compartilhado com RealizarTarefaA
+   */
+  constructor(servicoA) {
+    this.servicoA = servicoA;
+    this.streamsAtivos = 0;
+  }
+
+  /**
+   * Implementa o método ChatStream
+   * @param {Object} call - Stream duplex da chamada gRPC
+   */
+  chatStream(call) {
+    this.streamsAtivos++;
+    console.log(`🔗 [ChatService] Stream aberto (ativos: ${this.streamsAtivos})`);
+
+    call.on("data", (message) => {
+      let content = message.content;
+      try {
+        content = this.servicoA.processarDados(message.content, "process_message");
+      } catch (error) {
+        // Devolve o conteúdo original: a mensagem não pode travar o stream
+        console.error(`❌ [ChatService] Erro ao processar ${message.message_id}:`, error);
+      }
+      call.write({ ...message, content });
+    });
+
+    call.on("end", () => call.end());
+
+    call.on("error", (error) => {
+      console.error(`❌ [ChatService] Erro no stream:`, error.message);
+    });
+
+    call.on("close", () => {
+      this.streamsAtivos--;
+      console.log(`🔌 [ChatService] Stream encerrado (ativos: ${this.streamsAtivos})`);
+    });
+  }
+}
+
 /**
  * Implementação do serviço de usuários
  * Gerencia operações de login, usuários online e status
@@ -183,6 +262,45 @@ class UserServiceImpl {
     this.onlineUsers = new Map();
     // Cache de usernames para evitar duplicatas {room_id: Set(usernames)}
     this.usernameCache = new Map();
+    // Log de mudanças de presença (versão crescente) consumido pelo SyncPresence
+    this.presenceVersion = 0;
+    this.presenceLog = [];
+    this.presenceLogLimit = Number(process.env.PRESENCE_LOG_SIZE || 10000);
+  }
+
+  /**
+   * Registra a mudança de presença de um usuário no log
+   * @param {string} room_id - Sala do usuário
+   * @param {Object} userInfo - Estado atual do usuário (status OFFLINE = saiu)
+   */
+  recordPresence(room_id, userInfo) {
+    this.presenceVersion++;
+    this.presenceLog.push({
+      version: this.presenceVersion,
+      room_id,
+      user: {
+        user_id: userInfo.user_id,
+        username: userInfo.username,
+        status: userInfo.status,
+        last_seen: userInfo.last_seen,
+      },
+    });
+    if (this.presenceLog.length > this.presenceLogLimit) {
+      this.presenceLog.splice(0, this.presenceLog.length - this.presenceLogLimit);
+    }
+  }
+
+  /**
+   * Procura um usuário online da sala pelo username
+   */
+  findUserInRoom(room_id, username) {
+    for (const user_id of this.onlineUsers.get(room_id) || []) {
+      const userInfo = this.users.get(user_id);
+      if (userInfo && userInfo.username === username) {
+        return userInfo;
+      }
+    }
+    return null;
   }
 
   /**
@@ -254,6 +372,7 @@ class UserServiceImpl {
         this.onlineUsers.set(room_id, new Set());
       }
       this.onlineUsers.get(room_id).add(user_id);
+      this.recordPresence(room_id, userInfo);
 
       console.log(
         `✅ [UserService] User ${cleanUsername} logged in successfully`
@@ -377,6 +496,7 @@ class UserServiceImpl {
 
         console.log(`👋 [UserService] User ${userInfo.username} went offline`);
       }
+      this.recordPresence(userInfo.room_id, userInfo);
 
       const response = {
         success: true,
@@ -399,6 +519,119 @@ class UserServiceImpl {
     }
   }
 
+  /**
+   * Aplica uma mudança de presença vinda do gateway
+   * O gateway identifica a sessão WebSocket pelo username na sala (o login
+   * pode ter registrado o mesmo usuário com outro user_id)
+   * @param {Object} change - PresenceChange {room_id, user}
+   */
+  applyPresenceChange({ room_id = "global", user }) {
+    if (!user || !user.username) {
+      return;
+    }
+    const online = user.status !== "OFFLINE";
+    let userInfo =
+      this.users.get(user.user_id) || this.findUserInRoom(room_id, user.username);
+
+    if (!userInfo) {
+      if (!online) {
+        return;
+      }
+      userInfo = {
+        user_id: user.user_id,
+        username: user.username,
+        room_id,
+        joined_at: Date.now(),
+      };
+      this.users.set(user.user_id, userInfo);
+    }
+    userInfo.status = user.status;
+    userInfo.last_seen = Date.now();
+
+    if (!this.onlineUsers.has(room_id)) {
+      this.onlineUsers.set(room_id, new Set());
+    }
+    if (!this.usernameCache.has(room_id)) {
+      this.usernameCache.set(room_id, new Set());
+    }
+    if (online) {
+      this.onlineUsers.get(room_id).add(userInfo.user_id);
+      this.usernameCache.get(room_id).add(userInfo.username);
+    } else {
+      this.onlineUsers.get(room_id).delete(userInfo.user_id);
+      this.usernameCache.get(room_id).delete(userInfo.username);
+    }
+    this.recordPresence(room_id, userInfo);
+  }
+
+  /**
+   * Sincronização de presença com o gateway (Módulo P)
+   * Aplica o lote de mudanças enviado e devolve a última mudança de cada
+   * usuário desde since_version. Se since_version é 0 ou já saiu do log
+   * (ou é de antes de um reinício), devolve todos os usuários online (full).
+   * @param {Object} call - Objeto da chamada gRPC
+   * @param {Function} callback - Callback para retornar a resposta
+   */
+  syncPresence(call, callback) {
+    const { changes = [] } = call.request;
+    const since = Number(call.request.since_version || 0);
+
+    try {
+      for (const change of changes) {
+        this.applyPresenceChange(change);
+      }
+
+      const oldest = this.presenceLog.length
+        ? this.presenceLog[0].version
+        : this.presenceVersion + 1;
+      const full = since <= 0 || since < oldest - 1 || since > this.presenceVersion;
+      let result = [];
+
+      if (full) {
+        for (const [room_id, userIds] of this.onlineUsers.entries()) {
+          for (const user_id of userIds) {
+            const userInfo = this.users.get(user_id);
+            if (userInfo) {
+              result.push({
+                room_id,
+                user: {
+                  user_id: userInfo.user_id,
+                  username: userInfo.username,
+                  status: userInfo.status,
+                  last_seen: userInfo.last_seen,
+                },
+              });
+            }
+          }
+        }
+      } else {
+        // Só a última mudança de cada usuário desde a versão do gateway
+        const latest = new Map();
+        for (let i = this.presenceLog.length - 1; i >= 0; i--) {
+          const entry = this.presenceLog[i];
+          if (entry.version <= since) {
+            break;
+          }
+          const key = `${entry.room_id}\u0000${entry.user.user_id}`;
+          if (!latest.has(key)) {
+            latest.set(key, { room_id: entry.room_id, user: entry.user });
+          }
+        }
+        result = Array.from(latest.values()).reverse();
+      }
+
+      if (changes.length > 0 || result.length > 0) {
+        console.log(
+          `👥 [UserService] SyncPresence: ${changes.length} recebida(s), ${result.length} enviada(s)${full ? " (completa)" : ""}`
+        );
+      }
+      callback(null, { changes: result, version: this.presenceVersion, full });
+    } catch (error) {
+      console.error(`❌ [UserService] Erro no SyncPresence:`, error);
+      callback({ code: grpc.status.INTERNAL, message: error.message });
+    }
+  }
+
   /**
    * Método para limpeza periódica de usuários inativos
    */
@@ -424,6 +657,7 @@ class UserServiceImpl {
         }
 
         this.users.delete(user_id);
+        this.recordPresence(room_id, { ...userInfo, status: "OFFLINE" });
       }
     }
   }
@@ -442,12 +676,26 @@ class UserServiceImpl {
  * Função para iniciar o servidor gRPC
  */
 function startServer() {
-  const server = new grpc.Server();
+  const server = new grpc.Server({
+    // Aceita o keepalive dos canais persistentes do Módulo P
+    "grpc.keepalive_permit_without_calls": 1,
+    // Limite de streams HTTP/2 simultâneos por conexão
+    "grpc.max_concurrent_streams": Number(
+      process.env.GRPC_MAX_CONCURRENT_STREAMS || 100
+    ),
+  });
 
   // Registra o serviço A
   const servicoAImpl = new ServicoAImpl();
   server.addService(servicoProto.ServicoA.service, {
     realizarTarefaA: servicoAImpl.realizarTarefaA.bind(servicoAImpl),
+    realizarTarefaALote: servicoAImpl.realizarTarefaALote.bind(servicoAImpl),
+  });
+
+  // Registra o serviço de chat (GetMessageHistory é servido pelo gateway)
+  const chatServiceImpl = new ChatServiceImpl(servicoAImpl);
+  server.addService(servicoProto.ChatService.service, {
+    chatStream: chatServiceImpl.chatStream.bind(chatServiceImpl),
   });
 
   // Registra o serviço de usuários
@@ -456,6 +704,7 @@ function startServer() {
     loginUser: userServiceImpl.loginUser.bind(userServiceImpl),
     getOnlineUsers: userServiceImpl.getOnlineUsers.bind(userServiceImpl),
     updateUserStatus: userServiceImpl.updateUserStatus.bind(userServiceImpl),
+    syncPresence: userServiceImpl.syncPresence.bind(userServiceImpl),
   });
 
   // Inicia limpeza automática de usuários inativos
@@ -479,9 +728,12 @@ function startServer() {
       console.log(`🔧 Porta atribuída: ${port}`);
       console.log("🔧 Serviços disponíveis:");
       console.log("   - ServicoA.RealizarTarefaA (método unary)");
+      console.log("   - ServicoA.RealizarTarefaALote (método unary, em lote)");
+      console.log("   - ChatService.ChatStream (streaming bidirecional)");
       console.log("   - UserService.LoginUser (método unary)");
       console.log("   - UserService.GetOnlineUsers (método unary)");
       console.log("   - UserService.UpdateUserStatus (método unary)");
+      console.log("   - UserService.SyncPresence (método unary, deltas em lote)");
       console.log("");
       console.log("⚡ Aguardando requisições...");
 
@@ -514,4 +766,4 @@ if (require.main === module) {
   startServer();
 }
 
-module.exports = { ServicoAImpl, startServer };
+module.exports = { ServicoAImpl, ChatServiceImpl, startServer };
@@ -288,6 +288,7 @@ class FileServiceImpl {
         file_id: metadata.file_id,
         filename: metadata.filename,
         file_size: fileData.length,
+        mime_type: mimeType,
         message: `Arquivo ${metadata.filename} enviado com sucesso`,
         timestamp: Date.now(),
         checksum: checksum,
@@ -540,6 +541,34 @@ class FileServiceImpl {
     }
   }
 
+  /**
+   * Lista os metadados dos arquivos de uma sala (sem o conteúdo)
+   * Usado pelo Módulo P para reconstruir o índice de arquivos por sala
+   */
+  listFiles(call, callback) {
+    const { room_id } = call.request;
+
+    const files = Array.from(this.files.values())
+      .filter((f) => !room_id || f.room_id === room_id)
+      .map((f) => ({
+        file_id: f.file_id,
+        filename: f.filename,
+        mime_type: f.mime_type,
+        file_size: f.file_size,
+        user_id: f.user_id,
+        username: f.username,
+        room_id: f.room_id,
+        uploaded_at: f.uploaded_at,
+      }));
+
+    console.log(
+      `📋 [FileService] Listando ${files.length} arquivo(s) da sala ${
+        room_id || "(todas)"
+      }`
+    );
+    callback(null, { files });
+  }
+
   /**
    * Distribuição de arquivo em tempo real via bidirectional-streaming
    */
@@ -773,7 +802,14 @@ class FileServiceImpl {
  * Função para iniciar o servidor gRPC
  */
 function startServer() {
-  const server = new grpc.Server();
+  const server = new grpc.Server({
+    // Aceita o keepalive dos canais persistentes do Módulo P
+    "grpc.keepalive_permit_without_calls": 1,
+    // Limite de streams HTTP/2 simultâneos por conexão
+    "grpc.max_concurrent_streams": Number(
+      process.env.GRPC_MAX_CONCURRENT_STREAMS || 100
+    ),
+  });
 
   // Registra o serviço de arquivos
   const fileServiceImpl = new FileServiceImpl();
@@ -781,6 +817,7 @@ function startServer() {
     uploadFile: fileServiceImpl.uploadFile.bind(fileServiceImpl),
     receiveFiles: fileServiceImpl.receiveFiles.bind(fileServiceImpl),
     distributeFile: fileServiceImpl.distributeFile.bind(fileServiceImpl),
+    listFiles: fileServiceImpl.listFiles.bind(fileServiceImpl),
   });
 
   // Configuração do endereço e porta
@@ -802,6 +839,7 @@ function startServer() {
       console.log("   - FileService.UploadFile (client-streaming)");
       console.log("   - FileService.ReceiveFiles (server-streaming)");
       console.log("   - FileService.DistributeFile (bidirectional-streaming)");
+      console.log("   - FileService.ListFiles (unary)");
       console.log("");
       console.log("⚡ Aguardando requisições...");
 
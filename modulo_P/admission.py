@@ -0,0 +1,206 @@
+"""
+Controle de admissão do Módulo P (load shedding adaptativo)
+Mede o atraso do event loop (uma task que dorme em intervalos fixos e compara
+o tempo real com o esperado, suavizado por EWMA) e as chamadas em andamento
+aos backends, e deriva um nível de carga:
+
+- 0 normal: tudo é admitido
+- 1 elevado: frames de baixo valor (indicadores de digitação) são descartados
+- 2 alto: novas conexões WebSocket são recusadas (código 1013 com retry_after)
+  e as leituras de /api/chat respondem 503
+- 3 crítico: só passam os endpoints críticos (/health, /metrics) e o tráfego
+  das conexões já abertas
+
+Cada decisão é contada em admission_decisions_total.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO CONTROLE DE ADMISSÃO
+# ==============================================================================
+admission_decisions_total = Counter(
+    'admission_decisions_total',
+    'Admission control decisions',
+    ['kind', 'priority', 'decision']  # kind: http, websocket, frame; decision: admitted ou shed
+)
+
+admission_load_level = Gauge(
+    'admission_load_level',
+    'Current gateway load level (0=normal, 1=elevated, 2=high, 3=critical)'
+)
+
+event_loop_lag_seconds = Gauge(
+    'event_loop_lag_seconds',
+    'Smoothed event loop scheduling lag'
+)
+
+admission_backend_inflight = Gauge(
+    'admission_backend_inflight',
+    'Backend calls in flight as seen by admission control'
+)
+# ==============================================================================
+
+LEVEL_NORMAL = 0
+LEVEL_ELEVATED = 1
+LEVEL_HIGH = 2
+LEVEL_CRITICAL = 3
+
+# Prioridades: o tráfego é descartado a partir do nível indicado
+PRIORITY_CRITICAL = "critical"  # nunca descartado
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+PRIORITY_BULK = "bulk"
+
+SHED_FROM_LEVEL = {
+    PRIORITY_BULK: LEVEL_ELEVATED,
+    PRIORITY_LOW: LEVEL_HIGH,
+    PRIORITY_NORMAL: LEVEL_CRITICAL,
+}
+
+# Endpoints que nunca são descartados
+CRITICAL_PATHS = ("/health", "/metrics")
+
+# Frames WebSocket por prioridade (os demais são sempre admitidos)
+FRAME_PRIORITIES = {
+    "TYPING_START": PRIORITY_BULK,
+    "TYPING_STOP": PRIORITY_BULK,
+    "FILE_DOWNLOAD_REQUEST": PRIORITY_NORMAL,
+}
+
+# Fração do limiar abaixo da qual o nível de carga volta a descer
+HYSTERESIS = 0.8
+
+# Código de fechamento WebSocket "Try Again Later"
+WS_TRY_AGAIN_LATER = 1013
+
+
+def _thresholds(spec: str) -> Tuple[float, float, float]:
+    elevated, high, critical = (float(value) for value in spec.split(","))
+    return elevated, high, critical
+
+
+def http_priority(method: str, path: str) -> str:
+    """Prioridade de uma requisição HTTP: leituras do chat são as primeiras a sair"""
+    if path == "/" or path.startswith(CRITICAL_PATHS):
+        return PRIORITY_CRITICAL
+    if path.startswith("/api/chat/") and method in ("GET", "HEAD"):
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+class AdmissionController:
+    """Nível de carga a partir do atraso do event loop e das chamadas em voo aos backends"""
+
+    def __init__(self, inflight: Optional[Callable[[], int]] = None, interval: float = 0.1,
+                 lag_thresholds: Tuple[float, float, float] = (0.05, 0.15, 0.4),
+                 inflight_thresholds: Tuple[float, float, float] = (200, 400, 800),
+                 retry_after: float = 2.0, smoothing: float = 0.3, enabled: bool = True):
+        self.inflight = inflight or (lambda: 0)
+        self.interval = interval
+        self.lag_thresholds = lag_thresholds
+        self.inflight_thresholds = inflight_thresholds
+        self.retry_after_base = retry_after
+        self.smoothing = smoothing
+        self.enabled = enabled
+        self.lag = 0.0
+        self.level = LEVEL_NORMAL
+        self.shed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, inflight: Optional[Callable[[], int]] = None) -> "AdmissionController":
+        lag_ms = _thresholds(os.getenv('ADMISSION_LAG_MS', '50,150,400'))
+        return cls(
+            inflight=inflight,
+            lag_thresholds=tuple(value / 1000 for value in lag_ms),
+            inflight_thresholds=_thresholds(os.getenv('ADMISSION_INFLIGHT', '200,400,800')),
+            retry_after=float(os.getenv('ADMISSION_RETRY_AFTER_S', '2')),
+            enabled=os.getenv('ADMISSION_CONTROL', 'true').lower() in ('1', 'true', 'yes')
+        )
+
+    def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def _monitor(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, time.perf_counter() - expected)
+            self.lag += self.smoothing * (sample - self.lag)
+            self._update_level()
+
+    @staticmethod
+    def _level_for(value: float, thresholds: Tuple[float, float, float]) -> int:
+        return sum(1 for threshold in thresholds if value >= threshold)
+
+    def _measure(self, inflight: int, scale: float = 1.0) -> int:
+        return max(self._level_for(self.lag, tuple(t * scale for t in self.lag_thresholds)),
+                   self._level_for(inflight, tuple(t * scale for t in self.inflight_thresholds)))
+
+    def _update_level(self):
+        inflight = self.inflight()
+        level = self._measure(inflight)
+        if level < self.level:
+            # Histerese: só desce de nível abaixo de HYSTERESIS x o limiar (evita oscilar na borda)
+            level = min(self.level, self._measure(inflight, HYSTERESIS))
+        if level != self.level:
+            log = logger.warning if level > self.level else logger.info
+            log(f"🚦 Nível de carga {self.level} -> {level} (lag {self.lag * 1000:.1f} ms, {inflight} chamadas em voo)")
+            self.level = level
+            admission_load_level.set(level)
+        event_loop_lag_seconds.set(self.lag)
+        admission_backend_inflight.set(inflight)
+
+    @property
+    def retry_after(self) -> int:
+        """Sugestão de espera (segundos) para o cliente tentar de novo, maior quanto maior a carga"""
+        return max(1, int(self.retry_after_base * max(1, self.level)))
+
+    def admit(self, kind: str, priority: str) -> bool:
+        admitted = (
+            not self.enabled
+            or priority == PRIORITY_CRITICAL
+            or self.level < SHED_FROM_LEVEL.get(priority, LEVEL_CRITICAL + 1)
+        )
+        if not admitted:
+            self.shed += 1
+        admission_decisions_total.labels(
+            kind=kind, priority=priority, decision="admitted" if admitted else "shed"
+        ).inc()
+        return admitted
+
+    def admit_http(self, method: str, path: str) -> bool:
+        return self.admit("http", http_priority(method, path))
+
+    def admit_websocket(self) -> bool:
+        # Conexões novas saem junto com as leituras do chat (as já abertas continuam)
+        return self.admit("websocket", PRIORITY_LOW)
+
+    def admit_frame(self, message_type: str) -> bool:
+        priority = FRAME_PRIORITIES.get(message_type)
+        if priority is None:
+            return True
+        return self.admit("frame", priority)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "level": self.level,
+            "event_loop_lag_ms": round(self.lag * 1000, 2),
+            "backend_inflight": self.inflight(),
+            "shed": self.shed,
+        }
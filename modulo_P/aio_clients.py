@@ -0,0 +1,191 @@
+"""
+Clientes gRPC assíncronos (grpc.aio) do Módulo P
+Cobre todos os RPCs de ServicoA, ServicoB, UserService e FileService com
+métodos awaitable e iteradores assíncronos para os RPCs de streaming, para
+que os handlers do FastAPI nunca bloqueiem o event loop esperando um backend.
+Os canais vêm do ChannelManager (pool persistente por backend) e toda chamada
+passa pela camada de resiliência (prazos, circuit breaker, hedging).
+"""
+
+import grpc
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Union
+
+import servico_pb2
+import servico_pb2_grpc
+
+from channel_pool import ChannelManager, PooledChannel
+from resilience import Resilience
+
+MODULO_A = "modulo_a"
+MODULO_B = "modulo_b"
+
+
+class AsyncBackendClient:
+    """Cliente grpc.aio para os módulos A (ServicoA/UserService) e B (ServicoB/FileService)"""
+
+    def __init__(self, channels: ChannelManager, resilience: Optional[Resilience] = None):
+        self.channels = channels
+        self.resilience = resilience if resilience is not None else Resilience()
+        self._stubs = {}
+
+    def _stub(self, stub_class, pooled: PooledChannel):
+        key = (stub_class, id(pooled.channel))
+        if key not in self._stubs:
+            self._stubs[key] = stub_class(pooled.channel)
+        return self._stubs[key]
+
+    async def _unary(self, backend: str, stub_class, method: str, request, timeout: float):
+        timeout = self.resilience.timeout_for(method, timeout)
+
+        async def attempt():
+            pooled = self.channels.acquire(backend)
+            try:
+                stub = self._stub(stub_class, pooled)
+                return await getattr(stub, method)(request, timeout=timeout)
+            finally:
+                self.channels.release(pooled)
+
+        return await self.resilience.call(backend, method, attempt)
+
+    async def _server_stream(self, backend: str, stub_class, method: str, request, timeout: float):
+        timeout = self.resilience.timeout_for(method, timeout)
+        breaker = self.resilience.breaker(backend)
+        breaker.before_call()
+        pooled = self.channels.acquire(backend)
+        call = getattr(self._stub(stub_class, pooled), method)(request, timeout=timeout)
+        try:
+            async for response in call:
+                yield response
+        except grpc.RpcError as e:
+            breaker.record(e)
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+        finally:
+            # Se o consumidor parar de iterar, cancela o stream no backend
+            call.cancel()
+            self.channels.release(pooled)
+
+    def _open_stream(self, backend: str, stub_class, method: str, timeout: Optional[float]):
+        # Streams abertos pelo chamador: só falham rápido com o circuito aberto
+        self.resilience.breaker(backend).check()
+        if timeout is not None:
+            timeout = self.resilience.timeout_for(method, timeout)
+        # O canal fica ocupado até o stream terminar
+        pooled = self.channels.acquire(backend)
+        call = getattr(self._stub(stub_class, pooled), method)(timeout=timeout)
+        call.add_done_callback(lambda _call: self.channels.release(pooled))
+        return call
+
+    # ================================
+    # MÓDULO A - ServicoA (unary)
+    # ================================
+
+    async def realizar_tarefa_a(self, request_id: str, data: str, operation: str,
+                                timeout: float = 10) -> servico_pb2.ResponseA:
+        request = servico_pb2.RequestA(id=request_id, data=data, operation=operation)
+        return await self._unary(MODULO_A, servico_pb2_grpc.ServicoAStub, "RealizarTarefaA", request, timeout)
+
+    async def realizar_tarefa_a_lote(self, requests: Iterable[servico_pb2.RequestA],
+                                     timeout: float = 10) -> servico_pb2.ResponseALote:
+        request = servico_pb2.RequestALote(requests=requests)
+        return await self._unary(MODULO_A, servico_pb2_grpc.ServicoAStub, "RealizarTarefaALote", request, timeout)
+
+    # ================================
+    # MÓDULO A - ChatService (bidi streaming)
+    # ================================
+
+    def open_chat_stream(self, timeout: Optional[float] = None) -> grpc.aio.StreamStreamCall:
+        """
+        Abre um ChatStream de longa duração: o chamador escreve ChatMessage com
+        `await call.write(message)` e lê as mensagens processadas com `await call.read()`
+        """
+        return self._open_stream(MODULO_A, servico_pb2_grpc.ChatServiceStub, "ChatStream", timeout)
+
+    # ================================
+    # MÓDULO B - ServicoB (server-streaming)
+    # ================================
+
+    def realizar_tarefa_b(self, request_id: str, data: str, count: int,
+                          timeout: float = 30) -> AsyncIterator[servico_pb2.ResponseB]:
+        request = servico_pb2.RequestB(id=request_id, data=data, count=count)
+        return self._server_stream(MODULO_B, servico_pb2_grpc.ServicoBStub, "RealizarTarefaB", request, timeout)
+
+    # ================================
+    # MÓDULO A - UserService (unary)
+    # ================================
+
+    async def login_user(self, username: str, room_id: str,
+                         timeout: float = 10) -> servico_pb2.LoginResponse:
+        request = servico_pb2.LoginRequest(username=username, room_id=room_id)
+        return await self._unary(MODULO_A, servico_pb2_grpc.UserServiceStub, "LoginUser", request, timeout)
+
+    async def get_online_users(self, room_id: str,
+                               timeout: float = 10) -> servico_pb2.OnlineUsersResponse:
+        request = servico_pb2.OnlineUsersRequest(room_id=room_id)
+        return await self._unary(MODULO_A, servico_pb2_grpc.UserServiceStub, "GetOnlineUsers", request, timeout)
+
+    async def update_user_status(self, user_id: str, status: int,
+                                 timeout: float = 10) -> servico_pb2.UserStatusResponse:
+        request = servico_pb2.UserStatusRequest(user_id=user_id, status=status)
+        return await self._unary(MODULO_A, servico_pb2_grpc.UserServiceStub, "UpdateUserStatus", request, timeout)
+
+    async def sync_presence(self, changes: Iterable[servico_pb2.PresenceChange], since_version: int,
+                            timeout: float = 10) -> servico_pb2.PresenceSyncResponse:
+        """Envia as mudanças de presença em lote e recebe as do Módulo A desde since_version"""
+        request = servico_pb2.PresenceSyncRequest(changes=changes, since_version=since_version)
+        return await self._unary(MODULO_A, servico_pb2_grpc.UserServiceStub, "SyncPresence", request, timeout)
+
+    # ================================
+    # MÓDULO B - FileService
+    # ================================
+
+    async def upload_file(self, chunks: Union[AsyncIterable[servico_pb2.FileChunk], Iterable[servico_pb2.FileChunk]],
+                          timeout: float = 120, wait_for_ready: bool = False) -> servico_pb2.FileUploadResponse:
+        """
+        Upload via client-streaming a partir de um iterável (síncrono ou assíncrono) de FileChunk
+        Com wait_for_ready=True a chamada aguarda o Módulo B voltar (até o timeout) em vez de falhar na hora
+        """
+        timeout = self.resilience.timeout_for("UploadFile", timeout)
+
+        async def attempt():
+            pooled = self.channels.acquire(MODULO_B)
+            try:
+                stub = self._stub(servico_pb2_grpc.FileServiceStub, pooled)
+                return await stub.UploadFile(chunks, timeout=timeout, wait_for_ready=wait_for_ready)
+            finally:
+                self.channels.release(pooled)
+
+        return await self.resilience.breaker(MODULO_B).call(attempt)
+
+    def open_upload(self, timeout: float = 120) -> grpc.aio.StreamUnaryCall:
+        """
+        Abre um UploadFile no qual o chamador escreve os chunks com `await call.write(chunk)`,
+        encerra com `await call.done_writing()` e obtém a resposta com `await call`
+        """
+        return self._open_stream(MODULO_B, servico_pb2_grpc.FileServiceStub, "UploadFile", timeout)
+
+    def module_b_available(self) -> bool:
+        """Indica se o Módulo B parece alcançável (sem forçar nova conexão nem com o circuito aberto)"""
+        return not self.resilience.breaker(MODULO_B).is_open() and self.channels.available(MODULO_B)
+
+    def receive_files(self, room_id: str, file_id: str = "",
+                      timeout: float = 120) -> AsyncIterator[servico_pb2.FileChunk]:
+        request = servico_pb2.FileRequest(room_id=room_id, file_id=file_id)
+        return self._server_stream(MODULO_B, servico_pb2_grpc.FileServiceStub, "ReceiveFiles", request, timeout)
+
+    async def list_files(self, room_id: str = "", timeout: float = 30) -> servico_pb2.FileListResponse:
+        """Metadados dos arquivos de uma sala (todas as salas com room_id vazio)"""
+        request = servico_pb2.FileRequest(room_id=room_id)
+        return await self._unary(MODULO_B, servico_pb2_grpc.FileServiceStub, "ListFiles", request, timeout)
+
+    def distribute_file(self, timeout: Optional[float] = None) -> grpc.aio.StreamStreamCall:
+        """Abre o stream bidirecional DistributeFile (write()/read() ou `async for`)"""
+        return self._open_stream(MODULO_B, servico_pb2_grpc.FileServiceStub, "DistributeFile", timeout)
+
+    async def close(self):
+        await self.channels.close()
+        self._stubs.clear()
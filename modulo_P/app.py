@@ -8,13 +8,13 @@ Agora inclui suporte para chat em tempo real via WebSocket.
 import grpc
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from starlette.requests import ClientDisconnect
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Set, AsyncIterator
 import sys
 import os
-import requests
 import json
 import uuid
 import base64
@@ -24,7 +24,8 @@ import time
 # [IMPORTANTE] Importando metrics para instrumentação avançada
 from prometheus_fastapi_instrumentator import Instrumentator, metrics
 from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from urllib.parse import quote
 
 # Adiciona o diretório dos protobuf ao path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'protos'))
@@ -37,8 +38,55 @@ except ImportError:
     print("Erro: Execute 'python generate_protos.py' para gerar os stubs gRPC")
     sys.exit(1)
 
+from aio_clients import AsyncBackendClient
+from channel_pool import ChannelManager
+from message_pipeline import MessagePipeline, STATE_PENDING
+from module_a_batcher import ModuleABatcher
+from module_a_stream import ChatStreamClient, StreamUnavailable
+from broadcaster import Broadcaster
+from upload_stream import StreamingUpload, UploadStreamError, UploadOffsetError, GRPC_CHUNK_SIZE
+from upload_staging import StagingStore, StagingError
+from file_cache import FileCache
+from file_index import FileIndex
+from history_store import HistoryStore
+from history_grpc import MAX_HISTORY_LIMIT, start_grpc_server
+from backplane import Backplane, LocalBackplane, backplane_from_env
+from transports import Transport, transport_from_env
+from resilience import DEADLINE_HEADER, Resilience, deadline_scope, detached_scope
+from admission import WS_TRY_AGAIN_LATER, AdmissionController
+from presence import PresenceService
+from http_download import RangeNotSatisfiable, etag_matches, iter_range, make_etag, parse_range, slice_pieces
+import json_codec
+from file_frames import (
+    BinaryFrame, PROTOCOL_BINARY, PROTOCOL_JSON, DISTRIBUTION_CHUNK_SIZE,
+    chunk_count, decode_chunk_frame, encode_chunk_frame
+)
+
 app = FastAPI(title="Módulo P - Chat Gateway", version="2.0.0")
 
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """Propaga o orçamento de tempo da requisição (X-Request-Timeout-Ms) às chamadas aos backends"""
+    try:
+        budget_ms = float(request.headers.get(DEADLINE_HEADER, REQUEST_DEADLINE_MS))
+    except ValueError:
+        budget_ms = REQUEST_DEADLINE_MS
+    with deadline_scope(budget_ms / 1000 if budget_ms > 0 else None):
+        return await call_next(request)
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Load shedding por prioridade: 503 com Retry-After quando o gateway está sobrecarregado"""
+    if not admission.admit_http(request.method, request.url.path):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Gateway sobrecarregado, tente novamente", "load_level": admission.level},
+            headers={"Retry-After": str(admission.retry_after)}
+        )
+    return await call_next(request)
+
 # ==============================================================================
 # MÉTRICAS CUSTOMIZADAS PARA WEBSOCKET
 # ==============================================================================
@@ -46,7 +94,7 @@ app = FastAPI(title="Módulo P - Chat Gateway", version="2.0.0")
 websocket_connections_total = Counter(
     'websocket_connections_total',
     'Total WebSocket connection attempts',
-    ['status']  # success ou failed
+    ['status']  # success, failed ou shed (controle de admissão)
 )
 
 # Conexões por sala (opcional, para debug)
@@ -144,11 +192,20 @@ async def metrics_debug():
             room_id: len(conns)
             for room_id, conns in manager.active_connections.items()
         },
-        "message_history_rooms": list(manager.message_history.keys()),
-        "online_users_count": sum([
-            len(users)
-            for users in manager.online_users.values()
-        ])
+        "message_history_rooms": manager.message_history.rooms(),
+        "message_history": manager.message_history.stats(),
+        "grpc_channel_pools": backend_client.channels.stats(),
+        "backend_resilience": backend_client.resilience.stats(),
+        "admission": admission.stats(),
+        "executar_transport": service_client.transport.stats(),
+        "websocket_send_queue_depths": manager.broadcaster.queue_depths(),
+        "backplane": manager.backplane.stats(),
+        "upload_staging": chat_client.staging.stats(),
+        "file_cache": chat_client.file_cache.stats(),
+        "module_a_chat_stream": chat_client.module_a_stream.stats(),
+        "module_a_batching": chat_client.module_a_batcher.stats(),
+        "presence": manager.presence.stats(),
+        "online_users_count": len(manager.presence.store)
     }
 # ==============================================================================
 
@@ -170,6 +227,20 @@ class ExecutarResponse(BaseModel):
     status: str
     message: str
 
+class ExecutarLoteResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[ExecutarResponse]
+
+# Orquestração em lote de /api/executar: execuções simultâneas por lote e itens por lote
+EXECUTAR_BULK_CONCURRENCY = int(os.getenv('EXECUTAR_BULK_CONCURRENCY', '32'))
+EXECUTAR_BULK_MAX_ITEMS = int(os.getenv('EXECUTAR_BULK_MAX_ITEMS', '1000'))
+
+# Formatos do endpoint /api/executar/stream
+STREAM_NDJSON = "ndjson"
+STREAM_SSE = "sse"
+
 # Modelos para Chat
 class ChatLoginRequest(BaseModel):
     username: str
@@ -181,17 +252,49 @@ class ChatMessageRequest(BaseModel):
     room_id: str = "global"
     message_type: str = "MESSAGE"
 
+# Modos de replay do histórico ao entrar na sala:
+# - eager: arquivos vão inline no histórico (base64 ou frames binários)
+# - lazy: apenas metadados + download_url; o conteúdo é pedido sob demanda
+HISTORY_EAGER = "eager"
+HISTORY_LAZY = "lazy"
+DEFAULT_HISTORY_MODE = os.getenv('WS_HISTORY_MODE', HISTORY_EAGER)
+
+# Cache HTTP dos downloads (o conteúdo de um file_id não muda)
+FILE_DOWNLOAD_CACHE_CONTROL = os.getenv('FILE_DOWNLOAD_CACHE_CONTROL', 'public, max-age=86400')
+
+# Prazo padrão das requisições HTTP sem X-Request-Timeout-Ms (0 = sem prazo)
+REQUEST_DEADLINE_MS = float(os.getenv('REQUEST_DEADLINE_MS', '0'))
+
+# Prazo total do processamento de uma mensagem de chat no Module A (stream + lote)
+CHAT_MESSAGE_DEADLINE_MS = float(os.getenv('CHAT_MESSAGE_DEADLINE_MS', '2500'))
+
+# Inatividade máxima de um upload HTTP retomável (também o prazo do UploadFile aberto no Module B)
+UPLOAD_SESSION_TTL_SECONDS = float(os.getenv('UPLOAD_SESSION_TTL_SECONDS', '600'))
+
+def file_download_url(file_id: str, room_id: str) -> str:
+    return f"/api/files/download/{file_id}?room_id={room_id}"
+
 # Gerenciador de conexões WebSocket
 class ConnectionManager:
     def __init__(self):
         # {room_id: {user_id: {"websocket": ws, "username": str}}}
         self.active_connections: Dict[str, Dict[str, Dict]] = {}
-        # Armazenamento em memória das mensagens {room_id: [messages]}
-        self.message_history: Dict[str, List[Dict]] = {}
-        # Usuários online {room_id: {user_id: user_info}}
-        self.online_users: Dict[str, Dict[str, Dict]] = {}
+        # Armazenamento em memória das mensagens (ring buffer por sala)
+        self.message_history = HistoryStore.from_env()
+        # Presença (usuários online por sala): snapshot para quem entra, deltas para os demais
+        self.presence = PresenceService.from_env(deliver=self._deliver)
+        # Pipeline de processamento (Módulo A exatamente uma vez por mensagem)
+        self.pipeline: MessagePipeline = None
+        # Filas de saída por conexão + tarefas escritoras (fan-out sem aguardar a rede)
+        self.broadcaster = Broadcaster.from_env(on_dead=self.disconnect)
+        # Eventos de sala passam pelo backplane (entre workers, com GATEWAY_BACKPLANE=unix)
+        self.backplane: Backplane = LocalBackplane()
+        # Cliente de chat (cache e índice de arquivos), usado ao aplicar eventos de arquivo
+        self.chat_client = None
+        self._tasks: Set[asyncio.Task] = set()
     
-    async def connect(self, websocket: WebSocket, user_id: str, username: str, room_id: str = "global"):
+    async def connect(self, websocket: WebSocket, user_id: str, username: str, room_id: str = "global",
+                      file_protocol: str = PROTOCOL_JSON):
         await websocket.accept()
         
         # Incrementar métrica de conexões bem-sucedidas
@@ -199,46 +302,46 @@ class ConnectionManager:
         
         if room_id not in self.active_connections:
             self.active_connections[room_id] = {}
-            self.message_history[room_id] = []
-            self.online_users[room_id] = {}
+            self.message_history.ensure_room(room_id)
+        if not self.active_connections[room_id]:
+            # Primeiro membro local: passa a receber os eventos da sala
+            await self.backplane.subscribe(room_id)
         
         self.active_connections[room_id][user_id] = {
             "websocket": websocket,
-            "username": username
-        }
-        
-        self.online_users[room_id][user_id] = {
             "username": username,
-            "status": "ONLINE",
-            "joined_at": datetime.now().timestamp()
+            "file_protocol": file_protocol,
+            "sender": self.broadcaster.register(room_id, user_id, websocket)
         }
         
+        # A entrada vira um PRESENCE_DELTA para os demais membros da sala (em lote, ver presence.py)
+        entry = self.presence.join(room_id, user_id, username)
+        await self.backplane.publish({
+            "kind": "presence", "room_id": room_id, "user_id": user_id,
+            "user": entry.to_dict()
+        })
+        
         # Atualizar gauge de conexões ativas
         websocket_active_connections.labels(room_id=room_id).set(len(self.active_connections.get(room_id, [])))
         
         logger.info(f"User {username} ({user_id}) connected to room {room_id}")
         
-        logger.info(f"User {username} ({user_id}) connected to room {room_id}")
-        
-        # Notificar outros usuários sobre a entrada
-        await self.broadcast_to_room(room_id, {
-            "type": "USER_JOIN",
-            "username": username,
-            "user_id": user_id,
-            "timestamp": datetime.now().timestamp(),
-            "message": f"{username} entrou no chat"
-        }, exclude_user=user_id)
-        
-        # Enviar lista de usuários online para o novo usuário
+        # Enviar lista de usuários online para o novo usuário (os deltas seguintes vêm por PRESENCE_DELTA)
         await self.send_online_users(websocket, room_id)
     
     def disconnect(self, user_id: str, room_id: str = "global"):
         if room_id in self.active_connections and user_id in self.active_connections[room_id]:
             username = self.active_connections[room_id][user_id]["username"]
             del self.active_connections[room_id][user_id]
+            self.broadcaster.unregister(room_id, user_id)
             
-            if user_id in self.online_users.get(room_id, {}):
-                del self.online_users[room_id][user_id]
+            self.presence.leave(room_id, user_id, username)
+            self._spawn(self.backplane.publish({
+                "kind": "presence", "room_id": room_id, "user_id": user_id, "user": None
+            }))
+            if not self.active_connections[room_id]:
+                # Último membro local saiu: este processo não precisa mais dos eventos da sala
+                self._spawn(self._unsubscribe_if_empty(room_id))
             
             # Atualizar gauge de conexões ativas por sala
             if room_id in self.active_connections:
@@ -248,93 +351,344 @@ class ConnectionManager:
             return username
         return None
     
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
+    async def _unsubscribe_if_empty(self, room_id: str):
+        # Alguém pode ter entrado na sala antes desta tarefa rodar: nesse caso a assinatura continua
+        if not self.active_connections.get(room_id):
+            await self.backplane.unsubscribe(room_id)
+    
+    async def send_personal_message(self, message, websocket: WebSocket):
         try:
-            await websocket.send_text(json.dumps(message))
+            sender = self.broadcaster.sender_for(websocket)
+            if sender is not None:
+                # Mesmo lock da tarefa escritora: não intercala com os broadcasts
+                await sender.send_direct(message)
+            elif isinstance(message, BinaryFrame):
+                await websocket.send_bytes(message.data)
+            else:
+                await websocket.send_text(json_codec.dumps(message))
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
     
     async def broadcast_to_room(self, room_id: str, message: dict, exclude_user: str = None):
-        """Envia mensagem para todos os usuários da sala com instrumentação de métricas"""
+        """Publica a mensagem para todos os usuários da sala (em todos os workers)"""
+        # Mensagens do tipo MESSAGE já chegam processadas pelo pipeline (no-op nesse caso);
+        # o broadcast nunca chama o Módulo A novamente
+        if self.pipeline is not None:
+            message = await self.pipeline.process(message)
+        await self.backplane.publish({
+            "kind": "broadcast", "room_id": room_id, "message": message, "exclude_user": exclude_user
+        })
+
+    async def publish_message(self, room_id: str, message: dict, exclude_user: str = None):
+        """Armazena a mensagem no histórico e faz o broadcast para a sala (em todos os workers)"""
+        if self.pipeline is not None:
+            message = await self.pipeline.process(message)
+        room = self.message_history.room(room_id)
+        await self.backplane.publish({
+            "kind": "message", "room_id": room_id, "message": message, "exclude_user": exclude_user,
+            # Piso do seq reservado pelo hub unix (histórico restaurado do log após um reinício)
+            "next_seq": room.next_seq if room is not None else 1
+        })
+
+    async def apply_event(self, event: dict):
+        """Aplica um evento do backplane às conexões e ao histórico deste processo"""
+        kind = event["kind"]
+        room_id = event["room_id"]
+        if kind == "message":
+            self.store_message(room_id, event["message"], event.get("seq"))
+            self._deliver(room_id, event["message"], event.get("exclude_user"))
+        elif kind == "broadcast":
+            self._deliver(room_id, event["message"], event.get("exclude_user"))
+        elif kind == "presence":
+            self._apply_presence(room_id, event["user_id"], event.get("user"))
+        elif kind == "file":
+            # A distribuição do conteúdo não segura o processamento dos próximos eventos
+            self._spawn(self._distribute_shared_file(room_id, event["file_info"], event.get("exclude_user")))
+
+    def _apply_presence(self, room_id: str, user_id: str, user_info: dict = None):
+        """Usuários online vistos por este processo (inclusive os conectados a outros)"""
+        # O eco dos nossos próprios eventos não altera as entradas das conexões locais
+        self.presence.apply_peer(room_id, user_id, user_info)
+
+    def _spawn(self, coroutine):
+        """Tarefa em segundo plano mantida até terminar"""
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _deliver(self, room_id: str, message: dict, exclude_user: str = None):
+        """Envia mensagem para os usuários da sala conectados a este processo, com métricas"""
         if room_id not in self.active_connections:
             return
         
         broadcast_start = time.time()
-        
-        # Só processa mensagens do tipo MESSAGE
-        processed_message = message.copy()
-        if message.get("type") == "MESSAGE":
-            from app import service_client, ExecutarRequest
-            try:
-                req = ExecutarRequest(
-                    id=message.get("id", ""),
-                    data=message.get("content", ""),
-                    operation="process_message"
-                )
-                result = service_client.chamar_servico_a(req)
-                processed_message["content"] = result.get("result", message.get("content", ""))
-                processed_message["processed_by_module_a"] = True
-            except Exception as e:
-                logger.error(f"Erro ao processar mensagem no Módulo A: {e}")
-                processed_message["processed_by_module_a"] = False
-
-        disconnected_users = []
-        for user_id, connection_info in self.active_connections[room_id].items():
-            if exclude_user and user_id == exclude_user:
-                continue
-            try:
-                await connection_info["websocket"].send_text(json.dumps(processed_message))
-            except Exception as e:
-                logger.error(f"Error broadcasting to user {user_id}: {e}")
-                disconnected_users.append(user_id)
 
-        # Remove conexões mortas
-        for user_id in disconnected_users:
-            self.disconnect(user_id, room_id)
+        # Apenas enfileira para cada destinatário; as tarefas escritoras fazem o envio.
+        # Conexões mortas/lentas são removidas pelo próprio broadcaster (on_dead)
+        recipients = [
+            user_id for user_id in self.active_connections.get(room_id, {})
+            if not (exclude_user and user_id == exclude_user)
+        ]
+        if recipients:
+            # Serializa uma única vez; o mesmo frame imutável vai para todos os destinatários
+            self.broadcaster.broadcast(room_id, recipients, json_codec.encode_frame(message))
         
         # Registrar métrica de latência
         broadcast_duration = time.time() - broadcast_start
         websocket_operation_duration.labels(operation='broadcast').observe(broadcast_duration)
     
     async def send_online_users(self, websocket: WebSocket, room_id: str):
-        if room_id in self.online_users:
-            users_list = [
-                {
-                    "user_id": user_id,
-                    "username": user_info["username"],
-                    "status": user_info["status"]
-                }
-                for user_id, user_info in self.online_users[room_id].items()
-            ]
-            
-            await self.send_personal_message({
-                "type": "ONLINE_USERS",
-                "users": users_list,
-                "total_count": len(users_list)
-            }, websocket)
+        await self.send_personal_message(self.presence.snapshot(room_id), websocket)
     
-    async def send_message_history(self, websocket: WebSocket, room_id: str, chat_client, limit: int = 50):
+    def _file_start_frame(self, file_info: dict, file_size: int, total_chunks: int):
+        return json_codec.encode_frame({
+            "type": "FILE_START",
+            "file_id": file_info.get("file_id"),
+            "filename": file_info.get("filename"),
+            "mime_type": file_info.get("mime_type"),
+            "file_size": file_size,
+            "total_chunks": total_chunks,
+            "room_id": file_info.get("room_id")
+        })
+
+    def _file_piece_frame(self, file_info: dict, file_size: int, chunk_idx: int, total_chunks: int,
+                          piece, file_protocol: str, piece_b64: str = None):
+        if file_protocol == PROTOCOL_BINARY:
+            return BinaryFrame(encode_chunk_frame(file_info.get("file_id"), chunk_idx, total_chunks, piece))
+        if piece_b64 is None:
+            piece_b64 = base64.b64encode(piece).decode("ascii")
+        return json_codec.encode_frame({
+            "type": "FILE_CHUNK",
+            "file_id": file_info.get("file_id"),
+            "filename": file_info.get("filename"),
+            "mime_type": file_info.get("mime_type"),
+            "file_size": file_size,
+            "chunk_index": chunk_idx,
+            "total_chunks": total_chunks,
+            "chunk_data": piece_b64,
+            "room_id": file_info.get("room_id")
+        })
+
+    def file_chunk_frames(self, file_info: dict, file_data: bytes, file_protocol: str, file_data_b64: str = None):
+        """
+        Gera os frames de distribuição de um arquivo no protocolo da conexão:
+        binário (FILE_START + chunks crus) ou JSON legado (FILE_CHUNK com base64).
+        Com file_data_b64 (base64 já pronto, ex.: do cache) os chunks JSON são fatias dele
+        """
+        view = memoryview(file_data)
+        total_chunks = chunk_count(len(file_data))
+        # DISTRIBUTION_CHUNK_SIZE é múltiplo de 3: cada 3 bytes viram 4 caracteres
+        b64_chunk_size = DISTRIBUTION_CHUNK_SIZE // 3 * 4
+        if file_protocol == PROTOCOL_BINARY:
+            yield self._file_start_frame(file_info, len(file_data), total_chunks)
+        for chunk_idx in range(total_chunks):
+            piece = view[chunk_idx * DISTRIBUTION_CHUNK_SIZE:(chunk_idx + 1) * DISTRIBUTION_CHUNK_SIZE]
+            piece_b64 = None
+            if file_data_b64 is not None:
+                piece_b64 = file_data_b64[chunk_idx * b64_chunk_size:(chunk_idx + 1) * b64_chunk_size]
+            yield self._file_piece_frame(file_info, len(file_data), chunk_idx, total_chunks, piece,
+                                         file_protocol, piece_b64)
+
+    def _file_recipients(self, room_id: str, exclude_user: str = None) -> Dict[str, List[str]]:
+        """Agrupa os destinatários da sala pelo protocolo de arquivo negociado"""
+        recipients_by_protocol: Dict[str, List[str]] = {}
+        for user_id, connection_info in self.active_connections.get(room_id, {}).items():
+            if exclude_user and user_id == exclude_user:
+                continue
+            protocol = connection_info.get("file_protocol", PROTOCOL_JSON)
+            recipients_by_protocol.setdefault(protocol, []).append(user_id)
+        return recipients_by_protocol
+
+    def distribute_file(self, room_id: str, file_info: dict, file_data: bytes, exclude_user: str = None,
+                        file_data_b64: str = None):
+        """
+        Distribui o conteúdo de um arquivo para a sala. Cada chunk é codificado uma vez
+        por protocolo (binário ou JSON) e o mesmo frame é enfileirado para todos
+        """
+        for protocol, recipients in self._file_recipients(room_id, exclude_user).items():
+            frames = self.file_chunk_frames(file_info, file_data, protocol, file_data_b64)
+            for frame in frames:
+                self.broadcaster.broadcast(room_id, recipients, frame)
+            logger.info(f"📤 Arquivo {file_info.get('file_id')} distribuído para {len(recipients)} usuário(s) ({protocol})")
+
+    async def _file_stream_frames(self, file_info: dict, pieces: AsyncIterator[bytes], protocols: List[str]):
+        """
+        Reagrupa pedaços lidos em streaming (ex.: ReceiveFiles do Module B) em chunks de
+        distribuição e gera (protocolo, frame), sem montar o arquivo inteiro na memória
+        """
+        file_size = int(file_info.get("file_size") or 0)
+        total_chunks = chunk_count(file_size)
+        if PROTOCOL_BINARY in protocols:
+            yield PROTOCOL_BINARY, self._file_start_frame(file_info, file_size, total_chunks)
+
+        carry = bytearray()
+        chunk_idx = 0
+        async for data in pieces:
+            carry += data
+            while len(carry) >= DISTRIBUTION_CHUNK_SIZE:
+                piece = bytes(carry[:DISTRIBUTION_CHUNK_SIZE])
+                del carry[:DISTRIBUTION_CHUNK_SIZE]
+                for protocol in protocols:
+                    yield protocol, self._file_piece_frame(file_info, file_size, chunk_idx, total_chunks, piece, protocol)
+                chunk_idx += 1
+        if carry or chunk_idx == 0:
+            for protocol in protocols:
+                yield protocol, self._file_piece_frame(file_info, file_size, chunk_idx, total_chunks, bytes(carry), protocol)
+
+    async def distribute_file_stream(self, room_id: str, file_info: dict, pieces: AsyncIterator[bytes],
+                                     exclude_user: str = None):
+        """Distribui para a sala um arquivo lido em streaming (frames codificados uma vez por protocolo)"""
+        recipients_by_protocol = self._file_recipients(room_id, exclude_user)
+        if not recipients_by_protocol:
+            return
+        async for protocol, frame in self._file_stream_frames(file_info, pieces, list(recipients_by_protocol)):
+            self.broadcaster.broadcast(room_id, recipients_by_protocol[protocol], frame)
+
+        for protocol, recipients in recipients_by_protocol.items():
+            logger.info(f"📤 Arquivo {file_info.get('file_id')} distribuído para {len(recipients)} usuário(s) ({protocol})")
+
+    async def send_file(self, websocket: WebSocket, file_info: dict, chat_client,
+                        file_protocol: str = PROTOCOL_JSON) -> bool:
+        """
+        Envia o conteúdo de um arquivo a uma única conexão (download sob demanda),
+        do cache do gateway ou em streaming do Module B
+        """
+        file_id = file_info["file_id"]
+        if file_info.get("file_size") == 0:
+            # Arquivo vazio: o ReceiveFiles não devolve nenhum chunk; FILE_START/FILE_CHUNK vazios
+            for frame in self.file_chunk_frames(file_info, b"", file_protocol):
+                await self.send_personal_message(frame, websocket)
+            return True
+
+        cached = await chat_client.file_cache.get(file_id)
+        if cached is not None:
+            file_data_b64 = await chat_client.file_cache.base64(cached) if file_protocol == PROTOCOL_JSON else None
+            for frame in self.file_chunk_frames(file_info, cached.data, file_protocol, file_data_b64):
+                await self.send_personal_message(frame, websocket)
+            return True
+
+        opened = await chat_client.open_module_b_download(file_id, file_info.get("room_id"))
+        if opened is None:
+            return False
+        _, pieces = opened
+        async for _, frame in self._file_stream_frames(file_info, pieces, [file_protocol]):
+            await self.send_personal_message(frame, websocket)
+        return True
+
+    async def share_file(self, room_id: str, upload_result: dict, user_id: str, username: str) -> dict:
+        """
+        Publica um upload concluído no Module B: armazena e faz broadcast do FILE_SHARE e
+        distribui o conteúdo para a sala (exceto o uploader, que já tem o arquivo)
+        """
+        file_id = upload_result.get("file_id")
+        
+        # Criar mensagem de compartilhamento de arquivo
+        file_message = {
+            "message_id": str(uuid.uuid4()),
+            "file_id": file_id,
+            "filename": upload_result.get("filename"),
+            "file_size": upload_result.get("file_size"),
+            "mime_type": upload_result.get("mime_type"),
+            "user_id": user_id,
+            "username": username,
+            "timestamp": datetime.now().timestamp(),
+            "type": "FILE_SHARE",
+            "room_id": room_id,
+            "processed_by": "module_b"
+        }
+        
+        # Armazenar e fazer broadcast para outros usuários na sala (excluindo o uploader),
+        # depois distribuir o conteúdo em todos os workers
+        await self.publish_message(room_id, file_message, exclude_user=user_id)
+        await self.backplane.publish({
+            "kind": "file", "room_id": room_id, "file_info": upload_result, "exclude_user": user_id
+        })
+        return file_message
+
+    async def _distribute_shared_file(self, room_id: str, file_info: dict, exclude_user: str = None):
+        """
+        Envia os dados do arquivo em chunks para os usuários da sala deste processo (exceto o
+        uploader, que já tem), em frames binários ou JSON/base64 conforme o protocolo de cada conexão
+        """
+        if not self._file_recipients(room_id, exclude_user):
+            return
+        chat_client = self.chat_client
+        file_id = file_info.get("file_id")
+        try:
+            cached = await chat_client.file_cache.get(file_id)
+            if cached is not None:
+                # Upload em staging já deixou o arquivo no cache
+                self.distribute_file(
+                    room_id, file_info, cached.data, exclude_user=exclude_user,
+                    file_data_b64=await chat_client.file_cache.base64(cached)
+                )
+            else:
+                # Upload em streaming (ou outro worker): o gateway não tem os bytes, relê do Module B
+                # (e guarda no cache para o replay do histórico)
+                await self.distribute_file_stream(
+                    room_id, file_info,
+                    chat_client.stream_file_from_module_b(file_id, room_id),
+                    exclude_user=exclude_user
+                )
+        except grpc.RpcError as e:
+            logger.error(f"❌ Erro ao distribuir arquivo {file_id} do Module B: {e.details()}")
+            return
+        
+        logger.info(f"📤 Arquivo distribuído para sala {room_id}")
+
+    def find_file_message(self, room_id: str, file_id: str):
+        """
+        FILE_SHARE de um arquivo compartilhado na sala (metadados para downloads)
+        Se a mensagem já saiu da janela do histórico, usa a entrada do índice de arquivos
+        """
+        record = self.message_history.find(room_id, "FILE_SHARE", "file_id", file_id)
+        if record is not None:
+            return record.to_dict()
+        entry = self.chat_client.file_index.get(file_id) if self.chat_client is not None else None
+        return entry.to_dict() if entry is not None and entry.room_id == room_id else None
+
+    async def send_message_history(self, websocket: WebSocket, room_id: str, chat_client, limit: int = 50,
+                                   file_protocol: str = PROTOCOL_JSON, history_mode: str = HISTORY_EAGER):
         """
         Envia histórico de mensagens para o novo usuário.
-        Para mensagens do tipo FILE_SHARE, recupera o conteúdo do arquivo do Module B.
+        Para mensagens do tipo FILE_SHARE, no modo eager envia o conteúdo do arquivo (do cache do
+        gateway ou do Module B), inline em base64 no protocolo JSON ou em frames binários no protocolo
+        binário. No modo lazy envia só os metadados e o download_url, sem contatar o Module B.
         """
         if room_id in self.message_history:
-            recent_messages = self.message_history[room_id][-limit:]
-            for message in recent_messages:
-                # Se for um arquivo compartilhado, recuperar do Module B
-                if message.get("type") == "FILE_SHARE" and "file_id" in message:
+            for record in self.message_history.recent(room_id, limit):
+                message = record.to_dict()
+                if message.get("type") == "FILE_SHARE" and "file_id" in message and history_mode == HISTORY_LAZY:
+                    # Conteúdo sob demanda (FILE_DOWNLOAD_REQUEST ou GET download_url)
+                    message_meta = message.copy()
+                    message_meta["file_retrieved"] = False
+                    message_meta["download_url"] = file_download_url(message["file_id"], room_id)
+                    await self.send_personal_message(message_meta, websocket)
+                
+                # Se for um arquivo compartilhado, enviar também o conteúdo
+                elif message.get("type") == "FILE_SHARE" and "file_id" in message:
                     file_id = message["file_id"]
                     logger.info(f"📥 Recuperando arquivo {file_id} para novo usuário...")
                     
-                    # Chamar Module B para obter o arquivo
-                    file_result = chat_client.retrieve_file_from_module_b(file_id, room_id)
+                    # Cache do gateway primeiro; Module B apenas em caso de falta
+                    file_result = await chat_client.get_file(file_id, room_id)
                     
                     if file_result.get("success"):
-                        # Adicionar dados do arquivo à mensagem
                         message_with_file = message.copy()
-                        message_with_file["file_data_b64"] = file_result.get("file_data_b64")
                         message_with_file["file_retrieved"] = True
-                        await self.send_personal_message(message_with_file, websocket)
+                        cached = file_result.get("cached")
+                        if file_protocol == PROTOCOL_BINARY:
+                            # Metadados em JSON seguidos dos bytes crus em frames binários
+                            await self.send_personal_message(message_with_file, websocket)
+                            for frame in self.file_chunk_frames(message, file_result["file_data"], file_protocol):
+                                await self.send_personal_message(frame, websocket)
+                        else:
+                            # Adicionar dados do arquivo à mensagem (base64 reaproveitado do cache)
+                            if cached is not None:
+                                message_with_file["file_data_b64"] = await chat_client.file_cache.base64(cached)
+                            else:
+                                message_with_file["file_data_b64"] = base64.b64encode(file_result["file_data"]).decode("ascii")
+                            await self.send_personal_message(message_with_file, websocket)
                         logger.info(f"✅ Arquivo {file_id} enviado para novo usuário")
                     else:
                         # Se falhar, enviar apenas a mensagem sem os dados
@@ -344,160 +698,126 @@ class ConnectionManager:
                         message_with_error["file_retrieved"] = False
                         await self.send_personal_message(message_with_error, websocket)
                 else:
-                    # Mensagens normais
+                    # Mensagens normais (reutilizam o resultado já processado pelo Módulo A)
+                    if self.pipeline is not None:
+                        message = await self.pipeline.process(message)
                     await self.send_personal_message(message, websocket)
     
-    def store_message(self, room_id: str, message: dict):
-        if room_id not in self.message_history:
-            self.message_history[room_id] = []
-        
-        self.message_history[room_id].append(message)
-        
-        # Manter apenas as últimas 1000 mensagens em memória
-        if len(self.message_history[room_id]) > 1000:
-            self.message_history[room_id] = self.message_history[room_id][-1000:]
+    def store_message(self, room_id: str, message: dict, seq: int = None):
+        # O(1): a mais antiga é sobrescrita quando a sala atinge a capacidade
+        if self.message_history.append(room_id, message, seq) is None:
+            return
+        if message.get("type") == "FILE_SHARE" and self.chat_client is not None:
+            # Arquivos enviados por outros workers/pods também entram no índice local
+            file_index = self.chat_client.file_index
+            if file_index.get(message.get("file_id")) is None:
+                file_index.add(
+                    room_id, message["file_id"], message.get("filename") or "", message.get("file_size") or 0,
+                    message.get("mime_type"), message.get("user_id", ""), message.get("username", ""),
+                    message.get("timestamp", 0)
+                )
 
 # Instância global do gerenciador
 manager = ConnectionManager()
 
 class ServiceClient:
-    """Cliente para comunicação com os módulos A e B via gRPC ou REST"""
-    def __init__(self, modo='grpc'):
-        self.modo = modo
-        # Configuração dos hosts/ports
-        self.modulo_a_host = os.getenv('MODULO_A_HOST', 'localhost')
-        self.modulo_a_port_grpc = os.getenv('MODULO_A_PORT', '50051')
-        self.modulo_a_port_rest = os.getenv('MODULO_A_PORT_REST', '5001')
-        self.modulo_b_host = os.getenv('MODULO_B_HOST', 'localhost')
-        self.modulo_b_port_grpc = os.getenv('MODULO_B_PORT', '50052')
-        self.modulo_b_port_rest = os.getenv('MODULO_B_PORT_REST', '5002')
-
-        if self.modo == 'grpc':
-            self.channel_a = grpc.insecure_channel(f'{self.modulo_a_host}:{self.modulo_a_port_grpc}')
-            self.channel_b = grpc.insecure_channel(f'{self.modulo_b_host}:{self.modulo_b_port_grpc}')
-            self.stub_a = servico_pb2_grpc.ServicoAStub(self.channel_a)
-            self.stub_b = servico_pb2_grpc.ServicoBStub(self.channel_b)
-
-    def close_connections(self):
-        if self.modo == 'grpc':
-            self.channel_a.close()
-            self.channel_b.close()
-
-    def chamar_servico_a(self, request_data: ExecutarRequest) -> Dict[str, Any]:
-        if self.modo == 'grpc':
-            try:
-                request_a = servico_pb2.RequestA(
-                    id=request_data.id,
-                    data=request_data.data,
-                    operation=request_data.operation
-                )
-                response_a = self.stub_a.RealizarTarefaA(request_a, timeout=10)
-                return {
-                    "id": response_a.id,
-                    "result": response_a.result,
-                    "message": response_a.message,
-                    "status_code": response_a.status_code
-                }
-            except grpc.RpcError as e:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Erro na comunicação com Módulo A (gRPC): {e.details()}"
-                )
-        else:
-            # REST/JSON
-            try:
-                url = f"http://{self.modulo_a_host}:{self.modulo_a_port_rest}/realizar-tarefa-a"
-                payload = {
-                    "id": request_data.id,
-                    "data": request_data.data,
-                    "operation": request_data.operation
-                }
-                resp = requests.post(url, json=payload, timeout=10)
-                resp.raise_for_status()
-                return resp.json()
-            except Exception as e:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Erro na comunicação com Módulo A (REST): {str(e)}"
-                )
+    """Cliente para comunicação com os módulos A e B via gRPC ou REST (ver transports.py)"""
+    def __init__(self, transport: Transport):
+        self.transport = transport
+        self.modo = transport.name
 
-    def chamar_servico_b(self, request_data: ExecutarRequest, resultado_a: str) -> List[Dict[str, Any]]:
-        if self.modo == 'grpc':
-            try:
-                request_b = servico_pb2.RequestB(
-                    id=request_data.id,
-                    data=f"{request_data.data}_processado_por_A:{resultado_a}",
-                    count=request_data.count
-                )
-                responses_b = []
-                for response_b in self.stub_b.RealizarTarefaB(request_b, timeout=30):
-                    responses_b.append({
-                        "id": response_b.id,
-                        "result": response_b.result,
-                        "message": response_b.message,
-                        "sequence_number": response_b.sequence_number,
-                        "is_final": response_b.is_final
-                    })
-                return responses_b
-            except grpc.RpcError as e:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Erro na comunicação com Módulo B (gRPC): {e.details()}"
-                )
-        else:
-            # REST/JSON
-            try:
-                url = f"http://{self.modulo_b_host}:{self.modulo_b_port_rest}/realizar-tarefa-b"
-                payload = {
-                    "id": request_data.id,
-                    "data": f"{request_data.data}_processado_por_A:{resultado_a}",
-                    "count": request_data.count
-                }
-                resp = requests.post(url, json=payload, timeout=15)
-                resp.raise_for_status()
-                data = resp.json()
-                return data.get("respostas", [])
-            except Exception as e:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"Erro na comunicação com Módulo B (REST): {str(e)}"
-                )
+    async def close_connections(self):
+        await self.transport.close()
+
+    async def chamar_servico_a(self, request_data: ExecutarRequest) -> Dict[str, Any]:
+        try:
+            return await self.transport.realizar_tarefa_a(
+                request_data.id,
+                request_data.data,
+                request_data.operation
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Erro na comunicação com Módulo A ({self.transport.label}): {self.transport.error_detail(e)}"
+            )
+
+    async def chamar_servico_b(self, request_data: ExecutarRequest, resultado_a: str) -> List[Dict[str, Any]]:
+        return [response_b async for response_b in self.stream_servico_b(request_data, resultado_a)]
+
+    async def stream_servico_b(self, request_data: ExecutarRequest, resultado_a: str) -> AsyncIterator[Dict[str, Any]]:
+        """Repassa as respostas do Módulo B uma a uma, conforme chegam do stream"""
+        try:
+            async for response_b in self.transport.realizar_tarefa_b(
+                request_data.id,
+                f"{request_data.data}_processado_por_A:{resultado_a}",
+                request_data.count
+            ):
+                yield response_b
+        except Exception as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Erro na comunicação com Módulo B ({self.transport.label}): {self.transport.error_detail(e)}"
+            )
 
 
 class GrpcChatClient:
-    """Cliente gRPC especializado para operações de chat"""
-    def __init__(self):
-        self.modulo_a_host = os.getenv('MODULO_A_HOST', 'localhost')
-        self.modulo_a_port = os.getenv('MODULO_A_PORT', '50051')
-        self.modulo_b_host = os.getenv('MODULO_B_HOST', 'localhost')
-        self.modulo_b_port = os.getenv('MODULO_B_PORT', '50052')
+    """Cliente gRPC (grpc.aio) especializado para operações de chat"""
+    def __init__(self, backend: AsyncBackendClient, staging: StagingStore, file_cache: FileCache,
+                 file_index: FileIndex, module_a_stream: ChatStreamClient,
+                 module_a_batcher: ModuleABatcher, presence: PresenceService):
+        self.backend = backend
+        # Presença mantida pelo gateway (sincronizada em lote com o Module A)
+        self.presence = presence
+        # ChatStreams persistentes com o Module A (caminho principal de processamento)
+        self.module_a_stream = module_a_stream
+        # Micro-batching das chamadas ao Module A (quando não há ChatStream aberto)
+        self.module_a_batcher = module_a_batcher
+        # Área de staging em disco para uploads que não vão direto ao Module B
+        self.staging = staging
+        # Cache dos arquivos compartilhados (replay do histórico sem voltar ao Module B)
+        self.file_cache = file_cache
+        # Índice de arquivos por sala (listagem sem varrer o histórico de mensagens)
+        self.file_index = file_index
         # Armazenar uploads de arquivo em progresso
-        self.file_uploads = {}  # {file_id: {"chunks": [], "metadata": {}, "status": "in_progress"}}
+        self.file_uploads = {}  # {file_id: {"metadata": {}, "status": "in_progress", "stream": ..., "staged": ...}}
     
-    def process_message(self, username: str, content: str, room_id: str, user_id: str) -> Dict[str, Any]:
+    async def process_message(self, username: str, content: str, room_id: str, user_id: str,
+                              message_id: str = "") -> Dict[str, Any]:
         """
         Processa mensagem via Module A (ChatService)
         Integração: Envia a mensagem para Module A processar antes de repassar para outros usuários
+        Prazo total de CHAT_MESSAGE_DEADLINE_MS; esgotado (ou com o circuito aberto), cai no conteúdo original
         """
+        with deadline_scope(CHAT_MESSAGE_DEADLINE_MS / 1000):
+            return await self._process_message(username, content, room_id, user_id, message_id)
+
+    async def _process_message(self, username: str, content: str, room_id: str, user_id: str,
+                               message_id: str) -> Dict[str, Any]:
+        # O mesmo id nos dois caminhos: logs e rastreio da mensagem não dependem de qual foi usado
+        request_id = message_id or str(uuid.uuid4())
         try:
-            channel = grpc.insecure_channel(f'{self.modulo_a_host}:{self.modulo_a_port}')
-            stub = servico_pb2_grpc.ServicoAStub(channel)
-            
-            # Usar RealizarTarefaA para processar a mensagem
-            request = servico_pb2.RequestA(
-                id=str(uuid.uuid4()),
-                data=content,
-                operation="process_message"  # Operação especial para processamento de chat
-            )
-            
-            response = stub.RealizarTarefaA(request, timeout=10)
-            channel.close()
+            try:
+                # ChatStream persistente: mensagem correlacionada pelo message_id, sem RPC por mensagem
+                response = await self.module_a_stream.process(
+                    request_id, user_id, username, content, room_id
+                )
+                processed_content = response.content
+            except StreamUnavailable:
+                # Sem stream aberto (ou a mensagem nem chegou a ser escrita): RealizarTarefaA em lote.
+                # StreamInterrupted (já escrita no stream que caiu) não é reenviada: conteúdo original
+                response = await self.module_a_batcher.submit(
+                    request_id,
+                    content,
+                    "process_message"  # Operação especial para processamento de chat
+                )
+                processed_content = response.result
             
-            logger.info(f"✅ Mensagem processada por Module A: {response.result[:50]}...")
+            logger.info(f"✅ Mensagem processada por Module A: {processed_content[:50]}...")
             
             return {
                 "success": True,
-                "processed_content": response.result,
+                "processed_content": processed_content,
                 "original_content": content,
                 "status": "processed_by_module_a"
             }
@@ -521,33 +841,7 @@ class GrpcChatClient:
                 "error": str(e)
             }
     
-    def get_online_users(self, room_id: str) -> List[Dict[str, Any]]:
-        """
-        Obtém lista de usuários online via Module A (UserService)
-        """
-        try:
-            channel = grpc.insecure_channel(f'{self.modulo_a_host}:{self.modulo_a_port}')
-            stub = servico_pb2_grpc.UserServiceStub(channel)
-            
-            request = servico_pb2.OnlineUsersRequest(room_id=room_id)
-            response = stub.GetOnlineUsers(request, timeout=10)
-            channel.close()
-            
-            users = []
-            for user_info in response.users:
-                users.append({
-                    "user_id": user_info.user_id,
-                    "username": user_info.username,
-                    "status": user_info.status,
-                    "last_seen": user_info.last_seen
-                })
-            
-            return users
-        except Exception as e:
-            logger.error(f"Erro ao obter usuários online: {str(e)}")
-            return []
-    
-    def retrieve_file_from_module_b(self, file_id: str, room_id: str) -> Dict[str, Any]:
+    async def retrieve_file_from_module_b(self, file_id: str, room_id: str) -> Dict[str, Any]:
         """
         Recupera arquivo do Module B usando server-streaming via ReceiveFiles
         Retorna o arquivo em partes que devem ser montadas
@@ -555,21 +849,12 @@ class GrpcChatClient:
         try:
             logger.info(f"📥 Recuperando arquivo {file_id} do Module B...")
             
-            channel = grpc.insecure_channel(f'{self.modulo_b_host}:{self.modulo_b_port}')
-            stub = servico_pb2_grpc.FileServiceStub(channel)
-            
-            # Fazer requisição para obter arquivo
-            request = servico_pb2.FileRequest(
-                room_id=room_id,
-                file_id=file_id
-            )
-            
             # Receber arquivo em chunks via server-streaming
             chunks = []
             file_metadata = {}
             total_size = 0
             
-            for chunk_response in stub.ReceiveFiles(request, timeout=120):
+            async for chunk_response in self._receive_file(file_id, room_id):
                 chunks.append({
                     "index": chunk_response.chunk_index,
                     "data": chunk_response.chunk_data
@@ -591,8 +876,6 @@ class GrpcChatClient:
                 
                 logger.info(f"📥 Chunk {chunk_response.chunk_index + 1}/{chunk_response.total_chunks} recebido: {len(chunk_response.chunk_data)} bytes")
             
-            channel.close()
-            
             # Combinar chunks em ordem
             sorted_chunks = sorted(chunks, key=lambda x: x["index"])
             file_data = b"".join([chunk["data"] for chunk in sorted_chunks])
@@ -608,7 +891,7 @@ class GrpcChatClient:
                 "username": file_metadata.get("username"),
                 "room_id": file_metadata.get("room_id"),
                 "file_size": total_size,
-                "file_data_b64": base64.b64encode(file_data).decode('utf-8')
+                "file_data": file_data
             }
         
         except grpc.RpcError as e:
@@ -626,120 +909,276 @@ class GrpcChatClient:
                 "file_id": file_id
             }
     
-    def start_file_upload(self, file_id: str, filename: str, mime_type: str, file_size: int, user_id: str, username: str, room_id: str):
+    def start_file_upload(self, file_id: str, filename: str, mime_type: str, file_size: int, user_id: str, username: str, room_id: str,
+                          resumable: bool = False, stream_timeout: float = 120):
         """
         Inicia uma sessão de upload de arquivo
+        Com file_size conhecido e o Module B disponível, abre um UploadFile e cada chunk é
+        encaminhado em streaming; caso contrário os chunks vão para a área de staging em disco.
+        Uploads retomáveis (HTTP) sobrevivem ao fim da requisição e expiram por inatividade
         """
-        self.file_uploads[file_id] = {
-            "chunks": [],
-            "metadata": {
-                "file_id": file_id,
-                "filename": filename,
-                "mime_type": mime_type,
-                "file_size": file_size,
-                "user_id": user_id,
-                "username": username,
-                "room_id": room_id,
-                "total_chunks": 0,
-                "received_chunks": 0
-            },
-            "status": "in_progress"
+        self._drop_upload(file_id)
+        
+        metadata = {
+            "file_id": file_id,
+            "filename": filename,
+            "mime_type": mime_type,
+            "file_size": file_size,
+            "user_id": user_id,
+            "username": username,
+            "room_id": room_id,
+            "total_chunks": 0,
+            "received_chunks": 0
+        }
+        upload = {
+            "metadata": metadata,
+            "status": "in_progress",
+            "stream": None,
+            "staged": None,
+            "chunk_size": 0,
+            # Índices dos chunks já gravados no staging (para detectar buracos no FILE_SHARE)
+            "chunks": set(),
+            # Upload HTTP retomável: bytes recebidos em ordem, uma requisição por vez
+            "resumable": resumable,
+            "offset": 0,
+            "lock": asyncio.Lock(),
+            "last_activity": time.monotonic()
         }
-        logger.info(f"📎 Iniciando upload: {filename} (ID: {file_id})")
+        self.file_uploads[file_id] = upload
+        try:
+            if file_size and file_size > 0 and self.backend.module_b_available():
+                # O UploadFile vive além da requisição que inicia a sessão: o prazo dela não vale
+                with detached_scope():
+                    upload["stream"] = StreamingUpload(self.backend, metadata, timeout=stream_timeout)
+            else:
+                upload["staged"] = self.staging.create(file_id, file_size or 0)
+        except StagingError as e:
+            logger.error(f"❌ Upload {file_id} recusado: {str(e)}")
+            upload["status"] = "error"
+            upload["error"] = str(e)
+            return
+        mode = "streaming" if upload["stream"] is not None else "staging"
+        logger.info(f"📎 Iniciando upload: {filename} (ID: {file_id}, modo: {mode})")
     
-    def add_file_chunk(self, file_id: str, chunk_data: bytes, chunk_index: int, total_chunks: int) -> bool:
+    async def add_file_chunk(self, file_id: str, chunk_data: bytes, chunk_index: int, total_chunks: int) -> bool:
         """
-        Adiciona um chunk ao upload em progresso
+        Adiciona um chunk ao upload em progresso: encaminha direto ao Module B (streaming)
+        ou grava no seu offset do arquivo de staging
         """
         if file_id not in self.file_uploads:
             logger.warning(f"Upload {file_id} não encontrado")
             return False
         
         upload = self.file_uploads[file_id]
-        upload["chunks"].append({
-            "index": chunk_index,
-            "data": chunk_data
-        })
+        if upload["status"] != "in_progress":
+            return False
+        
+        try:
+            if upload["stream"] is not None:
+                # Aguarda o controle de fluxo do gRPC (backpressure até o cliente WebSocket)
+                await upload["stream"].write(chunk_data, chunk_index)
+            else:
+                # Todos os chunks do cliente têm o tamanho do primeiro, exceto o último
+                if chunk_index == 0:
+                    upload["chunk_size"] = len(chunk_data)
+                chunk_size = upload["chunk_size"]
+                if not chunk_size or len(chunk_data) > chunk_size:
+                    raise StagingError(f"Chunk {chunk_index} inesperado (tamanho {len(chunk_data)})")
+                upload["staged"].write_at(chunk_index * chunk_size, chunk_data)
+                upload["chunks"].add(chunk_index)
+        except (UploadStreamError, StagingError, grpc.RpcError) as e:
+            error = e.details() if isinstance(e, grpc.RpcError) else str(e)
+            logger.error(f"❌ Erro no upload {file_id}: {error}")
+            if upload["stream"] is not None:
+                upload["stream"].abort()
+            if upload["staged"] is not None:
+                self.staging.discard(file_id)
+                upload["staged"] = None
+            upload["status"] = "error"
+            upload["error"] = error
+            return False
         upload["metadata"]["received_chunks"] = chunk_index + 1
         upload["metadata"]["total_chunks"] = total_chunks
         
         logger.info(f"📥 Chunk {chunk_index + 1}/{total_chunks} recebido para {upload['metadata']['filename']}")
         return True
     
-    def finalize_file_upload(self, file_id: str) -> Dict[str, Any]:
+    async def append_file_data(self, file_id: str, data: bytes, offset: int) -> int:
         """
-        Finaliza um upload e envia para Module B via gRPC
+        Acrescenta bytes a um upload retomável a partir de `offset` (deve ser o offset atual)
+        Retorna o novo offset; UploadOffsetError não altera o upload, demais erros o encerram
         """
-        if file_id not in self.file_uploads:
+        upload = self.file_uploads.get(file_id)
+        if upload is None or upload["status"] != "in_progress":
+            raise UploadStreamError(f"Upload {file_id} não encontrado")
+        if offset != upload["offset"]:
+            raise UploadOffsetError(upload["offset"], offset)
+        
+        try:
+            if upload["stream"] is not None:
+                await upload["stream"].append(data, offset)
+            else:
+                upload["staged"].write_at(offset, data)
+        except (UploadStreamError, StagingError, grpc.RpcError) as e:
+            error = e.details() if isinstance(e, grpc.RpcError) else str(e)
+            logger.error(f"❌ Erro no upload {file_id}: {error}")
+            self._drop_upload(file_id)
+            raise UploadStreamError(error)
+        upload["offset"] = offset + len(data)
+        upload["last_activity"] = time.monotonic()
+        return upload["offset"]
+    
+    def sweep_idle_uploads(self, max_idle: float) -> List[str]:
+        """Descarta uploads retomáveis sem atividade há mais de max_idle segundos"""
+        deadline = time.monotonic() - max_idle
+        expired = [
+            file_id for file_id, upload in self.file_uploads.items()
+            if upload["resumable"] and upload["last_activity"] < deadline and not upload["lock"].locked()
+        ]
+        for file_id in expired:
+            self._drop_upload(file_id)
+            logger.info(f"🧹 Upload retomável {file_id} expirado")
+        return expired
+    
+    def _drop_upload(self, file_id: str):
+        upload = self.file_uploads.pop(file_id, None)
+        if upload is None:
+            return
+        if upload["stream"] is not None:
+            upload["stream"].abort()
+        if upload["staged"] is not None:
+            self.staging.discard(file_id)
+    
+    def forget_upload(self, file_id: str):
+        """Remove um upload expirado pelo varredor de TTL do staging"""
+        self._drop_upload(file_id)
+    
+    def abort_uploads(self, user_id: str):
+        """Cancela os uploads em andamento de um usuário (ex.: WebSocket desconectado)"""
+        for file_id, upload in list(self.file_uploads.items()):
+            if upload["metadata"]["user_id"] == user_id:
+                self._drop_upload(file_id)
+                logger.info(f"🛑 Upload {file_id} cancelado")
+    
+    def _check_staged_complete(self, upload: dict):
+        """
+        Confere se o upload em staging está completo antes de enviá-lo ao Module B: um chunk
+        que não chegou deixaria um buraco zerado no meio do arquivo
+        """
+        metadata = upload["metadata"]
+        staged = upload["staged"]
+        if not upload["resumable"]:
+            total_chunks = metadata["total_chunks"]
+            if upload["chunks"] != set(range(total_chunks)):
+                raise UploadStreamError(
+                    f"Upload incompleto: {len(upload['chunks'])}/{total_chunks} chunks recebidos"
+                )
+        declared_size = metadata.get("file_size") or 0
+        if declared_size and staged.size != declared_size:
+            raise UploadStreamError(
+                f"Upload incompleto: {staged.size}/{declared_size} bytes recebidos"
+            )
+
+    def _staged_chunks(self, metadata: dict, view: memoryview):
+        """FileChunks de um upload em staging, lidos da view mmap do arquivo remontado"""
+        total_grpc_chunks = chunk_count(len(view), GRPC_CHUNK_SIZE)
+        for i in range(total_grpc_chunks):
+            yield servico_pb2.FileChunk(
+                file_id=metadata['file_id'],
+                filename=metadata['filename'],
+                mime_type=metadata['mime_type'],
+                # O protobuf exige bytes: copia-se apenas o chunk gRPC corrente
+                chunk_data=bytes(view[i * GRPC_CHUNK_SIZE:(i + 1) * GRPC_CHUNK_SIZE]),
+                chunk_index=i,
+                total_chunks=total_grpc_chunks,
+                file_size=len(view),
+                user_id=metadata['user_id'],
+                username=metadata['username'],
+                room_id=metadata['room_id']
+            )
+    
+    async def finalize_file_upload(self, file_id: str) -> Dict[str, Any]:
+        """
+        Finaliza um upload no Module B via gRPC
+        No modo streaming os bytes já foram enviados; no modo staging o arquivo em disco é
+        enviado agora, aguardando o Module B voltar (wait_for_ready). Se ainda assim ele estiver
+        indisponível, o upload continua em staging e um novo FILE_SHARE tenta outra vez
+        """
+        upload = self.file_uploads.get(file_id)
+        if upload is None:
             return {"success": False, "error": "Upload não encontrado"}
         
-        upload = self.file_uploads[file_id]
         metadata = upload["metadata"]
+        if upload["status"] == "error":
+            self._drop_upload(file_id)
+            return {
+                "success": False,
+                "error": f"Erro ao enviar para Module B: {upload.get('error')}",
+                "file_id": file_id
+            }
         
         try:
-            # Combinar chunks em ordem
-            sorted_chunks = sorted(upload["chunks"], key=lambda x: x["index"])
-            file_data = b"".join([chunk["data"] for chunk in sorted_chunks])
-            
-            logger.info(f"🔄 Enviando arquivo para Module B: {metadata['filename']}")
-            
-            # Conectar ao Module B e fazer upload via gRPC
-            channel = grpc.insecure_channel(f'{self.modulo_b_host}:{self.modulo_b_port}')
-            stub = servico_pb2_grpc.FileServiceStub(channel)
-            
-            # Gerar chunks para gRPC
-            def upload_generator():
-                chunk_size = 1024 * 1024  # 1MB
-                total_grpc_chunks = (len(file_data) + chunk_size - 1) // chunk_size
-                
-                for i in range(total_grpc_chunks):
-                    start = i * chunk_size
-                    end = min(start + chunk_size, len(file_data))
-                    chunk = file_data[start:end]
-                    
-                    yield servico_pb2.FileChunk(
-                        file_id=metadata['file_id'],
-                        filename=metadata['filename'],
-                        mime_type=metadata['mime_type'],
-                        chunk_data=chunk,
-                        chunk_index=i,
-                        total_chunks=total_grpc_chunks,
-                        file_size=len(file_data),
-                        user_id=metadata['user_id'],
-                        username=metadata['username'],
-                        room_id=metadata['room_id']
+            if upload["stream"] is not None:
+                logger.info(f"🔄 Concluindo upload em streaming no Module B: {metadata['filename']}")
+                response = await upload["stream"].finish()
+                file_size = upload["stream"].file_size
+            else:
+                staged = upload["staged"]
+                self._check_staged_complete(upload)
+                file_size = staged.size
+                logger.info(f"🔄 Enviando arquivo em staging para Module B: {metadata['filename']}")
+                with staged.open_view() as view:
+                    response = await self.backend.upload_file(
+                        self._staged_chunks(metadata, view), timeout=120, wait_for_ready=True
                     )
+                    if response.success:
+                        await self.file_cache.put(file_id, view)
             
-            # Enviar para Module B
-            response = stub.UploadFile(upload_generator(), timeout=120)
-            channel.close()
-            
-            upload["status"] = "completed"
+            self._drop_upload(file_id)
+            if not response.success:
+                logger.error(f"❌ Module B rejeitou o arquivo {metadata['filename']}: {response.message}")
+                return {
+                    "success": False,
+                    "error": f"Module B rejeitou o arquivo: {response.message}",
+                    "file_id": file_id
+                }
             
             logger.info(f"✅ Arquivo enviado para Module B: {metadata['filename']}")
             
-            # Preparar resposta para broadcast
-            result = {
+            timestamp = datetime.now().timestamp()
+            # MIME detectado pelo Module B: o mesmo que o ListFiles devolve na reconstrução do índice
+            mime_type = response.mime_type or metadata['mime_type']
+            self.file_index.add(
+                metadata['room_id'], metadata['file_id'], metadata['filename'], file_size,
+                mime_type, metadata['user_id'], metadata['username'], timestamp
+            )
+            
+            # Preparar resposta para broadcast (o conteúdo é distribuído a partir do Module B)
+            return {
                 "success": True,
                 "file_id": metadata['file_id'],
                 "filename": metadata['filename'],
-                "file_size": len(file_data),
+                "file_size": file_size,
                 "user_id": metadata['user_id'],
                 "username": metadata['username'],
                 "room_id": metadata['room_id'],
-                "mime_type": metadata['mime_type'],
-                "timestamp": datetime.now().timestamp(),
-                "file_data_b64": base64.b64encode(file_data).decode('utf-8')  # Incluir dados para distribuição
+                "mime_type": mime_type,
+                "timestamp": timestamp
             }
-            
-            # Limpar upload da memória
-            del self.file_uploads[file_id]
-            
-            return result
         
         except grpc.RpcError as e:
             logger.error(f"❌ Erro ao enviar arquivo para Module B: {e.details()}")
-            upload["status"] = "error"
+            retryable = (
+                upload["staged"] is not None
+                and e.code() in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+            )
+            if retryable:
+                return {
+                    "success": False,
+                    "error": f"Module B indisponível, arquivo mantido para nova tentativa: {e.details()}",
+                    "file_id": file_id
+                }
+            self._drop_upload(file_id)
             return {
                 "success": False,
                 "error": f"Erro ao enviar para Module B: {e.details()}",
@@ -747,57 +1186,99 @@ class GrpcChatClient:
             }
         except Exception as e:
             logger.error(f"❌ Erro ao processar arquivo: {str(e)}")
-            upload["status"] = "error"
+            self._drop_upload(file_id)
             return {
                 "success": False,
                 "error": f"Erro ao processar arquivo: {str(e)}",
                 "file_id": file_id
             }
 
-
-    def get_online_users(self, room_id: str) -> List[Dict[str, Any]]:
+    async def get_file(self, file_id: str, room_id: str) -> Dict[str, Any]:
+        """
+        Conteúdo de um arquivo para replay do histórico: do cache do gateway quando possível,
+        senão do Module B (e então guardado no cache para os próximos usuários)
+        """
+        cached = await self.file_cache.get(file_id)
+        if cached is not None:
+            return {"success": True, "file_id": file_id, "file_data": cached.data, "cached": cached}
+        
+        result = await self.retrieve_file_from_module_b(file_id, room_id)
+        if result.get("success"):
+            result["cached"] = await self.file_cache.put(file_id, result["file_data"])
+        return result
+    
+    async def _receive_file(self, file_id: str, room_id: str) -> AsyncIterator[Any]:
+        """
+        Chunks de um único arquivo via ReceiveFiles
+        Para um file_id desconhecido o Module B devolve todos os arquivos da sala, então os
+        chunks de outros arquivos são ignorados e a leitura termina no último chunk deste
+        """
+        async for chunk_response in self.backend.receive_files(room_id, file_id, timeout=120):
+            if chunk_response.file_id != file_id:
+                continue
+            yield chunk_response
+            if chunk_response.chunk_index >= chunk_response.total_chunks - 1:
+                break
+    
+    async def _cached_read(self, file_id: str, responses: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        """Repassa os bytes dos chunks e, se o arquivo couber no cache, guarda uma cópia ao final"""
+        buffer = None
+        async for chunk_response in responses:
+            if chunk_response.chunk_index == 0 and self.file_cache.accepts(chunk_response.file_size):
+                buffer = bytearray()
+            if buffer is not None:
+                buffer += chunk_response.chunk_data
+            yield chunk_response.chunk_data
+        if buffer:
+            await self.file_cache.put(file_id, buffer)
+    
+    def stream_file_from_module_b(self, file_id: str, room_id: str) -> AsyncIterator[bytes]:
+        """Lê o conteúdo de um arquivo do Module B (ReceiveFiles) em pedaços, sem montar o arquivo"""
+        return self._cached_read(file_id, self._receive_file(file_id, room_id))
+    
+    async def open_module_b_download(self, file_id: str, room_id: str):
         """
-        Obtém lista de usuários online via Module A (UserService)
+        Abre a leitura em streaming de um arquivo no Module B (ReceiveFiles)
+        Retorna (metadados, iterador assíncrono dos bytes); None se o arquivo não existir
         """
+        # O primeiro chunk traz os metadados (e confirma que o arquivo existe)
+        responses = self._receive_file(file_id, room_id)
         try:
-            channel = grpc.insecure_channel(f'{self.modulo_a_host}:{self.modulo_a_port}')
-            stub = servico_pb2_grpc.UserServiceStub(channel)
-            
-            request = servico_pb2.OnlineUsersRequest(room_id=room_id)
-            response = stub.GetOnlineUsers(request, timeout=10)
-            channel.close()
-            
-            users = []
-            for user_info in response.users:
-                users.append({
-                    "user_id": user_info.user_id,
-                    "username": user_info.username,
-                    "status": user_info.status,
-                    "last_seen": user_info.last_seen
-                })
-            
-            logger.info(f"✅ Obtidos {len(users)} usuários online de Module A")
-            return users
-        except Exception as e:
-            logger.error(f"❌ Erro ao obter usuários do Module A: {str(e)}")
-            return []
+            first = await responses.__anext__()
+        except StopAsyncIteration:
+            return None
+        metadata = {
+            "file_id": first.file_id,
+            "filename": first.filename,
+            "mime_type": first.mime_type,
+            "file_size": first.file_size,
+            "room_id": first.room_id
+        }
+        
+        async def all_responses():
+            try:
+                yield first
+                async for chunk_response in responses:
+                    yield chunk_response
+            finally:
+                await responses.aclose()
+        
+        return metadata, self._cached_read(file_id, all_responses())
+
+    async def get_online_users(self, room_id: str) -> List[Dict[str, Any]]:
+        """
+        Obtém lista de usuários online do armazenamento de presença do gateway
+        (o mesmo do WebSocket; o Module A é sincronizado em lote por SyncPresence)
+        """
+        return self.presence.users(room_id)
 
     
-    def login_user(self, username: str, room_id: str) -> Dict[str, Any]:
+    async def login_user(self, username: str, room_id: str) -> Dict[str, Any]:
         """
         Faz login do usuário via Module A (UserService.LoginUser)
         """
         try:
-            channel = grpc.insecure_channel(f'{self.modulo_a_host}:{self.modulo_a_port}')
-            stub = servico_pb2_grpc.UserServiceStub(channel)
-            
-            request = servico_pb2.LoginRequest(
-                username=username,
-                room_id=room_id
-            )
-            
-            response = stub.LoginUser(request, timeout=10)
-            channel.close()
+            response = await self.backend.login_user(username, room_id, timeout=10)
             
             logger.info(f"✅ Usuário {username} fez login no Module A")
             
@@ -812,22 +1293,102 @@ class GrpcChatClient:
             logger.error(f"❌ Erro ao fazer login no Module A: {str(e)}")
             raise HTTPException(status_code=503, detail=f"Erro ao fazer login: {str(e)}")
 
+# Instância global do cliente assíncrono dos backends (grpc.aio sobre pools de canais persistentes)
+backend_client = AsyncBackendClient(ChannelManager.from_env(), Resilience.from_env())
+
 # Instância global do cliente de chat
-chat_client = GrpcChatClient()
+chat_client = GrpcChatClient(
+    backend_client, StagingStore.from_env(), FileCache.from_env(), FileIndex(),
+    ChatStreamClient.from_env(backend_client), ModuleABatcher.from_env(backend_client),
+    manager.presence
+)
 
 # Instância global do cliente (padrão: gRPC)
-service_client = ServiceClient(modo=os.getenv('MODOP_COMUNICACAO', 'grpc'))
+service_client = ServiceClient(transport_from_env(backend_client))
+
+# Controle de admissão: atraso do event loop + chamadas em voo aos backends (gRPC e ChatStream)
+admission = AdmissionController.from_env(
+    inflight=lambda: backend_client.channels.inflight() + chat_client.module_a_stream.inflight()
+)
+
+# Pipeline global de processamento de mensagens (Módulo A exatamente uma vez)
+message_pipeline = MessagePipeline(chat_client.process_message)
+manager.pipeline = message_pipeline
+manager.chat_client = chat_client
+
+async def upload_session_sweeper(interval: float = 30):
+    """Descarta uploads HTTP retomáveis abandonados (libera o UploadFile aberto no Module B)"""
+    while True:
+        await asyncio.sleep(interval)
+        chat_client.sweep_idle_uploads(UPLOAD_SESSION_TTL_SECONDS)
+
+async def rebuild_file_index(retry_interval: float = 5, attempts: int = 12):
+    """Reconstrói o índice de arquivos a partir do Module B, tentando até ele responder"""
+    for _ in range(attempts):
+        try:
+            await chat_client.file_index.rebuild(backend_client)
+            return
+        except grpc.RpcError as e:
+            logger.warning(f"⚠️ Module B indisponível para reconstruir o índice de arquivos: {e.details()}")
+            await asyncio.sleep(retry_interval)
+
+async def warm_up_channels():
+    """Aquece os pools de canais gRPC; uma falha só é registrada (os canais conectam sob demanda)"""
+    try:
+        await backend_client.channels.warm_up()
+    except Exception as e:
+        logger.warning(f"⚠️ Falha ao aquecer os pools de canais gRPC: {e}")
 
 @app.on_event("startup")
 async def startup_event():
     print("🚀 Módulo P (Gateway) iniciado!")
     print(f"📡 Modo de comunicação: {service_client.modo.upper()}")
+    print(f"🧩 Codificador JSON dos frames WebSocket: {json_codec.BACKEND}")
     print("📨 Integração com Module A ativada para processamento de mensagens")
+    # Histórico durável (HISTORY_LOG_DIR): recarrega a janela em memória de cada sala
+    history = manager.message_history
+    await history.restore()
+    # Backplane de eventos de sala (entre workers com GATEWAY_BACKPLANE=unix)
+    manager.backplane = backplane_from_env()
+    await manager.backplane.start(manager.apply_event)
+    print(f"🛰️ Backplane de salas: {manager.backplane.name}")
+    app.state.history_flusher = asyncio.create_task(history.log.run_flusher()) if history.log else None
+    # Aquece os pools de canais em segundo plano (não bloqueia o startup se um backend estiver fora)
+    app.state.channel_warm_up = asyncio.create_task(warm_up_channels())
+    # ChatStreams persistentes com o Module A (reabertos automaticamente se caírem)
+    chat_client.module_a_stream.start()
+    # Monitor de carga do controle de admissão
+    admission.start()
+    # Sincronização da presença com o Module A (SyncPresence em lote)
+    manager.presence.start(backend_client)
+    # Varredor de TTL dos uploads abandonados em staging
+    app.state.staging_sweeper = asyncio.create_task(
+        chat_client.staging.run_sweeper(on_expire=chat_client.forget_upload)
+    )
+    app.state.upload_sweeper = asyncio.create_task(upload_session_sweeper())
+    # Índice de arquivos por sala reconstruído do Module B em segundo plano
+    app.state.file_index_rebuild = asyncio.create_task(rebuild_file_index())
+    # ChatService.GetMessageHistory servido pelo próprio gateway
+    app.state.grpc_server = await start_grpc_server(manager.message_history)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("🔌 Fechando conexões...")
-    service_client.close_connections()
+    app.state.staging_sweeper.cancel()
+    app.state.upload_sweeper.cancel()
+    app.state.file_index_rebuild.cancel()
+    app.state.channel_warm_up.cancel()
+    await app.state.grpc_server.stop(grace=5)
+    await manager.backplane.close()
+    if app.state.history_flusher is not None:
+        app.state.history_flusher.cancel()
+        manager.message_history.log.close()
+    await chat_client.module_a_stream.close()
+    await admission.close()
+    await manager.presence.close()
+    chat_client.staging.close()
+    await service_client.close_connections()
+    await backend_client.close()
 
 @app.get("/")
 async def root():
@@ -835,9 +1396,22 @@ async def root():
     return {
         "service": "Módulo P - Gateway",
         "status": "running",
-        "endpoints": ["/api/executar"]
+        "endpoints": ["/api/executar", "/api/executar/stream", "/api/executar/lote"]
     }
 
+async def orquestrar_tarefa(request: ExecutarRequest) -> ExecutarResponse:
+    """Módulo A e, com o resultado dele, o stream do Módulo B (clientes assíncronos)"""
+    resultado_a = await service_client.chamar_servico_a(request)
+    resultados_b = await service_client.chamar_servico_b(request, resultado_a.get("resultado", resultado_a.get("result", "")))
+    return ExecutarResponse(
+        request_id=request.id,
+        resultado_a=resultado_a,
+        resultados_b=resultados_b,
+        status="success",
+        message=f"Tarefa {request.id} executada com sucesso. "
+               f"Módulo A processou, Módulo B retornou {len(resultados_b)} respostas."
+    )
+
 @app.post("/api/executar", response_model=ExecutarResponse)
 async def executar_tarefa(request: ExecutarRequest):
     """
@@ -846,18 +1420,7 @@ async def executar_tarefa(request: ExecutarRequest):
     """
     print(f"📨 Recebida requisição: {request.id}")
     try:
-        print(f"🔄 Chamando Módulo A para ID: {request.id}")
-        resultado_a = service_client.chamar_servico_a(request)
-        print(f"🔄 Chamando Módulo B para ID: {request.id}")
-        resultados_b = service_client.chamar_servico_b(request, resultado_a.get("resultado", resultado_a.get("result", "")))
-        response = ExecutarResponse(
-            request_id=request.id,
-            resultado_a=resultado_a,
-            resultados_b=resultados_b,
-            status="success",
-            message=f"Tarefa {request.id} executada com sucesso. "
-                   f"Módulo A processou, Módulo B retornou {len(resultados_b)} respostas."
-        )
+        response = await orquestrar_tarefa(request)
         print(f"✅ Tarefa {request.id} concluída com sucesso")
         return response
     except Exception as e:
@@ -867,6 +1430,91 @@ async def executar_tarefa(request: ExecutarRequest):
             detail=f"Erro interno na execução da tarefa: {str(e)}"
         )
 
+@app.post("/api/executar/stream")
+async def executar_tarefa_stream(request: ExecutarRequest, format: str = STREAM_NDJSON):
+    """
+    Mesma orquestração de /api/executar, mas as respostas do Módulo B são repassadas
+    ao cliente conforme chegam, em NDJSON (padrão) ou SSE (format=sse).
+    Eventos: resultado_a, resultado_b (um por resposta do stream), done ou error.
+    """
+    if format not in (STREAM_NDJSON, STREAM_SSE):
+        raise HTTPException(status_code=400, detail="format deve ser 'ndjson' ou 'sse'")
+    # O Módulo A é chamado antes de abrir a resposta: uma falha nele ainda vira status HTTP
+    try:
+        resultado_a = await service_client.chamar_servico_a(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro interno na execução da tarefa: {str(e)}")
+
+    def encode(event: str, payload: Dict[str, Any]) -> bytes:
+        data = json_codec.dumps({"event": event, **payload})
+        if format == STREAM_SSE:
+            return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+        return f"{data}\n".encode("utf-8")
+
+    async def body():
+        yield encode("resultado_a", {"request_id": request.id, "resultado_a": resultado_a})
+        count = 0
+        try:
+            async for response_b in service_client.stream_servico_b(
+                request, resultado_a.get("resultado", resultado_a.get("result", ""))
+            ):
+                count += 1
+                yield encode("resultado_b", {"request_id": request.id, "resultado_b": response_b})
+        except Exception as e:
+            # Status HTTP já enviado: o erro segue como último evento do stream
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"❌ Erro no stream da tarefa {request.id}: {detail}")
+            yield encode("error", {"request_id": request.id, "detail": detail, "count": count})
+            return
+        yield encode("done", {"request_id": request.id, "status": "success", "count": count})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if format == STREAM_SSE else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/executar/lote", response_model=ExecutarLoteResponse)
+async def executar_tarefas_lote(requests_lote: List[ExecutarRequest], concurrency: int = EXECUTAR_BULK_CONCURRENCY):
+    """
+    Variante em lote de /api/executar: executa as tarefas simultaneamente, com no
+    máximo `concurrency` em andamento (limitado a EXECUTAR_BULK_CONCURRENCY).
+    A falha de uma tarefa não derruba o lote; os resultados seguem a ordem da entrada.
+    """
+    if len(requests_lote) > EXECUTAR_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Lote com {len(requests_lote)} tarefas (máximo {EXECUTAR_BULK_MAX_ITEMS})"
+        )
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, EXECUTAR_BULK_CONCURRENCY)))
+
+    async def executar(request: ExecutarRequest) -> ExecutarResponse:
+        async with semaphore:
+            try:
+                return await orquestrar_tarefa(request)
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                return ExecutarResponse(
+                    request_id=request.id,
+                    resultado_a={},
+                    resultados_b=[],
+                    status="error",
+                    message=f"Erro na execução da tarefa {request.id}: {detail}"
+                )
+
+    print(f"📨 Recebido lote com {len(requests_lote)} tarefa(s)")
+    results = await asyncio.gather(*(executar(request) for request in requests_lote))
+    failed = sum(1 for result in results if result.status != "success")
+    print(f"✅ Lote concluído: {len(results) - failed} sucesso(s), {failed} falha(s)")
+    return ExecutarLoteResponse(
+        total=len(results),
+        succeeded=len(results) - failed,
+        failed=failed,
+        results=results
+    )
+
 @app.get("/health")
 async def health_check():
     """Endpoint de verificação de saúde do serviço"""
@@ -881,16 +1529,9 @@ async def health_check():
 # CHAT ENDPOINTS
 # ================================
 
-def create_grpc_chat_stream(room_id: str):
-    """
-    Cria um gerador que implementa a interface do ChatStream do gRPC.
-    Isso permite enviar mensagens para o Module A via bidirectional streaming.
-    """
-    # Esta é uma fila que será preenchida conforme mensagens chegam
-    pass  # Será implementado com mais detalhes
-
 @app.websocket("/ws/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str = None):
+async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str = None,
+                             file_protocol: str = PROTOCOL_JSON, history: str = None):
     """
     WebSocket endpoint para chat em tempo real
     Integração com Module A para processamento de mensagens via gRPC
@@ -899,6 +1540,8 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
     Parâmetros:
     - room_id: ID da sala de chat
     - username: Nome do usuário (query parameter)
+    - file_protocol: "json" (padrão, base64 em JSON) ou "binary" (frames binários, ver file_frames.py)
+    - history: "eager" (arquivos inline no histórico) ou "lazy" (só metadados; padrão em WS_HISTORY_MODE)
     
     FLUXO DE MENSAGENS:
     1. Cliente envia mensagem via WebSocket
@@ -912,6 +1555,7 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
     2. Module P busca histórico de mensagens
     3. Para cada arquivo no histórico, recupera do Module B via ReceiveFiles()
     4. Envia arquivo para o novo usuário
+    (no modo lazy os passos 3-4 só ocorrem quando o cliente envia FILE_DOWNLOAD_REQUEST)
     """
     if not username:
         await websocket.close(code=4000, reason="Username is required")
@@ -919,12 +1563,26 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
         http_websocket_requests_total.labels(method='WS', endpoint='/ws/connect', status='failed').inc()
         return
     
+    if file_protocol not in (PROTOCOL_JSON, PROTOCOL_BINARY):
+        file_protocol = PROTOCOL_JSON
+    if history not in (HISTORY_EAGER, HISTORY_LAZY):
+        history = DEFAULT_HISTORY_MODE
+    
+    if not admission.admit_websocket():
+        # Sobrecarga: recusa a conexão nova com a sugestão de quando tentar de novo
+        await websocket.accept()
+        await websocket.close(code=WS_TRY_AGAIN_LATER,
+                              reason=f"Gateway sobrecarregado; retry_after={admission.retry_after}")
+        websocket_connections_total.labels(status='shed').inc()
+        http_websocket_requests_total.labels(method='WS', endpoint='/ws/connect', status='shed').inc()
+        return
+    
     # Gerar ID único para o usuário
     user_id = str(uuid.uuid4())
     
     try:
         start_time = time.time()
-        await manager.connect(websocket, user_id, username, room_id)
+        await manager.connect(websocket, user_id, username, room_id, file_protocol=file_protocol)
         
         # Registrar conexão bem-sucedida
         websocket_connections_total.labels(status='success').inc()
@@ -933,18 +1591,53 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
         http_websocket_request_duration.labels(method='WS', endpoint='/ws/connect').observe(time.time() - start_time)
         logger.info(f"✅ WebSocket conectado: {username} em {room_id}")
         
-        # Enviar histórico de mensagens com arquivos recuperados do Module B
-        await manager.send_message_history(websocket, room_id, chat_client)
+        # Enviar histórico de mensagens (com arquivos recuperados do Module B no modo eager)
+        await manager.send_message_history(websocket, room_id, chat_client, file_protocol=file_protocol,
+                                           history_mode=history)
         
         while True:
-            # Recebe mensagens do cliente WebSocket
+            # Recebe mensagens do cliente WebSocket (texto JSON ou frame binário de arquivo)
             msg_start_time = time.time()
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            ws_message = await websocket.receive()
+            if ws_message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(ws_message.get("code", 1000))
+            
+            if ws_message.get("bytes") is not None:
+                # ========================================
+                # PROTOCOLO BINÁRIO - chunk de arquivo com bytes crus
+                # ========================================
+                try:
+                    file_id, chunk_index, total_chunks, payload = decode_chunk_frame(ws_message["bytes"])
+                    websocket_messages_total.labels(room_id=room_id, type="FILE_CHUNK").inc()
+                    if not await chat_client.add_file_chunk(file_id, bytes(payload), chunk_index, total_chunks):
+                        await manager.send_personal_message({
+                            "type": "SYSTEM",
+                            "content": f"Chunk {chunk_index} do upload {file_id} recusado (envie FILE_START antes dos chunks)",
+                            "timestamp": datetime.now().timestamp(),
+                            "room_id": room_id
+                        }, websocket)
+                except ValueError as e:
+                    logger.error(f"❌ Frame binário inválido: {str(e)}")
+                continue
+            
+            message_data = json_codec.loads(ws_message["text"])
             
             message_type = message_data.get("type", "MESSAGE")
             content = message_data.get("content", "")
             
+            if not admission.admit_frame(message_type):
+                # Frames de baixo valor (digitação) são descartados em silêncio sob carga
+                if message_type == "FILE_DOWNLOAD_REQUEST":
+                    await manager.send_personal_message({
+                        "type": "SYSTEM",
+                        "content": f"Gateway sobrecarregado: tente o download novamente em {admission.retry_after}s",
+                        "file_id": message_data.get("file_id"),
+                        "retry_after": admission.retry_after,
+                        "timestamp": datetime.now().timestamp(),
+                        "room_id": room_id
+                    }, websocket)
+                continue
+            
             # Registrar métrica de mensagem recebida
             websocket_messages_total.labels(room_id=room_id, type=message_type).inc()
             
@@ -953,7 +1646,20 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
             # ========================================
             # INTEGRAÇÃO COM MODULE B - Processamento de Arquivos
             # ========================================
-            if message_type == "FILE_CHUNK":
+            if message_type == "FILE_START":
+                # Início de upload no protocolo binário (metadados; os chunks chegam em frames binários)
+                chat_client.start_file_upload(
+                    file_id=message_data.get("file_id"),
+                    filename=message_data.get("filename", ""),
+                    mime_type=message_data.get("mime_type", "application/octet-stream"),
+                    file_size=message_data.get("file_size", 0),
+                    user_id=user_id,
+                    username=username,
+                    room_id=room_id
+                )
+                continue
+            
+            elif message_type == "FILE_CHUNK":
                 file_id = message_data.get("file_id")
                 chunk_index = message_data.get("chunk_index", 0)
                 total_chunks = message_data.get("total_chunks", 0)
@@ -972,11 +1678,10 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
                         room_id=room_id
                     )
                 
-                # Decodificar base64 e adicionar chunk
+                # Decodificar base64 e adicionar chunk (protocolo JSON legado)
                 try:
-                    import base64
                     chunk_data = base64.b64decode(chunk_data_b64)
-                    chat_client.add_file_chunk(file_id, chunk_data, chunk_index, total_chunks)
+                    await chat_client.add_file_chunk(file_id, chunk_data, chunk_index, total_chunks)
                     logger.info(f"📥 Chunk {chunk_index + 1}/{total_chunks} de {filename} recebido")
                 except Exception as e:
                     logger.error(f"❌ Erro ao processar chunk: {str(e)}")
@@ -984,68 +1689,37 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
                 # IMPORTANTE: Continue para pular o processamento de MESSAGE abaixo
                 continue
             
+            elif message_type == "FILE_DOWNLOAD_REQUEST":
+                # Download sob demanda (histórico lazy ou arquivo ainda não recebido)
+                file_id = message_data.get("file_id")
+                file_message = manager.find_file_message(room_id, file_id)
+                sent = False
+                if file_message is not None:
+                    try:
+                        sent = await manager.send_file(websocket, file_message, chat_client, file_protocol)
+                    except grpc.RpcError as e:
+                        logger.error(f"❌ Erro ao recuperar arquivo {file_id} do Module B: {e.details()}")
+                if sent:
+                    logger.info(f"✅ Arquivo {file_id} enviado sob demanda para {username}")
+                else:
+                    await manager.send_personal_message({
+                        "type": "SYSTEM",
+                        "content": f"Arquivo {message_data.get('filename') or file_id} não está disponível",
+                        "timestamp": datetime.now().timestamp(),
+                        "room_id": room_id
+                    }, websocket)
+                continue
+            
             elif message_type == "FILE_SHARE":
                 file_id = message_data.get("file_id")
                 logger.info(f"📎 Completando upload de arquivo: {file_id}")
                 
                 # Finalizar upload e enviar para Module B
-                upload_result = chat_client.finalize_file_upload(file_id)
+                upload_result = await chat_client.finalize_file_upload(file_id)
                 
                 if upload_result.get("success"):
                     logger.info(f"✅ Arquivo processado e enviado para Module B")
-                    
-                    # Criar mensagem de compartilhamento de arquivo
-                    file_message = {
-                        "message_id": str(uuid.uuid4()),
-                        "file_id": upload_result.get("file_id"),
-                        "filename": upload_result.get("filename"),
-                        "file_size": upload_result.get("file_size"),
-                        "mime_type": upload_result.get("mime_type"),
-                        "user_id": user_id,
-                        "username": username,
-                        "timestamp": datetime.now().timestamp(),
-                        "type": "FILE_SHARE",
-                        "room_id": room_id,
-                        "processed_by": "module_b"
-                    }
-                    
-                    # Armazenar e fazer broadcast para outros usuários na sala (excluindo o uploader)
-                    manager.store_message(room_id, file_message)
-                    await manager.broadcast_to_room(room_id, file_message, exclude_user=user_id)
-                    
-                    # Enviar dados do arquivo em chunks para todos os usuários (exceto uploader que já tem)
-                    file_data_b64 = upload_result.get("file_data_b64", "")
-                    if file_data_b64:
-                        file_size = upload_result.get("file_size", 0)
-                        chunk_size = 512 * 1024  # 512KB chunks para WebSocket
-                        
-                        # Calcular número de chunks
-                        total_chunks = (len(file_data_b64) + chunk_size - 1) // chunk_size
-                        
-                        logger.info(f"📤 Enviando arquivo em {total_chunks} chunks via WebSocket")
-                        
-                        # Enviar cada chunk
-                        for chunk_idx in range(total_chunks):
-                            start = chunk_idx * chunk_size
-                            end = min(start + chunk_size, len(file_data_b64))
-                            chunk = file_data_b64[start:end]
-                            
-                            file_chunk_message = {
-                                "type": "FILE_CHUNK",
-                                "file_id": upload_result.get("file_id"),
-                                "filename": upload_result.get("filename"),
-                                "mime_type": upload_result.get("mime_type"),
-                                "file_size": file_size,
-                                "chunk_index": chunk_idx,
-                                "total_chunks": total_chunks,
-                                "chunk_data": chunk,
-                                "room_id": room_id
-                            }
-                            
-                            # Enviar para outros usuários (excluindo uploader que já tem o arquivo)
-                            await manager.broadcast_to_room(room_id, file_chunk_message, exclude_user=user_id)
-                    
-                    logger.info(f"📤 Arquivo distribuído para sala {room_id}")
+                    await manager.share_file(room_id, upload_result, user_id, username)
                 else:
                     logger.error(f"❌ Erro ao processar arquivo: {upload_result.get('error')}")
                     error_message = {
@@ -1062,27 +1736,7 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
             # ========================================
             # INTEGRAÇÃO COM MODULE A - Processamento de Mensagens
             # ========================================
-            elif message_type == "MESSAGE" and content:
-                logger.info(f"📨 Mensagem recebida de {username}: {content[:50]}...")
-                logger.info(f"🔄 Enviando para Module A processar...")
-                
-                # Processar mensagem via Module A
-                process_result = chat_client.process_message(
-                    username=username,
-                    content=content,
-                    room_id=room_id,
-                    user_id=user_id
-                )
-                
-                # Usar conteúdo processado por Module A
-                processed_content = process_result.get("processed_content", content)
-                
-                logger.info(f"✅ Mensagem processada por Module A: {processed_content[:50]}...")
-            else:
-                processed_content = content
-            
-            # Criar mensagem estruturada com conteúdo processado
-            if message_type == "MESSAGE":
+            elif message_type == "MESSAGE":
                 # Incrementar contador de mensagens
                 websocket_messages_total.labels(room_id=room_id, type='text').inc()
                 
@@ -1090,38 +1744,36 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, username: str =
                     "message_id": str(uuid.uuid4()),
                     "user_id": user_id,
                     "username": username,
-                    "content": processed_content,  # Conteúdo processado por Module A
-                    "original_content": content,  # Conteúdo original (para referência)
+                    "content": content,
                     "timestamp": datetime.now().timestamp(),
                     "type": message_type,
                     "room_id": room_id,
-                    "processed_by": "module_a"
+                    "processing_state": STATE_PENDING
                 }
                 
-                # Armazenar mensagem em memória
-                manager.store_message(room_id, chat_message)
+                if content:
+                    logger.info(f"📨 Mensagem recebida de {username}: {content[:50]}...")
+                    logger.info(f"🔄 Enviando para Module A processar...")
+                
+                # Processar via Module A (uma única vez; o estado fica na própria mensagem)
+                await message_pipeline.process(chat_message)
                 
-                # Broadcast para todos os usuários da sala (exceto o remetente)
-                await manager.broadcast_to_room(room_id, chat_message, exclude_user=user_id)
+                # Armazenar mensagem e fazer broadcast para todos os usuários da sala (exceto o remetente)
+                await manager.publish_message(room_id, chat_message, exclude_user=user_id)
                 
                 logger.info(f"📤 Mensagem distribuída para sala {room_id}")
     except WebSocketDisconnect:
+        chat_client.abort_uploads(user_id)
+        # A saída chega aos outros usuários como PRESENCE_DELTA (leave)
         username = manager.disconnect(user_id, room_id)
         websocket_active_connections.labels(room_id=room_id).dec()
         if username:
-            # Notificar outros usuários sobre a saída
-            await manager.broadcast_to_room(room_id, {
-                "type": "USER_LEAVE",
-                "username": username,
-                "user_id": user_id,
-                "timestamp": datetime.now().timestamp(),
-                "message": f"{username} saiu do chat"
-            })
             logger.info(f"🔌 WebSocket desconectado: {username}")
     except Exception as e:
         logger.error(f"❌ WebSocket error for user {username}: {e}")
         websocket_connections_total.labels(status='failed').inc()
         websocket_active_connections.labels(room_id=room_id).dec()
+        chat_client.abort_uploads(user_id)
         manager.disconnect(user_id, room_id)
 
 @app.post("/api/chat/login")
@@ -1131,31 +1783,10 @@ async def chat_login(request: ChatLoginRequest):
     Integração com Module A: UserService.LoginUser()
     """
     try:
-        # Chamar Module A para validar usuário
-        channel_a = grpc.insecure_channel(
-            f"{os.getenv('MODULO_A_HOST', 'localhost')}:{os.getenv('MODULO_A_PORT', '50051')}"
-        )
-        stub_a = servico_pb2_grpc.UserServiceStub(channel_a)
-        
-        # Enviar requisição para Module A fazer login
-        login_request = servico_pb2.LoginRequest(
-            username=request.username,
-            room_id=request.room_id
-        )
-        
-        response = stub_a.LoginUser(login_request, timeout=10)
-        channel_a.close()
-        
-        return {
-            "success": response.success,
-            "user_id": response.user_id,
-            "username": response.username,
-            "room_id": response.room_id,
-            "message": response.message
-        }
-    except grpc.RpcError as e:
-        logger.error(f"Erro ao chamar Module A para login: {e.details()}")
-        raise HTTPException(status_code=503, detail=f"Erro de autenticação: {e.details()}")
+        # Chamar Module A para validar usuário (erros de gRPC viram 503 no cliente)
+        return await chat_client.login_user(request.username, request.room_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro no login: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro no login: {str(e)}")
@@ -1166,17 +1797,7 @@ async def get_room_users(room_id: str):
     Obter lista de usuários online em uma sala
     """
     try:
-        users = []
-        if room_id in manager.online_users:
-            users = [
-                {
-                    "user_id": user_id,
-                    "username": user_info["username"],
-                    "status": user_info["status"],
-                    "joined_at": user_info["joined_at"]
-                }
-                for user_id, user_info in manager.online_users[room_id].items()
-            ]
+        users = await chat_client.get_online_users(room_id)
         
         return {
             "room_id": room_id,
@@ -1187,19 +1808,28 @@ async def get_room_users(room_id: str):
         raise HTTPException(status_code=500, detail=f"Erro ao obter usuários: {str(e)}")
 
 @app.get("/api/chat/rooms/{room_id}/messages")
-async def get_room_messages(room_id: str, limit: int = 50):
+async def get_room_messages(room_id: str, limit: int = 50, before: int = None, after: int = None,
+                            before_timestamp: float = None, after_timestamp: float = None):
     """
-    Obter histórico de mensagens de uma sala
+    Obter histórico de mensagens de uma sala (mesma semântica de ChatService.GetMessageHistory)
+    - before/after: seq exclusivo (before_cursor/after_cursor de uma página anterior)
+    - before_timestamp/after_timestamp: em segundos, localizados por busca binária
+    Sem cursores retorna as mensagens mais recentes; com o log durável ativo, a rolagem
+    para trás continua além da janela em memória
     """
     try:
-        messages = []
-        if room_id in manager.message_history:
-            messages = manager.message_history[room_id][-limit:]
+        page = await manager.message_history.scrollback(
+            room_id, max(1, min(limit, MAX_HISTORY_LIMIT)), before=before, after=after,
+            before_timestamp=before_timestamp, after_timestamp=after_timestamp
+        )
+        messages = [record.to_dict() for record in page.records]
         
         return {
             "room_id": room_id,
             "messages": messages,
-            "total_count": len(messages)
+            "total_count": len(messages),
+            "before_cursor": page.before_cursor,
+            "after_cursor": page.after_cursor
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter mensagens: {str(e)}")
@@ -1219,12 +1849,13 @@ async def send_message_http(room_id: str, request: ChatMessageRequest):
             "content": request.content,
             "timestamp": datetime.now().timestamp(),
             "type": request.message_type,
-            "room_id": room_id
+            "room_id": room_id,
+            "processing_state": STATE_PENDING
         }
         
-        # Armazenar e broadcast localmente (em produção, seria via Module A)
-        manager.store_message(room_id, chat_message)
-        await manager.broadcast_to_room(room_id, chat_message, exclude_user=request.username)
+        # Processar via Module A pelo mesmo pipeline do WebSocket, armazenar e fazer broadcast
+        await message_pipeline.process(chat_message)
+        await manager.publish_message(room_id, chat_message, exclude_user=request.username)
         
         return {
             "success": True,
@@ -1244,19 +1875,41 @@ class FileUploadRequest(BaseModel):
     room_id: str = "global"
     uploader_id: str
     file_size: int  # em bytes
+    mime_type: str = "application/octet-stream"
+    username: str = ""
 
 @app.post("/api/files/upload")
 async def upload_file(request: FileUploadRequest):
     """
     Endpoint para iniciar upload de arquivo via Module B
     Integração com Module B: FileService.UploadFile() (client-streaming)
+    
+    Cria uma sessão retomável: o corpo bruto das requisições em upload_url é encaminhado
+    direto para um UploadFile aberto (ou para o staging em disco se o Module B estiver fora)
     """
+    if request.file_size > 25 * 1024 * 1024:  # 25MB limit
+        raise HTTPException(status_code=413, detail="Arquivo muito grande (máx 25MB)")
+    if request.file_size <= 0:
+        raise HTTPException(status_code=400, detail="file_size é obrigatório")
+    
     try:
-        if request.file_size > 25 * 1024 * 1024:  # 25MB limit
-            raise HTTPException(status_code=413, detail="Arquivo muito grande (máx 25MB)")
-        
         # Criar sessão de upload
         file_id = str(uuid.uuid4())
+        chat_client.start_file_upload(
+            file_id=file_id,
+            filename=request.filename,
+            mime_type=request.mime_type,
+            file_size=request.file_size,
+            user_id=request.uploader_id,
+            username=request.username or request.uploader_id,
+            room_id=request.room_id,
+            resumable=True,
+            stream_timeout=UPLOAD_SESSION_TTL_SECONDS
+        )
+        upload = chat_client.file_uploads[file_id]
+        if upload["status"] != "in_progress":
+            chat_client.forget_upload(file_id)
+            raise HTTPException(status_code=503, detail=upload.get("error"))
         
         return {
             "success": True,
@@ -1264,70 +1917,180 @@ async def upload_file(request: FileUploadRequest):
             "filename": request.filename,
             "room_id": request.room_id,
             "upload_url": f"/api/files/upload/stream/{file_id}",
+            "offset": 0,
             "max_chunk_size": 1024 * 1024  # 1MB chunks
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao iniciar upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao iniciar upload: {str(e)}")
 
+def _resumable_upload(file_id: str) -> dict:
+    upload = chat_client.file_uploads.get(file_id)
+    if upload is None or not upload["resumable"]:
+        raise HTTPException(status_code=404, detail="Upload não encontrado ou expirado")
+    return upload
+
+@app.head("/api/files/upload/stream/{file_id}")
+async def upload_file_status(file_id: str):
+    """Offset já recebido de um upload retomável (para retomar após uma desconexão)"""
+    upload = _resumable_upload(file_id)
+    return Response(headers={
+        "Upload-Offset": str(upload["offset"]),
+        "Upload-Length": str(upload["metadata"]["file_size"]),
+        "Cache-Control": "no-store"
+    })
+
 @app.post("/api/files/upload/stream/{file_id}")
-async def upload_file_chunk(file_id: str, chunk_data: bytes):
+async def upload_file_chunk(file_id: str, request: Request, upload_offset: int = Header(None)):
     """
     Endpoint para enviar chunks de arquivo para Module B
     Integração com Module B: FileService.UploadFile() streaming
+    
+    O corpo bruto é lido em streaming (sem bufferizar a requisição) e encaminhado a partir do
+    offset informado no cabeçalho Upload-Offset (padrão: offset atual). Se a conexão cair, o
+    que já chegou fica registrado; o cliente consulta o offset (HEAD) e continua dali.
+    Ao completar file_size bytes o arquivo é finalizado e compartilhado na sala.
     """
-    try:
-        # Aqui seria feita a chamada gRPC para Module B com o chunk
-        # Por enquanto, apenas confirmamos o recebimento
+    upload = _resumable_upload(file_id)
+    if upload["lock"].locked():
+        raise HTTPException(status_code=409, detail="Já existe uma requisição em andamento para este upload")
+    
+    async with upload["lock"]:
+        offset = upload["offset"] if upload_offset is None else upload_offset
+        try:
+            async for piece in request.stream():
+                if piece:
+                    offset = await chat_client.append_file_data(file_id, piece, offset)
+        except UploadOffsetError as e:
+            raise HTTPException(status_code=409, detail={"error": str(e), "offset": e.expected})
+        except UploadStreamError as e:
+            raise HTTPException(status_code=422, detail=f"Upload encerrado: {str(e)}")
+        except ClientDisconnect:
+            logger.info(f"🔌 Upload {file_id} interrompido no offset {upload['offset']}")
+            return Response(status_code=204)
         
-        logger.info(f"Chunk recebido para arquivo {file_id}: {len(chunk_data)} bytes")
+        metadata = upload["metadata"]
+        if offset < metadata["file_size"]:
+            logger.info(f"Chunk recebido para arquivo {file_id}: offset {offset}/{metadata['file_size']}")
+            return {"success": True, "file_id": file_id, "offset": offset, "complete": False}
         
-        return {
-            "success": True,
-            "file_id": file_id,
-            "chunk_size": len(chunk_data)
-        }
-    except Exception as e:
-        logger.error(f"Erro ao enviar chunk: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erro ao enviar chunk: {str(e)}")
+        # Último byte recebido: finalizar ainda com o lock (a sessão deixa de existir)
+        upload_result = await chat_client.finalize_file_upload(file_id)
+    
+    if not upload_result.get("success"):
+        raise HTTPException(status_code=502, detail=upload_result.get("error"))
+    file_message = await manager.share_file(
+        metadata["room_id"], upload_result, metadata["user_id"], metadata["username"]
+    )
+    return {"success": True, "file_id": file_id, "offset": offset, "complete": True, "file": file_message}
 
 @app.get("/api/files/room/{room_id}")
-async def get_room_files(room_id: str):
+async def get_room_files(room_id: str, limit: int = 50, cursor: str = None,
+                         uploader: str = None, mime_type: str = None):
     """
     Endpoint para obter lista de arquivos disponíveis em uma sala
-    Integração com Module B: FileService.ReceiveFiles() para listar arquivos
+    Consulta o índice de arquivos do gateway (reconstruído do Module B via FileService.ListFiles),
+    do mais recente para o mais antigo, sem varrer o histórico de mensagens
+    - cursor: next_cursor da página anterior
+    - uploader: user_id ou username de quem enviou
+    - mime_type: exato ("image/png") ou por tipo principal ("image/*")
     """
+    limit = max(1, min(limit, 200))
     try:
-        # Aqui seria feita a chamada gRPC para Module B para listar arquivos
-        files_list = []
-        
-        return {
-            "success": True,
-            "room_id": room_id,
-            "files": files_list,
-            "total_count": len(files_list)
-        }
-    except Exception as e:
-        logger.error(f"Erro ao obter arquivos: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erro ao obter arquivos: {str(e)}")
+        entries, next_cursor = chat_client.file_index.list(
+            room_id, limit=limit, cursor=cursor, uploader=uploader, mime_type=mime_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "room_id": room_id,
+        "files": [entry.to_dict() for entry in entries],
+        "total_count": chat_client.file_index.count(room_id),
+        "next_cursor": next_cursor
+    }
 
 @app.get("/api/files/download/{file_id}")
-async def download_file(file_id: str, room_id: str = "global"):
+async def download_file(file_id: str, room_id: str = "global", range_header: str = Header(None, alias="Range"),
+                        if_none_match: str = Header(None), if_range: str = Header(None)):
     """
     Endpoint para download de arquivo via Module B
     Integração com Module B: FileService.ReceiveFiles() (server-streaming)
+    O conteúdo é repassado ao cliente conforme chega (ou direto do cache do gateway), com
+    Content-Length, ETag/If-None-Match e Range (um intervalo) para cache e retomada de downloads
     """
+    file_info = dict(manager.find_file_message(room_id, file_id) or {})
+    cached = await chat_client.file_cache.get(file_id)
+    pieces = None
     try:
-        # Aqui seria feita a chamada gRPC para Module B para fazer download
+        if cached is not None:
+            file_size = len(cached.data)
+        elif file_info.get("file_size") is not None:
+            # Metadados do FILE_SHARE (ou do índice de arquivos): 304/416 respondidos sem
+            # contatar o Module B
+            file_size = int(file_info["file_size"])
+        else:
+            opened = await chat_client.open_module_b_download(file_id, room_id)
+            if opened is None:
+                raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+            metadata, pieces = opened
+            file_info.update(metadata)
+            file_size = int(metadata["file_size"])
         
-        return {
-            "success": True,
-            "message": "Download iniciado",
-            "file_id": file_id
+        etag = make_etag(file_id, file_size)
+        filename = file_info.get("filename") or file_id
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": FILE_DOWNLOAD_CACHE_CONTROL,
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"
         }
-    except Exception as e:
-        logger.error(f"Erro ao fazer download: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erro ao fazer download: {str(e)}")
+        
+        if etag_matches(if_none_match, etag):
+            if pieces is not None:
+                await pieces.aclose()
+            return Response(status_code=304, headers=headers)
+        
+        byte_range = None
+        if not if_range or if_range == etag:
+            try:
+                byte_range = parse_range(range_header, file_size)
+            except RangeNotSatisfiable:
+                if pieces is not None:
+                    await pieces.aclose()
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file_size}"})
+        start, end = byte_range if byte_range is not None else (0, file_size - 1)
+        headers["Content-Length"] = str(end - start + 1)
+        if byte_range is not None:
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        
+        if file_size == 0:
+            # Arquivo vazio: o ReceiveFiles não devolve nenhum chunk, a resposta é um 200 sem corpo
+            if pieces is not None:
+                await pieces.aclose()
+            body = iter_range(b"", start, end)
+        elif cached is not None:
+            body = iter_range(cached.data, start, end)
+        else:
+            if pieces is None:
+                opened = await chat_client.open_module_b_download(file_id, room_id)
+                if opened is None:
+                    raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+                _, pieces = opened
+            body = slice_pieces(pieces, start, end)
+    except grpc.RpcError as e:
+        logger.error(f"Erro ao fazer download: {e.details()}")
+        raise HTTPException(status_code=503, detail=f"Module B indisponível: {e.details()}")
+    
+    return StreamingResponse(
+        body,
+        status_code=206 if byte_range is not None else 200,
+        media_type=file_info.get("mime_type") or "application/octet-stream",
+        headers=headers
+    )
 
 # Servir arquivos estáticos (frontend)
 @app.get("/")
@@ -0,0 +1,234 @@
+"""
+Backplane de eventos de sala do Módulo P
+Toda mudança de estado de uma sala (mensagem armazenada, broadcast, arquivo
+compartilhado) é publicada como um evento no backplane, e cada processo do
+gateway aplica os eventos que recebe às conexões e ao histórico locais. Todos
+os processos recebem os eventos na mesma ordem, então os históricos (e os seqs
+usados como cursor) ficam idênticos em todos eles.
+
+- local: processo único; o evento é aplicado na hora, sem serialização
+- unix: vários workers (gateway_workers.py) ligados a um hub por socket Unix,
+  que repassa cada frame a todos os workers (inclusive ao que publicou), na
+  ordem em que chegaram. Como o script Lua do backplane redis, o hub reserva o
+  seq de cada mensagem da sala e o prefixa ao frame: um worker que perdeu
+  eventos (desconectado por lentidão ou conectado depois) detecta o salto e
+  recomeça a janela do histórico nele, em vez de numerar as mensagens sozinho
+- redis / memory: réplicas em pods diferentes via pub/sub por sala
+  (ver pubsub_backplane.py); "memory" é o broker falso em processo, para testes
+"""
+
+import asyncio
+import logging
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+BACKPLANE_LOCAL = "local"
+BACKPLANE_UNIX = "unix"
+BACKPLANE_REDIS = "redis"
+BACKPLANE_MEMORY = "memory"
+
+DEFAULT_BUS_SOCKET = "/tmp/modulo_p_bus.sock"
+
+# Frame do barramento: tamanho (uint32) + evento em JSON
+# (do hub para os workers, o JSON vem prefixado por "<seq>|"; seq 0 = evento sem seq)
+FRAME_HEADER = struct.Struct("<I")
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Backplane:
+    """Publicação e entrega ordenada de eventos de sala"""
+
+    name = BACKPLANE_LOCAL
+
+    def __init__(self):
+        self.on_event: Optional[EventHandler] = None
+
+    async def start(self, on_event: EventHandler):
+        self.on_event = on_event
+
+    async def publish(self, event: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def subscribe(self, room_id: str):
+        """Passa a receber os eventos da sala (backplanes que entregam tudo a todos ignoram)"""
+
+    async def unsubscribe(self, room_id: str):
+        """Deixa de receber os eventos da sala (não há mais membros locais)"""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class LocalBackplane(Backplane):
+    """Processo único: o evento (o próprio dict) é aplicado imediatamente"""
+
+    async def publish(self, event: Dict[str, Any]):
+        await self.on_event(event)
+
+
+def split_seq_frame(data: bytes) -> Tuple[int, bytes]:
+    """Separa o seq reservado ("<seq>|") do payload do evento"""
+    seq, _, payload = data.partition(b"|")
+    return int(seq), payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+class UnixSocketBackplane(Backplane):
+    """Cliente do hub local: publica pelo socket e aplica os eventos na ordem do hub"""
+
+    name = BACKPLANE_UNIX
+
+    def __init__(self, path: str = DEFAULT_BUS_SOCKET, reconnect_interval: float = 0.5):
+        super().__init__()
+        self.path = path
+        self.reconnect_interval = reconnect_interval
+        self.published = 0
+        self.received = 0
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, on_event: EventHandler):
+        await super().start(on_event)
+        self._task = asyncio.create_task(self._run())
+        await self._connected.wait()
+
+    async def _run(self):
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                logger.warning(f"⚠️ Hub do backplane indisponível em {self.path}: {e}")
+                await asyncio.sleep(self.reconnect_interval)
+                continue
+            self._connected.set()
+            logger.info(f"🔗 Conectado ao hub do backplane em {self.path}")
+            try:
+                while True:
+                    seq, payload = split_seq_frame(await read_frame(reader))
+                    event = json_codec.loads(payload)
+                    if seq:
+                        event["seq"] = seq
+                    self.received += 1
+                    try:
+                        await self.on_event(event)
+                    except Exception as e:
+                        logger.error(f"❌ Erro ao aplicar evento do backplane: {e}")
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                logger.warning(f"⚠️ Conexão com o hub do backplane perdida: {e}")
+            finally:
+                self._connected.clear()
+                self._writer.close()
+                self._writer = None
+
+    async def publish(self, event: Dict[str, Any]):
+        await self._connected.wait()
+        payload = json_codec.dumps(event).encode("utf-8")
+        self._writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+        self.published += 1
+        await self._writer.drain()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "connected": self._connected.is_set(),
+            "published": self.published,
+            "received": self.received,
+        }
+
+
+class BackplaneHub:
+    """Hub do socket Unix: repassa cada frame recebido a todos os workers conectados"""
+
+    def __init__(self, path: str = DEFAULT_BUS_SOCKET, max_queue: int = 10000):
+        self.path = path
+        self.max_queue = max_queue
+        # Último seq reservado por sala
+        self.seqs: Dict[str, int] = {}
+        self._queues: Dict[asyncio.StreamWriter, asyncio.Queue] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"🛰️ Hub do backplane ouvindo em {self.path}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queue: asyncio.Queue = asyncio.Queue(self.max_queue)
+        self._queues[writer] = queue
+        sender = asyncio.create_task(self._sender(writer, queue))
+        try:
+            while True:
+                data = self._stamp(await read_frame(reader))
+                for peer, peer_queue in list(self._queues.items()):
+                    try:
+                        peer_queue.put_nowait(data)
+                    except asyncio.QueueFull:
+                        # Worker parado: desconecta (ele reconecta, mas perde os eventos do intervalo)
+                        logger.warning("🐢 Worker lento no backplane: desconectando")
+                        self._drop(peer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._drop(writer)
+            sender.cancel()
+
+    def _stamp(self, frame: bytes) -> bytes:
+        """
+        Reserva o seq de um evento "message" na sala e o prefixa ao frame (o JSON não é
+        reserializado). O `next_seq` enviado pelo publicador (próximo seq do histórico dele)
+        faz a numeração continuar de onde o log durável parou depois de um reinício
+        """
+        event = json_codec.loads(frame)
+        seq = 0
+        if event.get("kind") == "message":
+            room_id = event["room_id"]
+            seq = max(self.seqs.get(room_id, 0) + 1, int(event.get("next_seq") or 1))
+            self.seqs[room_id] = seq
+        payload = b"%d|" % seq + frame
+        return FRAME_HEADER.pack(len(payload)) + payload
+
+    async def _sender(self, writer: asyncio.StreamWriter, queue: asyncio.Queue):
+        try:
+            while True:
+                writer.write(await queue.get())
+                await writer.drain()
+        except ConnectionError:
+            self._drop(writer)
+
+    def _drop(self, writer: asyncio.StreamWriter):
+        if self._queues.pop(writer, None) is not None:
+            writer.close()
+
+
+def backplane_from_env() -> Backplane:
+    """GATEWAY_BACKPLANE=local (padrão), unix (GATEWAY_BUS_SOCKET), redis (GATEWAY_REDIS_URL) ou memory"""
+    backend = os.getenv('GATEWAY_BACKPLANE', BACKPLANE_LOCAL).lower()
+    if backend == BACKPLANE_UNIX:
+        return UnixSocketBackplane(os.getenv('GATEWAY_BUS_SOCKET', DEFAULT_BUS_SOCKET))
+    if backend in (BACKPLANE_REDIS, BACKPLANE_MEMORY):
+        from pubsub_backplane import PubSubBackplane
+        return PubSubBackplane.from_env(backend)
+    return LocalBackplane()
@@ -0,0 +1,230 @@
+"""
+Broadcaster do Módulo P
+Cada conexão WebSocket recebe uma fila de saída limitada e uma tarefa
+escritora dedicada. Um broadcast apenas enfileira a mensagem para cada
+destinatário (O(destinatários), sem aguardar escrita de rede), de modo que
+um cliente lento ou meio-morto não atrasa os demais da sala.
+
+Políticas para consumidores lentos (fila cheia):
+- drop_oldest: descarta a mensagem mais antiga da fila
+- coalesce: substitui mensagens de estado equivalentes (ONLINE_USERS, digitação)
+  ainda não enviadas; se não houver o que substituir, descarta a mais antiga
+- disconnect: fecha a conexão do consumidor lento
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge
+
+from file_frames import BinaryFrame
+from json_codec import Frame, dumps
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DAS FILAS DE SAÍDA
+# ==============================================================================
+websocket_send_queue_depth = Gauge(
+    'websocket_send_queue_depth',
+    'Messages waiting in outbound WebSocket queues',
+    ['room_id']
+)
+
+websocket_send_queue_dropped_total = Counter(
+    'websocket_send_queue_dropped_total',
+    'Outbound WebSocket messages dropped or coalesced by the slow consumer policy',
+    ['room_id', 'policy']
+)
+
+websocket_slow_consumer_disconnects_total = Counter(
+    'websocket_slow_consumer_disconnects_total',
+    'WebSocket connections closed because their outbound queue was full',
+    ['room_id']
+)
+# ==============================================================================
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+POLICY_DISCONNECT = "disconnect"
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+
+# Código de fechamento "Try Again Later" para consumidores lentos
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def coalesce_key(message: Any) -> Optional[Tuple[str, str]]:
+    """Chave de mensagens de estado que podem ser substituídas por uma mais nova"""
+    if isinstance(message, Frame):
+        message = message.message
+    if not isinstance(message, dict):
+        return None
+    message_type = message.get("type")
+    if message_type == "ONLINE_USERS":
+        return ("ONLINE_USERS", "")
+    if message_type in ("TYPING_START", "TYPING_STOP"):
+        return ("TYPING", message.get("user_id", ""))
+    return None
+
+
+class ConnectionSender:
+    """Fila de saída limitada e tarefa escritora de uma conexão WebSocket"""
+
+    def __init__(self, websocket: WebSocket, room_id: str, user_id: str,
+                 max_queue: int, policy: str,
+                 on_dead: Optional[Callable[[str, str], Any]] = None):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_dead = on_dead
+        self.closed = False
+        self._queue: Deque[Tuple[Optional[Tuple[str, str]], Any]] = deque()
+        self._wakeup = asyncio.Event()
+        # Serializa escritas da tarefa escritora e dos envios diretos (histórico)
+        self._send_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._writer())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, message: Any) -> bool:
+        """Enfileira sem bloquear; retorna False se a mensagem (ou a conexão) foi descartada"""
+        if self.closed:
+            return False
+
+        key = coalesce_key(message) if self.policy == POLICY_COALESCE else None
+        if key is not None:
+            for index, (queued_key, _) in enumerate(self._queue):
+                if queued_key == key:
+                    # Substitui o estado antigo ainda não enviado
+                    self._queue[index] = (key, message)
+                    websocket_send_queue_dropped_total.labels(room_id=self.room_id, policy=self.policy).inc()
+                    return True
+
+        if len(self._queue) >= self.max_queue:
+            if self.policy == POLICY_DISCONNECT:
+                logger.warning(f"🐢 Consumidor lento {self.user_id} na sala {self.room_id}: desconectando")
+                websocket_slow_consumer_disconnects_total.labels(room_id=self.room_id).inc()
+                self._mark_dead(close=True)
+                return False
+            self._queue.popleft()
+            websocket_send_queue_depth.labels(room_id=self.room_id).dec()
+            websocket_send_queue_dropped_total.labels(room_id=self.room_id, policy=self.policy).inc()
+
+        self._queue.append((key, message))
+        websocket_send_queue_depth.labels(room_id=self.room_id).inc()
+        self._wakeup.set()
+        return True
+
+    async def send_direct(self, message: Any):
+        """Envia imediatamente (fora da fila), sem intercalar com a tarefa escritora"""
+        async with self._send_lock:
+            await self._send(message)
+
+    async def _send(self, message: Any):
+        # Frames já codificados são enviados como estão (serialização única no broadcast)
+        if isinstance(message, BinaryFrame):
+            await self.websocket.send_bytes(message.data)
+            return
+        text = message.text if isinstance(message, Frame) else dumps(message)
+        await self.websocket.send_text(text)
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                _, message = self._queue.popleft()
+                websocket_send_queue_depth.labels(room_id=self.room_id).dec()
+                async with self._send_lock:
+                    await self._send(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error broadcasting to user {self.user_id}: {e}")
+            self._mark_dead(close=False)
+
+    def _mark_dead(self, close: bool):
+        if self.closed:
+            return
+        self.close()
+        if close:
+            asyncio.create_task(self._close_websocket())
+        if self.on_dead is not None:
+            self.on_dead(self.user_id, self.room_id)
+
+    async def _close_websocket(self):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Slow consumer")
+        except Exception:
+            pass
+
+    def close(self):
+        """Para a tarefa escritora e descarta o que ainda estava na fila"""
+        self.closed = True
+        if self._queue:
+            websocket_send_queue_depth.labels(room_id=self.room_id).dec(len(self._queue))
+            self._queue.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+class Broadcaster:
+    """Registro de ConnectionSender por (sala, usuário) e fan-out por enfileiramento"""
+
+    def __init__(self, max_queue: int = 256, policy: str = POLICY_DROP_OLDEST,
+                 on_dead: Optional[Callable[[str, str], Any]] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de consumidor lento inválida: {policy}")
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.on_dead = on_dead
+        self.senders: Dict[Tuple[str, str], ConnectionSender] = {}
+        self._by_websocket: Dict[int, ConnectionSender] = {}
+
+    @classmethod
+    def from_env(cls, on_dead: Optional[Callable[[str, str], Any]] = None) -> "Broadcaster":
+        return cls(
+            max_queue=int(os.getenv('WS_SEND_QUEUE_SIZE', '256')),
+            policy=os.getenv('WS_SLOW_CONSUMER_POLICY', POLICY_DROP_OLDEST),
+            on_dead=on_dead
+        )
+
+    def register(self, room_id: str, user_id: str, websocket: WebSocket) -> ConnectionSender:
+        self.unregister(room_id, user_id)
+        sender = ConnectionSender(websocket, room_id, user_id, self.max_queue, self.policy, self.on_dead)
+        self.senders[(room_id, user_id)] = sender
+        self._by_websocket[id(websocket)] = sender
+        return sender
+
+    def unregister(self, room_id: str, user_id: str):
+        sender = self.senders.pop((room_id, user_id), None)
+        if sender is not None:
+            self._by_websocket.pop(id(sender.websocket), None)
+            sender.close()
+
+    def sender_for(self, websocket: WebSocket) -> Optional[ConnectionSender]:
+        return self._by_websocket.get(id(websocket))
+
+    def broadcast(self, room_id: str, user_ids, message: Any) -> int:
+        """Enfileira a mensagem para cada usuário; retorna quantos a aceitaram"""
+        delivered = 0
+        for user_id in user_ids:
+            sender = self.senders.get((room_id, user_id))
+            if sender is not None and sender.enqueue(message):
+                delivered += 1
+        return delivered
+
+    def queue_depths(self) -> Dict[str, int]:
+        depths: Dict[str, int] = {}
+        for (room_id, _), sender in self.senders.items():
+            depths[room_id] = depths.get(room_id, 0) + sender.depth
+        return depths
@@ -0,0 +1,230 @@
+"""
+Gerenciador de canais gRPC do Módulo P
+Mantém um pool de canais grpc.aio persistentes (já conectados) por backend e
+distribui as chamadas entre eles por round-robin ou menor carga. Uma única
+conexão HTTP/2 limita o número de streams simultâneos, então várias conexões
+por backend evitam esse teto em taxas altas de mensagens.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import grpc
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO POOL DE CANAIS
+# ==============================================================================
+grpc_channel_pool_size = Gauge(
+    'grpc_channel_pool_size',
+    'Number of gRPC channels kept open per backend',
+    ['backend']
+)
+
+grpc_channel_pool_inflight = Gauge(
+    'grpc_channel_pool_inflight',
+    'In-flight calls/streams per pooled gRPC channel',
+    ['backend', 'channel']
+)
+
+grpc_channel_pool_calls_total = Counter(
+    'grpc_channel_pool_calls_total',
+    'Calls dispatched per pooled gRPC channel',
+    ['backend', 'channel']
+)
+
+grpc_channel_pool_saturated_total = Counter(
+    'grpc_channel_pool_saturated_total',
+    'Dispatches made while every channel of the pool was at its stream limit',
+    ['backend']
+)
+# ==============================================================================
+
+STRATEGY_ROUND_ROBIN = "round_robin"
+STRATEGY_LEAST_LOADED = "least_loaded"
+
+
+def default_channel_options() -> List[Tuple[str, int]]:
+    """Opções de canal (keepalive/HTTP2) configuráveis por variáveis de ambiente"""
+    return [
+        ("grpc.keepalive_time_ms", int(os.getenv('GRPC_KEEPALIVE_TIME_MS', '30000'))),
+        ("grpc.keepalive_timeout_ms", int(os.getenv('GRPC_KEEPALIVE_TIMEOUT_MS', '10000'))),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        # Cada canal do pool abre sua própria conexão (sem compartilhar subchannels)
+        ("grpc.use_local_subchannel_pool", 1),
+        ("grpc.max_send_message_length", 8 * 1024 * 1024),
+        ("grpc.max_receive_message_length", 8 * 1024 * 1024),
+    ]
+
+
+class PooledChannel:
+    """Canal do pool com contagem de chamadas em andamento"""
+
+    def __init__(self, backend: str, index: int, channel: grpc.aio.Channel):
+        self.backend = backend
+        self.index = index
+        self.channel = channel
+        self.inflight = 0
+
+
+class ChannelPool:
+    """Pool de canais grpc.aio persistentes para um único backend"""
+
+    def __init__(self, backend: str, target: str, size: int = 4,
+                 strategy: str = STRATEGY_ROUND_ROBIN,
+                 max_streams_per_channel: int = 100,
+                 options: Optional[List[Tuple[str, int]]] = None):
+        if strategy not in (STRATEGY_ROUND_ROBIN, STRATEGY_LEAST_LOADED):
+            raise ValueError(f"Estratégia de pool inválida: {strategy}")
+        self.backend = backend
+        self.target = target
+        self.size = max(1, size)
+        self.strategy = strategy
+        self.max_streams_per_channel = max_streams_per_channel
+        self.options = options if options is not None else default_channel_options()
+        self._channels: List[PooledChannel] = []
+        self._round_robin = itertools.count()
+
+    def _ensure_channels(self):
+        # Criação preguiçosa: os canais grpc.aio precisam do event loop em execução
+        if not self._channels:
+            for index in range(self.size):
+                channel = grpc.aio.insecure_channel(self.target, options=self.options)
+                self._channels.append(PooledChannel(self.backend, index, channel))
+            grpc_channel_pool_size.labels(backend=self.backend).set(self.size)
+            logger.info(f"🔗 Pool gRPC '{self.backend}' criado: {self.size} canais para {self.target} ({self.strategy})")
+
+    def _pick(self) -> PooledChannel:
+        self._ensure_channels()
+        start = next(self._round_robin) % self.size
+
+        if self.strategy == STRATEGY_LEAST_LOADED:
+            # Menor número de chamadas em andamento; empate resolvido pela ordem round-robin
+            candidate = min(
+                (self._channels[(start + offset) % self.size] for offset in range(self.size)),
+                key=lambda pooled: pooled.inflight
+            )
+        else:
+            # Round-robin, pulando canais que atingiram o limite de streams
+            candidate = self._channels[start]
+            for offset in range(self.size):
+                pooled = self._channels[(start + offset) % self.size]
+                if pooled.inflight < self.max_streams_per_channel:
+                    candidate = pooled
+                    break
+
+        if candidate.inflight >= self.max_streams_per_channel:
+            grpc_channel_pool_saturated_total.labels(backend=self.backend).inc()
+        return candidate
+
+    def acquire(self) -> PooledChannel:
+        """Seleciona um canal e marca uma chamada em andamento (liberar com release())"""
+        pooled = self._pick()
+        pooled.inflight += 1
+        grpc_channel_pool_inflight.labels(backend=self.backend, channel=str(pooled.index)).set(pooled.inflight)
+        grpc_channel_pool_calls_total.labels(backend=self.backend, channel=str(pooled.index)).inc()
+        return pooled
+
+    def release(self, pooled: PooledChannel):
+        pooled.inflight = max(0, pooled.inflight - 1)
+        grpc_channel_pool_inflight.labels(backend=self.backend, channel=str(pooled.index)).set(pooled.inflight)
+
+    async def warm_up(self, timeout: float = 5.0) -> int:
+        """Estabelece as conexões de todos os canais; retorna quantos ficaram prontos"""
+        self._ensure_channels()
+        results = await asyncio.gather(
+            *(asyncio.wait_for(pooled.channel.channel_ready(), timeout) for pooled in self._channels),
+            return_exceptions=True
+        )
+        ready = sum(1 for result in results if not isinstance(result, Exception))
+        logger.info(f"🔥 Pool gRPC '{self.backend}': {ready}/{self.size} canais prontos")
+        return ready
+
+    def available(self) -> bool:
+        """False quando todos os canais já criados estão em falha de conexão"""
+        if not self._channels:
+            return True
+        return any(
+            pooled.channel.get_state(try_to_connect=False) != grpc.ChannelConnectivity.TRANSIENT_FAILURE
+            for pooled in self._channels
+        )
+
+    def inflight(self) -> int:
+        return sum(pooled.inflight for pooled in self._channels)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "target": self.target,
+            "size": self.size,
+            "strategy": self.strategy,
+            "max_streams_per_channel": self.max_streams_per_channel,
+            "inflight": [pooled.inflight for pooled in self._channels],
+        }
+
+    async def close(self):
+        for pooled in self._channels:
+            await pooled.channel.close()
+            grpc_channel_pool_inflight.labels(backend=self.backend, channel=str(pooled.index)).set(0)
+        self._channels = []
+        grpc_channel_pool_size.labels(backend=self.backend).set(0)
+
+
+class ChannelManager:
+    """Mantém um ChannelPool por backend (ex.: 'modulo_a', 'modulo_b')"""
+
+    def __init__(self):
+        self.pools: Dict[str, ChannelPool] = {}
+
+    def register(self, backend: str, target: str, **pool_kwargs) -> ChannelPool:
+        self.pools[backend] = ChannelPool(backend, target, **pool_kwargs)
+        return self.pools[backend]
+
+    @classmethod
+    def from_env(cls) -> "ChannelManager":
+        """Cria os pools dos módulos A e B a partir das variáveis de ambiente"""
+        manager = cls()
+        pool_kwargs = {
+            "size": int(os.getenv('GRPC_POOL_SIZE', '4')),
+            "strategy": os.getenv('GRPC_POOL_STRATEGY', STRATEGY_ROUND_ROBIN),
+            "max_streams_per_channel": int(os.getenv('GRPC_MAX_CONCURRENT_STREAMS', '100')),
+        }
+        manager.register(
+            "modulo_a",
+            f"{os.getenv('MODULO_A_HOST', 'localhost')}:{os.getenv('MODULO_A_PORT', '50051')}",
+            **pool_kwargs
+        )
+        manager.register(
+            "modulo_b",
+            f"{os.getenv('MODULO_B_HOST', 'localhost')}:{os.getenv('MODULO_B_PORT', '50052')}",
+            **pool_kwargs
+        )
+        return manager
+
+    def acquire(self, backend: str) -> PooledChannel:
+        return self.pools[backend].acquire()
+
+    def release(self, pooled: PooledChannel):
+        self.pools[pooled.backend].release(pooled)
+
+    def available(self, backend: str) -> bool:
+        return self.pools[backend].available()
+
+    async def warm_up(self, timeout: float = 5.0):
+        await asyncio.gather(*(pool.warm_up(timeout) for pool in self.pools.values()))
+
+    def inflight(self) -> int:
+        """Chamadas em andamento somando todos os backends"""
+        return sum(pool.inflight() for pool in self.pools.values())
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {backend: pool.stats() for backend, pool in self.pools.items()}
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
@@ -0,0 +1,202 @@
+"""
+Cache de arquivos do Módulo P
+LRU limitado em bytes, indexado por file_id, que guarda os bytes crus de cada
+arquivo compartilhado e, sob demanda, a forma já codificada para transferência
+(base64 do protocolo JSON). É preenchido no upload e na primeira leitura do
+Módulo B, de modo que o replay do histórico para quem entra na sala não volta
+a baixar, montar e codificar o arquivo a cada novo usuário.
+
+Entradas expulsas da memória podem ser despejadas em disco (FILE_CACHE_SPILL_DIR),
+com um segundo limite de bytes; um acerto em disco promove a entrada de volta.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO CACHE DE ARQUIVOS
+# ==============================================================================
+file_cache_hits_total = Counter(
+    'file_cache_hits_total',
+    'File cache hits',
+    ['tier']  # memory ou disk
+)
+
+file_cache_misses_total = Counter(
+    'file_cache_misses_total',
+    'File cache misses (file fetched from Module B)'
+)
+
+file_cache_evictions_total = Counter(
+    'file_cache_evictions_total',
+    'Entries evicted from a file cache tier',
+    ['tier']
+)
+
+file_cache_bytes = Gauge(
+    'file_cache_bytes',
+    'Bytes held by the file cache',
+    ['tier']
+)
+# ==============================================================================
+
+
+class CachedFile:
+    """Conteúdo de um arquivo em cache (somente leitura)"""
+
+    __slots__ = ("file_id", "data", "data_b64")
+
+    def __init__(self, file_id: str, data: bytes):
+        self.file_id = file_id
+        self.data = data
+        # Forma de transferência do protocolo JSON, codificada uma única vez (ver FileCache.base64)
+        self.data_b64: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + (len(self.data_b64) if self.data_b64 is not None else 0)
+
+
+class FileCache:
+    """LRU de arquivos limitado em bytes, com despejo opcional em disco"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024,
+                 spill_dir: Optional[str] = None,
+                 spill_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._memory: "OrderedDict[str, CachedFile]" = OrderedDict()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "FileCache":
+        return cls(
+            max_bytes=int(os.getenv('FILE_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+            spill_dir=os.getenv('FILE_CACHE_SPILL_DIR') or None,
+            spill_max_bytes=int(os.getenv('FILE_CACHE_SPILL_MAX_BYTES', str(1024 * 1024 * 1024)))
+        )
+
+    def accepts(self, size: int) -> bool:
+        """Indica se um arquivo desse tamanho cabe no cache"""
+        return 0 < size <= self.max_bytes
+
+    async def get(self, file_id: str) -> Optional[CachedFile]:
+        entry = self._memory.get(file_id)
+        if entry is not None:
+            self._memory.move_to_end(file_id)
+            file_cache_hits_total.labels(tier="memory").inc()
+            return entry
+
+        if file_id in self._disk:
+            try:
+                data = await asyncio.to_thread(self._read_spill, file_id)
+            except OSError as e:
+                logger.warning(f"⚠️ Falha ao ler arquivo {file_id} do cache em disco: {e}")
+                self._drop_spill(file_id)
+            else:
+                file_cache_hits_total.labels(tier="disk").inc()
+                self._disk.move_to_end(file_id)
+                return await self._insert(CachedFile(file_id, data))
+
+        file_cache_misses_total.inc()
+        return None
+
+    async def put(self, file_id: str, data: bytes) -> Optional[CachedFile]:
+        """Guarda o arquivo; retorna None se ele for maior que o cache inteiro"""
+        if not self.accepts(len(data)):
+            return None
+        self.invalidate(file_id)
+        return await self._insert(CachedFile(file_id, bytes(data)))
+
+    async def base64(self, entry: CachedFile) -> str:
+        """base64 do arquivo, codificado na primeira vez e reaproveitado depois"""
+        if entry.data_b64 is None:
+            entry.data_b64 = base64.b64encode(entry.data).decode("ascii")
+            if self._memory.get(entry.file_id) is entry:
+                self.memory_bytes += len(entry.data_b64)
+                await self._evict()
+        return entry.data_b64
+
+    def invalidate(self, file_id: str):
+        entry = self._memory.pop(file_id, None)
+        if entry is not None:
+            self.memory_bytes -= entry.size
+        if file_id in self._disk:
+            self._drop_spill(file_id)
+        self._update_gauges()
+
+    async def _insert(self, entry: CachedFile) -> CachedFile:
+        self._memory[entry.file_id] = entry
+        self.memory_bytes += entry.size
+        await self._evict()
+        return entry
+
+    async def _evict(self):
+        while self.memory_bytes > self.max_bytes and self._memory:
+            file_id, entry = self._memory.popitem(last=False)
+            self.memory_bytes -= entry.size
+            file_cache_evictions_total.labels(tier="memory").inc()
+            if self.spill_dir and file_id not in self._disk and len(entry.data) <= self.spill_max_bytes:
+                try:
+                    await asyncio.to_thread(self._write_spill, file_id, entry.data)
+                except OSError as e:
+                    logger.warning(f"⚠️ Falha ao despejar arquivo {file_id} em disco: {e}")
+                    continue
+                self._disk[file_id] = len(entry.data)
+                self.disk_bytes += len(entry.data)
+                while self.disk_bytes > self.spill_max_bytes and self._disk:
+                    oldest = next(iter(self._disk))
+                    self._drop_spill(oldest)
+                    file_cache_evictions_total.labels(tier="disk").inc()
+        self._update_gauges()
+
+    def _spill_path(self, file_id: str) -> str:
+        # file_id vem do cliente: o nome em disco é um hash, nunca o id cru
+        return os.path.join(self.spill_dir, hashlib.sha256(file_id.encode("utf-8")).hexdigest())
+
+    def _write_spill(self, file_id: str, data: bytes):
+        path = self._spill_path(file_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_spill(self, file_id: str) -> bytes:
+        with open(self._spill_path(file_id), "rb") as f:
+            return f.read()
+
+    def _drop_spill(self, file_id: str):
+        size = self._disk.pop(file_id, 0)
+        self.disk_bytes -= size
+        try:
+            os.remove(self._spill_path(file_id))
+        except OSError:
+            pass
+        self._update_gauges()
+
+    def _update_gauges(self):
+        file_cache_bytes.labels(tier="memory").set(self.memory_bytes)
+        file_cache_bytes.labels(tier="disk").set(self.disk_bytes)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "max_bytes": self.max_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+        }
@@ -0,0 +1,78 @@
+"""
+Protocolo binário de transferência de arquivos do WebSocket /ws/{room_id}
+Em vez de base64 dentro de JSON, cada chunk vai em um frame binário:
+
+    +------+--------+-------------+--------------+---------+-------------+
+    | kind | id_len | chunk_index | total_chunks | file_id | chunk bytes |
+    |  u8  |   u8   |  u32 (BE)   |   u32 (BE)   | id_len  |   restante  |
+    +------+--------+-------------+--------------+---------+-------------+
+
+Upload (cliente -> gateway):
+    1. frame de texto {"type": "FILE_START", file_id, filename, mime_type, file_size, total_chunks}
+    2. N frames binários FILE_CHUNK
+    3. frame de texto {"type": "FILE_SHARE", file_id}
+
+Distribuição (gateway -> clientes conectados com ?file_protocol=binary):
+    1. frame de texto {"type": "FILE_START", ...metadados}
+    2. N frames binários FILE_CHUNK com os bytes crus
+
+Clientes antigos continuam usando FILE_CHUNK em JSON com chunk_data em base64.
+"""
+
+import struct
+from typing import Tuple
+
+KIND_FILE_CHUNK = 0x01
+
+HEADER = struct.Struct("!BBII")
+
+# Protocolos de arquivo negociados por conexão
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+
+# Tamanho dos chunks de distribuição. Múltiplo de 3 para que o base64 de cada
+# chunk (caminho JSON) possa ser concatenado pelo cliente sem padding no meio.
+DISTRIBUTION_CHUNK_SIZE = 384 * 1024
+
+
+class BinaryFrame:
+    """Frame binário já codificado, compartilhado por todos os destinatários"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def encode_chunk_frame(file_id: str, chunk_index: int, total_chunks: int, chunk_data) -> bytes:
+    """Monta o frame binário de um chunk (cabeçalho + bytes crus)"""
+    file_id_bytes = file_id.encode("utf-8")
+    if len(file_id_bytes) > 255:
+        raise ValueError("file_id excede 255 bytes")
+    header = HEADER.pack(KIND_FILE_CHUNK, len(file_id_bytes), chunk_index, total_chunks)
+    return b"".join((header, file_id_bytes, chunk_data))
+
+
+def decode_chunk_frame(frame: bytes) -> Tuple[str, int, int, memoryview]:
+    """
+    Lê um frame binário de chunk
+    Retorna (file_id, chunk_index, total_chunks, payload) sem copiar os bytes do payload
+    """
+    if len(frame) < HEADER.size:
+        raise ValueError("Frame binário menor que o cabeçalho")
+    kind, id_len, chunk_index, total_chunks = HEADER.unpack_from(frame)
+    if kind != KIND_FILE_CHUNK:
+        raise ValueError(f"Tipo de frame binário desconhecido: {kind}")
+    id_end = HEADER.size + id_len
+    if len(frame) < id_end:
+        raise ValueError("Frame binário truncado")
+    view = memoryview(frame)
+    file_id = bytes(view[HEADER.size:id_end]).decode("utf-8")
+    return file_id, chunk_index, total_chunks, view[id_end:]
+
+
+def chunk_count(file_size: int, chunk_size: int = DISTRIBUTION_CHUNK_SIZE) -> int:
+    return max(1, (file_size + chunk_size - 1) // chunk_size)
@@ -0,0 +1,208 @@
+"""
+Índice de arquivos por sala do Módulo P
+Mantém, para cada sala, os metadados dos arquivos compartilhados (file_id, nome,
+tamanho, mime e quem enviou) em ordem de envio, com índices secundários por
+uploader e por mime type. A listagem é paginada por cursor (o `seq` do último
+item devolvido) e custa O(log n + página), sem varrer o histórico de mensagens.
+
+É atualizado a cada upload finalizado e reconstruído a partir do Módulo B
+(FileService.ListFiles) na inicialização. A reconstrução pode terminar depois
+de uploads novos já indexados, então os arquivos reconstruídos recebem seqs
+abaixo de todos os demais (0, -1, -2, ...), em ordem de uploaded_at. O mime
+type indexado é sempre o detectado pelo Módulo B.
+"""
+
+import itertools
+import logging
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FileEntry:
+    """Metadados de um arquivo indexado"""
+
+    __slots__ = ("seq", "file_id", "filename", "file_size", "mime_type",
+                 "user_id", "username", "room_id", "uploaded_at")
+
+    def __init__(self, seq: int, file_id: str, filename: str, file_size: int, mime_type: str,
+                 user_id: str, username: str, room_id: str, uploaded_at: float):
+        self.seq = seq
+        self.file_id = file_id
+        self.filename = filename
+        self.file_size = file_size
+        self.mime_type = mime_type
+        self.user_id = user_id
+        self.username = username
+        self.room_id = room_id
+        self.uploaded_at = uploaded_at
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "file_size": self.file_size,
+            "mime_type": self.mime_type,
+            "user_id": self.user_id,
+            "username": self.username,
+            "room_id": self.room_id,
+            "uploaded_at": self.uploaded_at,
+        }
+
+
+class RoomFiles:
+    """Arquivos de uma sala: seqs ordenados + índices secundários (listas de seqs ordenadas)"""
+
+    __slots__ = ("entries", "seqs", "by_uploader", "by_mime", "by_major")
+
+    def __init__(self):
+        self.entries: Dict[int, FileEntry] = {}
+        self.seqs: List[int] = []
+        self.by_uploader: Dict[str, List[int]] = {}
+        self.by_mime: Dict[str, List[int]] = {}
+        # Tipo principal do mime ("image" de "image/png"), para filtros como image/*
+        self.by_major: Dict[str, List[int]] = {}
+
+    def _keys(self, entry: FileEntry):
+        for uploader in {entry.user_id, entry.username} - {""}:
+            yield self.by_uploader, uploader
+        yield self.by_mime, entry.mime_type
+        yield self.by_major, entry.mime_type.split("/", 1)[0]
+
+    def add(self, entry: FileEntry):
+        self.entries[entry.seq] = entry
+        _insert_sorted(self.seqs, entry.seq)
+        for index, key in self._keys(entry):
+            _insert_sorted(index.setdefault(key, []), entry.seq)
+
+    def remove(self, entry: FileEntry):
+        self.entries.pop(entry.seq, None)
+        _remove_sorted(self.seqs, entry.seq)
+        for index, key in self._keys(entry):
+            seqs = index.get(key)
+            if seqs is not None:
+                _remove_sorted(seqs, entry.seq)
+                if not seqs:
+                    del index[key]
+
+
+def _insert_sorted(seqs: List[int], seq: int):
+    # Uploads novos têm o maior seq (append); só a reconstrução insere no meio
+    if not seqs or seq > seqs[-1]:
+        seqs.append(seq)
+    else:
+        insort(seqs, seq)
+
+
+def _remove_sorted(seqs: List[int], seq: int):
+    position = bisect_left(seqs, seq)
+    if position < len(seqs) and seqs[position] == seq:
+        del seqs[position]
+
+
+class FileIndex:
+    """Índice de arquivos por sala com paginação por cursor (mais recentes primeiro)"""
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomFiles] = {}
+        self._by_file: Dict[str, FileEntry] = {}
+        self._seq = itertools.count(1)
+        # Seqs dos arquivos reconstruídos do Módulo B: decrescentes, abaixo dos uploads ao vivo
+        self._rebuilt_seq = itertools.count(0, -1)
+
+    def add(self, room_id: str, file_id: str, filename: str, file_size: int, mime_type: str,
+            user_id: str, username: str, uploaded_at: float, seq: Optional[int] = None) -> FileEntry:
+        """Indexa um arquivo (um file_id reenviado substitui a entrada anterior)"""
+        self.remove(file_id)
+        entry = FileEntry(next(self._seq) if seq is None else seq, file_id, filename, int(file_size),
+                          mime_type or "application/octet-stream", user_id, username, room_id, uploaded_at)
+        self._rooms.setdefault(room_id, RoomFiles()).add(entry)
+        self._by_file[file_id] = entry
+        return entry
+
+    def remove(self, file_id: str):
+        entry = self._by_file.pop(file_id, None)
+        if entry is not None:
+            self._rooms[entry.room_id].remove(entry)
+
+    def get(self, file_id: str) -> Optional[FileEntry]:
+        return self._by_file.get(file_id)
+
+    def count(self, room_id: str) -> int:
+        room = self._rooms.get(room_id)
+        return len(room.seqs) if room is not None else 0
+
+    def list(self, room_id: str, limit: int = 50, cursor: Optional[str] = None,
+             uploader: Optional[str] = None, mime_type: Optional[str] = None
+             ) -> Tuple[List[FileEntry], Optional[str]]:
+        """
+        Página de arquivos da sala, do mais recente para o mais antigo
+        - cursor: valor de next_cursor da página anterior
+        - uploader: user_id ou username de quem enviou
+        - mime_type: exato ("image/png") ou por tipo principal ("image/*")
+        Retorna (entradas, next_cursor); next_cursor é None na última página
+        """
+        room = self._rooms.get(room_id)
+        if room is None or limit <= 0:
+            return [], None
+
+        candidates = [room.seqs]
+        if uploader:
+            candidates.append(room.by_uploader.get(uploader, []))
+        if mime_type:
+            if mime_type.endswith("/*"):
+                candidates.append(room.by_major.get(mime_type[:-2], []))
+            else:
+                candidates.append(room.by_mime.get(mime_type, []))
+        # Percorre a menor lista; os demais filtros são conferidos por entrada
+        seqs = min(candidates, key=len)
+
+        end = len(seqs)
+        if cursor:
+            try:
+                end = bisect_left(seqs, int(cursor))
+            except ValueError:
+                raise ValueError("Cursor inválido")
+
+        page: List[FileEntry] = []
+        position = end - 1
+        while position >= 0 and len(page) < limit:
+            entry = room.entries[seqs[position]]
+            if self._matches(entry, uploader, mime_type):
+                page.append(entry)
+            position -= 1
+
+        next_cursor = str(page[-1].seq) if page and position >= 0 else None
+        return page, next_cursor
+
+    @staticmethod
+    def _matches(entry: FileEntry, uploader: Optional[str], mime_type: Optional[str]) -> bool:
+        if uploader and uploader not in (entry.user_id, entry.username):
+            return False
+        if mime_type:
+            if mime_type.endswith("/*"):
+                return entry.mime_type.split("/", 1)[0] == mime_type[:-2]
+            return entry.mime_type == mime_type
+        return True
+
+    async def rebuild(self, backend, room_ids: Optional[List[str]] = None) -> int:
+        """
+        Reconstrói o índice a partir do Módulo B (ListFiles), em ordem de envio
+        Sem room_ids, lista todas as salas; arquivos já indexados são mantidos
+        """
+        files = []
+        for room_id in room_ids or [""]:
+            response = await backend.list_files(room_id)
+            files.extend(response.files)
+
+        added = 0
+        # Do mais novo para o mais antigo: cada um recebe um seq menor que o anterior
+        for info in sorted(files, key=lambda f: int(f.uploaded_at), reverse=True):
+            if info.file_id in self._by_file:
+                continue
+            self.add(info.room_id, info.file_id, info.filename, info.file_size, info.mime_type,
+                     info.user_id, info.username, int(info.uploaded_at) / 1000, seq=next(self._rebuilt_seq))
+            added += 1
+        logger.info(f"🗂️ Índice de arquivos reconstruído: {added} arquivo(s) do Module B")
+        return added
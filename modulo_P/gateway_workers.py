@@ -0,0 +1,59 @@
+"""
+Inicialização do Módulo P com vários workers
+Com GATEWAY_WORKERS > 1, sobe o hub do backplane (socket Unix) numa thread do
+processo principal e inicia o uvicorn com N workers, todos ligados ao hub:
+mensagens publicadas em qualquer worker chegam às salas em todos os outros.
+Com GATEWAY_WORKERS=1 (padrão) equivale a um uvicorn de processo único.
+
+Uploads HTTP retomáveis (/api/files/upload/stream) guardam a sessão no worker
+que a abriu; com vários workers o balanceador deve manter afinidade por file_id.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+import uvicorn
+
+from backplane import BACKPLANE_UNIX, DEFAULT_BUS_SOCKET, BackplaneHub
+
+logger = logging.getLogger(__name__)
+
+
+def start_hub(path: str) -> threading.Thread:
+    """Roda o hub num event loop próprio; retorna após o socket estar ouvindo"""
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        hub = BackplaneHub(path)
+        loop.run_until_complete(hub.start())
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="backplane-hub", daemon=True)
+    thread.start()
+    ready.wait()
+    return thread
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    workers = int(os.getenv('GATEWAY_WORKERS', '1'))
+    host = os.getenv('GATEWAY_HOST', '0.0.0.0')
+    port = int(os.getenv('GATEWAY_PORT', '8000'))
+
+    if workers > 1:
+        path = os.getenv('GATEWAY_BUS_SOCKET', DEFAULT_BUS_SOCKET)
+        start_hub(path)
+        # Herdado pelos workers do uvicorn
+        os.environ['GATEWAY_BACKPLANE'] = BACKPLANE_UNIX
+        os.environ['GATEWAY_BUS_SOCKET'] = path
+        print(f"🧵 Iniciando {workers} workers ligados ao hub {path}")
+
+    uvicorn.run("app:app", host=host, port=port, workers=workers, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Servidor gRPC do Módulo P
+Expõe ChatService.GetMessageHistory (server-streaming) sobre o histórico em
+memória do gateway, com a mesma paginação por cursor do endpoint HTTP
+/api/chat/rooms/{room_id}/messages. ChatStream continua a cargo do Módulo A.
+"""
+
+import logging
+import os
+from typing import Optional
+
+import grpc
+
+import servico_pb2
+import servico_pb2_grpc
+
+from history_store import HistoryStore, MessageRecord
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 500
+
+
+def _optional(value: int) -> Optional[int]:
+    # proto3: 0 é o valor padrão, tratado como "não informado"
+    return value if value > 0 else None
+
+
+def _to_chat_message(record: MessageRecord) -> servico_pb2.ChatMessage:
+    message_type = record.get("type", "MESSAGE")
+    return servico_pb2.ChatMessage(
+        message_id=record.get("message_id", ""),
+        user_id=record.get("user_id", ""),
+        username=record.get("username", ""),
+        content=record.get("content") or record.get("filename") or "",
+        timestamp=int(record.get("timestamp", 0) * 1000),
+        type=servico_pb2.MessageType.Value(message_type)
+        if message_type in servico_pb2.MessageType.keys() else servico_pb2.MESSAGE,
+        room_id=record.get("room_id", ""),
+        seq=record.seq
+    )
+
+
+class ChatHistoryServicer(servico_pb2_grpc.ChatServiceServicer):
+    """GetMessageHistory do gateway: busca por cursor no HistoryStore, sem varrer a sala"""
+
+    def __init__(self, history: HistoryStore):
+        self.history = history
+
+    async def GetMessageHistory(self, request, context):
+        limit = request.limit if request.limit > 0 else DEFAULT_HISTORY_LIMIT
+        before_ts = _optional(request.before_timestamp)
+        after_ts = _optional(request.after_timestamp)
+        page = await self.history.scrollback(
+            request.room_id or "global",
+            min(limit, MAX_HISTORY_LIMIT),
+            before=_optional(request.before_seq),
+            after=_optional(request.after_seq),
+            before_timestamp=before_ts / 1000 if before_ts else None,
+            after_timestamp=after_ts / 1000 if after_ts else None
+        )
+        for record in page.records:
+            yield _to_chat_message(record)
+
+
+async def start_grpc_server(history: HistoryStore, port: Optional[str] = None) -> grpc.aio.Server:
+    """Sobe o servidor grpc.aio do gateway (porta GATEWAY_GRPC_PORT, padrão 50053)"""
+    port = port or os.getenv('GATEWAY_GRPC_PORT', '50053')
+    server = grpc.aio.server()
+    servico_pb2_grpc.add_ChatServiceServicer_to_server(ChatHistoryServicer(history), server)
+    server.add_insecure_port(f"[::]:{port}")
+    await server.start()
+    logger.info(f"📡 Servidor gRPC do gateway na porta {port} (ChatService.GetMessageHistory)")
+    return server
@@ -0,0 +1,368 @@
+"""
+Log durável do histórico de mensagens do Módulo P (opcional, HISTORY_LOG_DIR)
+Cada sala tem um diretório com segmentos append-only (`<primeiro seq>.log`),
+cada um acompanhado de um índice esparso (`<primeiro seq>.idx`) com uma entrada
+(seq, timestamp, offset) a cada HISTORY_LOG_INDEX_INTERVAL mensagens.
+
+- Registro: cabeçalho <IQd> (tamanho do payload, seq, timestamp de índice) + JSON
+- O fsync é feito em lote por uma tarefa periódica, não a cada mensagem
+- Na inicialização só a cauda de cada sala (a janela mantida em memória) é lida,
+  via mmap, a partir da entrada do índice mais próxima; um registro incompleto
+  no fim do último segmento (queda no meio da escrita) é descartado
+- Seqs e timestamps de índice são crescentes, então as buscas por um ou por
+  outro são buscas binárias sobre o índice esparso seguidas de uma leitura curta
+- Com vários workers só quem obtém o lock do diretório (flock em LOCK) grava; os
+  demais abrem o log somente para leitura (restauração e rolagem para trás)
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<IQd")
+INDEX_ENTRY = struct.Struct("<QdQ")
+
+ROOM_NAME_FILE = "ROOM"
+LOCK_FILE = "LOCK"
+
+# (seq, timestamp de índice, mensagem)
+LogRecord = Tuple[int, float, dict]
+
+
+def _segment_name(first_seq: int, suffix: str) -> str:
+    return f"{first_seq:020d}{suffix}"
+
+
+class Segment:
+    """Segmento do log de uma sala e seu índice esparso (carregado sob demanda)"""
+
+    __slots__ = ("first_seq", "log_path", "idx_path", "_index")
+
+    def __init__(self, directory: str, first_seq: int):
+        self.first_seq = first_seq
+        self.log_path = os.path.join(directory, _segment_name(first_seq, ".log"))
+        self.idx_path = os.path.join(directory, _segment_name(first_seq, ".idx"))
+        self._index: Optional[List[Tuple[int, float, int]]] = None
+
+    def index(self) -> List[Tuple[int, float, int]]:
+        if self._index is None:
+            try:
+                with open(self.idx_path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = b""
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            self._index = [entry for entry in INDEX_ENTRY.iter_unpack(data[:usable])]
+        return self._index
+
+    def offset_for_seq(self, seq: int) -> int:
+        """Offset da última entrada do índice com seq <= seq (0 se não houver)"""
+        index = self.index()
+        position = bisect_right(index, seq, key=lambda entry: entry[0]) - 1
+        return index[position][2] if position >= 0 else 0
+
+    def offset_for_timestamp(self, timestamp: float) -> int:
+        """Offset da última entrada do índice com timestamp < timestamp (0 se não houver)"""
+        index = self.index()
+        position = bisect_left(index, timestamp, key=lambda entry: entry[1]) - 1
+        return index[position][2] if position >= 0 else 0
+
+    def scan(self, offset: int = 0, decode: bool = False) -> Iterator[Tuple[int, float, int, Optional[dict]]]:
+        """(seq, timestamp, fim do registro, mensagem) a partir de `offset`, lidos via mmap"""
+        with open(self.log_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= offset:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                while offset + RECORD_HEADER.size <= size:
+                    length, seq, timestamp = RECORD_HEADER.unpack_from(view, offset)
+                    start = offset + RECORD_HEADER.size
+                    if start + length > size:
+                        # Registro incompleto (escrita interrompida)
+                        break
+                    offset = start + length
+                    yield seq, timestamp, offset, json_codec.loads(view[start:offset]) if decode else None
+
+
+class RoomLog:
+    """Segmentos de uma sala; o último é o único aberto para escrita"""
+
+    def __init__(self, directory: str, room_id: str):
+        self.directory = directory
+        self.room_id = room_id
+        self.segments: List[Segment] = []
+        self.last_seq = 0
+        self.dirty = False
+        self._log = None
+        self._idx = None
+        self._size = 0
+        self._since_index = 0
+
+    def refresh(self):
+        """Relista os segmentos (um leitor vê os segmentos criados pelo worker que grava)"""
+        known = {segment.first_seq: segment for segment in self.segments}
+        self.segments = [
+            known.get(first_seq) or Segment(self.directory, first_seq)
+            for first_seq in sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log"))
+        ]
+        if self.segments:
+            # O índice do último segmento pode ter crescido
+            self.segments[-1]._index = None
+
+    def recover(self, truncate: bool = True):
+        """Acha o último seq e (se truncate) descarta um registro incompleto no fim do último segmento"""
+        self.refresh()
+        if not self.segments:
+            return
+        segment = self.segments[-1]
+        good_end = offset = segment.offset_for_seq(2 ** 63)
+        for seq, _, end, _ in segment.scan(offset):
+            self.last_seq, good_end = seq, end
+        if not self.last_seq:
+            # Segmento sem nenhum registro completo
+            self.last_seq = segment.first_seq - 1
+        if truncate and os.path.getsize(segment.log_path) > good_end:
+            logger.warning(f"⚠️ Registro incompleto descartado no log da sala {self.room_id}")
+            os.truncate(segment.log_path, good_end)
+            kept = [entry for entry in segment.index() if entry[2] < good_end]
+            with open(segment.idx_path, "wb") as f:
+                f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in kept))
+            segment._index = kept
+
+    def read_range(self, start_seq: int, end_seq: int) -> List[LogRecord]:
+        """Registros com start_seq <= seq < end_seq"""
+        records: List[LogRecord] = []
+        position = max(0, bisect_right(self.segments, start_seq, key=lambda segment: segment.first_seq) - 1)
+        for segment in self.segments[position:]:
+            if segment.first_seq >= end_seq:
+                break
+            for seq, timestamp, _, message in segment.scan(segment.offset_for_seq(start_seq), decode=True):
+                if seq >= end_seq:
+                    return records
+                if seq >= start_seq:
+                    records.append((seq, timestamp, message))
+        return records
+
+    def seq_for_timestamp(self, timestamp: float) -> int:
+        """Primeiro seq com timestamp de índice >= timestamp (last_seq + 1 se nenhum)"""
+        # Todo segmento começa com uma entrada de índice: o último que começa antes de timestamp
+        position = 0
+        for i in range(len(self.segments) - 1, -1, -1):
+            index = self.segments[i].index()
+            if index and index[0][1] < timestamp:
+                position = i
+                break
+        offset = self.segments[position].offset_for_timestamp(timestamp) if self.segments else 0
+        for segment in self.segments[position:]:
+            for seq, record_ts, _, _ in segment.scan(offset):
+                if record_ts >= timestamp:
+                    return seq
+            offset = 0
+        return self.last_seq + 1
+
+    def append(self, seq: int, timestamp: float, payload: bytes, segment_bytes: int, index_interval: int):
+        if self._log is None or self._size >= segment_bytes:
+            self._roll(seq)
+        offset = self._size
+        self._log.write(RECORD_HEADER.pack(len(payload), seq, timestamp))
+        self._log.write(payload)
+        self._size += RECORD_HEADER.size + len(payload)
+        if self._since_index == 0:
+            self._idx.write(INDEX_ENTRY.pack(seq, timestamp, offset))
+            segment = self.segments[-1]
+            if segment._index is not None:
+                segment._index.append((seq, timestamp, offset))
+        self._since_index = (self._since_index + 1) % index_interval
+        self.last_seq = seq
+        self.dirty = True
+
+    def _roll(self, seq: int):
+        """Abre o último segmento para escrita ou, se já houver um aberto e cheio, cria outro"""
+        if self._log is None and self.segments:
+            segment = self.segments[-1]
+            self._size = os.path.getsize(segment.log_path)
+            # Força uma entrada de índice na primeira escrita após a reabertura
+            self._since_index = 0
+        else:
+            self.close()
+            segment = Segment(self.directory, seq)
+            segment._index = []
+            self.segments.append(segment)
+            self._size = 0
+            self._since_index = 0
+        self._log = open(segment.log_path, "ab")
+        self._idx = open(segment.idx_path, "ab")
+
+    def flush_buffers(self):
+        """Esvazia os buffers de escrita sem marcar como sincronizado (o fsync em lote continua pendente)"""
+        if self._log is not None:
+            self._log.flush()
+            self._idx.flush()
+
+    def flush(self) -> Tuple[int, int]:
+        """Esvazia os buffers (no event loop); devolve os descritores a sincronizar"""
+        self._log.flush()
+        self._idx.flush()
+        self.dirty = False
+        return self._log.fileno(), self._idx.fileno()
+
+    def close(self):
+        if self._log is not None:
+            self._log.flush()
+            self._idx.flush()
+            os.fsync(self._log.fileno())
+            os.fsync(self._idx.fileno())
+            self._log.close()
+            self._idx.close()
+            self._log = self._idx = None
+
+
+class HistoryLog:
+    """Log segmentado por sala com fsync em lote e índice esparso por seq/timestamp"""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 fsync_interval: float = 1.0, index_interval: int = 128):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.index_interval = max(1, index_interval)
+        self._rooms: Dict[str, RoomLog] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, LOCK_FILE), "a")
+        self.writer = self._acquire_writer()
+        if not self.writer:
+            logger.info(f"🗄️ Log de histórico em {directory} aberto somente para leitura (outro worker grava)")
+
+    def _acquire_writer(self) -> bool:
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    @classmethod
+    def from_env(cls) -> Optional["HistoryLog"]:
+        directory = os.getenv('HISTORY_LOG_DIR')
+        if not directory:
+            return None
+        return cls(
+            directory,
+            segment_bytes=int(os.getenv('HISTORY_LOG_SEGMENT_BYTES', str(64 * 1024 * 1024))),
+            fsync_interval=float(os.getenv('HISTORY_LOG_FSYNC_INTERVAL', '1.0')),
+            index_interval=int(os.getenv('HISTORY_LOG_INDEX_INTERVAL', '128'))
+        )
+
+    def _room_dir(self, room_id: str) -> str:
+        # room_id vem do cliente: o nome em disco é um hash, o id fica no arquivo ROOM
+        return os.path.join(self.directory, hashlib.sha256(room_id.encode("utf-8")).hexdigest())
+
+    def _room(self, room_id: str) -> Optional[RoomLog]:
+        room = self._rooms.get(room_id)
+        if room is not None:
+            if not self.writer:
+                room.recover(truncate=False)
+            return room
+        directory = self._room_dir(room_id)
+        if self.writer:
+            os.makedirs(directory, exist_ok=True)
+            name_path = os.path.join(directory, ROOM_NAME_FILE)
+            if not os.path.exists(name_path):
+                with open(name_path, "w", encoding="utf-8") as f:
+                    f.write(room_id)
+        elif not os.path.isdir(directory):
+            return None
+        room = RoomLog(directory, room_id)
+        room.recover(truncate=self.writer)
+        self._rooms[room_id] = room
+        return room
+
+    def load_tails(self, capacity_for: Callable[[str], int]) -> Dict[str, Tuple[int, List[LogRecord]]]:
+        """
+        Abre todas as salas do diretório e lê apenas a cauda de cada uma
+        Retorna {room_id: (último seq, registros da janela em memória)}
+        """
+        tails = {}
+        for name in os.listdir(self.directory):
+            name_path = os.path.join(self.directory, name, ROOM_NAME_FILE)
+            try:
+                with open(name_path, encoding="utf-8") as f:
+                    room_id = f.read()
+            except OSError:
+                continue
+            room = self._room(room_id)
+            if room is not None and room.last_seq:
+                start_seq = max(1, room.last_seq - capacity_for(room_id) + 1)
+                tails[room_id] = (room.last_seq, room.read_range(start_seq, room.last_seq + 1))
+        return tails
+
+    def append(self, room_id: str, seq: int, timestamp: float, message: dict):
+        """Grava a mensagem no buffer do segmento atual (durável no próximo fsync em lote)"""
+        if not self.writer:
+            return
+        payload = json_codec.dumps(message).encode("utf-8")
+        self._room(room_id).append(seq, timestamp, payload, self.segment_bytes, self.index_interval)
+
+    def read_before(self, room_id: str, end_seq: int, count: int,
+                    before_timestamp: Optional[float] = None, after_seq: Optional[int] = None,
+                    after_timestamp: Optional[float] = None) -> List[LogRecord]:
+        """Até `count` registros imediatamente anteriores a end_seq (e aos demais limites)"""
+        if count <= 0:
+            return []
+        room = self._room(room_id)
+        if room is None:
+            return []
+        if self.writer:
+            # As mensagens recém-gravadas ainda podem estar só no buffer deste processo
+            room.flush_buffers()
+        if before_timestamp is not None:
+            end_seq = min(end_seq, room.seq_for_timestamp(before_timestamp))
+        start_seq = max(1, end_seq - count)
+        if after_seq is not None:
+            start_seq = max(start_seq, after_seq + 1)
+        records = room.read_range(start_seq, end_seq)
+        if after_timestamp is not None:
+            records = [record for record in records if record[1] > after_timestamp]
+        return records
+
+    def sync(self) -> List[Tuple[int, int]]:
+        """Esvazia os buffers das salas com escrita pendente; devolve os fds para fsync"""
+        return [room.flush() for room in self._rooms.values() if room.dirty]
+
+    async def run_flusher(self):
+        """fsync em lote a cada fsync_interval segundos"""
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            fds = self.sync()
+            if fds:
+                try:
+                    await asyncio.to_thread(_fsync_all, fds)
+                except OSError as e:
+                    logger.warning(f"⚠️ Falha no fsync do log de histórico: {e}")
+
+    def close(self):
+        for room in self._rooms.values():
+            room.close()
+        self._lock_file.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "writer": self.writer,
+            "rooms": len(self._rooms),
+            "segments": sum(len(room.segments) for room in self._rooms.values()),
+        }
+
+
+def _fsync_all(fds: List[Tuple[int, int]]):
+    for log_fd, idx_fd in fds:
+        os.fsync(log_fd)
+        os.fsync(idx_fd)
@@ -0,0 +1,441 @@
+"""
+Histórico de mensagens do Módulo P
+Cada sala guarda suas mensagens num ring buffer de capacidade fixa: o append é
+O(1) (a mensagem mais antiga é sobrescrita quando o buffer enche) e a leitura
+das últimas k mensagens é O(k), sem copiar a lista inteira a cada mensagem.
+
+As mensagens ficam em registros com __slots__ em vez de dicts; campos raros vão
+para um dict `extra` criado só quando necessário, e os valores repetidos entre
+mensagens (tipo, sala, usuário, estado...) são internados. Um orçamento global
+de memória (HISTORY_MAX_BYTES) limita o total estimado de todas as salas,
+descartando as mensagens mais antigas da maior sala quando é ultrapassado.
+
+Cada mensagem recebe um número de sequência (`seq`) crescente dentro da sala,
+que serve de cursor estável para paginação (before/after): como o buffer guarda
+uma faixa contígua de seqs, achar a posição de um seq é aritmética, e achar a de
+um timestamp é uma busca binária sobre o buffer.
+
+Com um HistoryLog (HISTORY_LOG_DIR) toda mensagem também vai para o log durável:
+na inicialização a janela em memória de cada sala é recarregada dele, e a
+rolagem para trás além dessa janela é servida pelo log.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from prometheus_client import Counter, Gauge
+
+from history_log import HistoryLog
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO HISTÓRICO
+# ==============================================================================
+message_history_bytes = Gauge(
+    'message_history_bytes',
+    'Estimated bytes held by the in-memory message history'
+)
+
+message_history_evictions_total = Counter(
+    'message_history_evictions_total',
+    'Messages dropped from the in-memory history',
+    ['reason']  # capacity ou budget
+)
+# ==============================================================================
+
+# Campos com slot próprio no registro (os demais vão para `extra`)
+RECORD_FIELDS = (
+    "message_id", "type", "room_id", "user_id", "username", "content", "timestamp",
+    "processing_state", "original_content", "processed_by", "processed_by_module_a",
+    "file_id", "filename", "file_size", "mime_type",
+)
+
+# Campos cujos valores se repetem entre mensagens: internados e fora da contabilidade
+_SHARED_FIELDS = frozenset((
+    "type", "room_id", "user_id", "username", "processing_state", "processed_by", "mime_type",
+))
+
+_MISSING = object()
+
+
+class MessageRecord:
+    """Mensagem armazenada no histórico (slots ausentes = campo ausente na mensagem)"""
+
+    # seq: posição na sala; index_ts: maior timestamp até esta mensagem (chave monotônica da busca)
+    __slots__ = RECORD_FIELDS + ("extra", "size", "seq", "index_ts")
+
+    @classmethod
+    def from_dict(cls, message: dict) -> "MessageRecord":
+        record = cls()
+        extra = None
+        size = sys.getsizeof(record)
+        for key, value in message.items():
+            if key == "seq":
+                # Atribuído pelo RoomHistory no append
+                continue
+            if key in _SHARED_FIELDS and type(value) is str:
+                setattr(record, key, sys.intern(value))
+            elif key in RECORD_FIELDS:
+                setattr(record, key, value)
+                size += sys.getsizeof(value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+                size += sys.getsizeof(value)
+        if extra is not None:
+            size += sys.getsizeof(extra)
+        record.extra = extra
+        record.size = size
+        return record
+
+    def get(self, field: str, default=None):
+        value = getattr(self, field, _MISSING) if field in RECORD_FIELDS else _MISSING
+        if value is _MISSING:
+            return self.extra.get(field, default) if self.extra else default
+        return value
+
+    def to_dict(self) -> dict:
+        message = {}
+        for field in RECORD_FIELDS:
+            value = getattr(self, field, _MISSING)
+            if value is not _MISSING:
+                message[field] = value
+        if self.extra:
+            message.update(self.extra)
+        message["seq"] = self.seq
+        return message
+
+
+class HistoryPage(NamedTuple):
+    """Página do histórico (mais antiga primeiro) e os cursores para continuar"""
+    records: List[MessageRecord]
+    # seq para pedir a página anterior (before=...), None se não há mensagens mais antigas
+    before_cursor: Optional[int]
+    # seq para pedir a página seguinte (after=...), None se não há mensagens mais novas
+    after_cursor: Optional[int]
+
+
+class RoomHistory:
+    """Ring buffer de capacidade fixa com as mensagens de uma sala"""
+
+    __slots__ = ("capacity", "bytes", "next_seq", "_items", "_start", "_len")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.bytes = 0
+        self.next_seq = 1
+        self._items: List[Optional[MessageRecord]] = []
+        self._start = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, position: int) -> MessageRecord:
+        """Mensagem na posição lógica (0 = mais antiga ainda guardada)"""
+        if not 0 <= position < self._len:
+            raise IndexError(position)
+        return self._items[(self._start + position) % self.capacity]
+
+    @property
+    def first_seq(self) -> int:
+        return self.next_seq - self._len
+
+    def position_of_seq(self, seq: int) -> int:
+        """Posição lógica do seq, limitada ao intervalo guardado [0, len]"""
+        return min(max(seq - self.first_seq, 0), self._len)
+
+    def append(self, record: MessageRecord) -> Optional[MessageRecord]:
+        """Adiciona no fim (com o próximo seq); devolve a mensagem sobrescrita se o buffer estava cheio"""
+        record.seq = self.next_seq
+        self.next_seq += 1
+        timestamp = record.get("timestamp")
+        last_ts = self[self._len - 1].index_ts if self._len else 0.0
+        record.index_ts = max(timestamp, last_ts) if isinstance(timestamp, (int, float)) else last_ts
+        evicted = None
+        if self._len < self.capacity:
+            if len(self._items) < self.capacity:
+                self._items.append(record)
+            else:
+                self._items[(self._start + self._len) % self.capacity] = record
+            self._len += 1
+        else:
+            evicted = self._items[self._start]
+            self._items[self._start] = record
+            self._start = (self._start + 1) % self.capacity
+            self.bytes -= evicted.size
+        self.bytes += record.size
+        return evicted
+
+    def clear(self) -> int:
+        """Esvazia o buffer (mantendo next_seq); devolve os bytes liberados"""
+        freed = self.bytes
+        self._items = []
+        self._start = self._len = 0
+        self.bytes = 0
+        return freed
+
+    def popleft(self) -> Optional[MessageRecord]:
+        if not self._len:
+            return None
+        record = self._items[self._start]
+        self._items[self._start] = None
+        self._start = (self._start + 1) % self.capacity
+        self._len -= 1
+        self.bytes -= record.size
+        return record
+
+    def tail(self, limit: int) -> List[MessageRecord]:
+        """Últimas `limit` mensagens, da mais antiga para a mais recente"""
+        count = min(max(limit, 0), self._len)
+        return self.slice(self._len - count, self._len)
+
+    def slice(self, start: int, end: int) -> List[MessageRecord]:
+        return [self._items[(self._start + i) % self.capacity] for i in range(start, end)]
+
+    def page(self, limit: int, before: Optional[int] = None, after: Optional[int] = None,
+             before_timestamp: Optional[float] = None, after_timestamp: Optional[float] = None) -> HistoryPage:
+        """
+        Até `limit` mensagens entre os cursores (exclusivos), da mais antiga para a mais recente
+        - before/after: seqs (cursores devolvidos em páginas anteriores)
+        - before_timestamp/after_timestamp: busca binária pelo timestamp
+        Só com cursores "after" a página começa logo após eles; caso contrário termina logo antes
+        de "before" (ou no fim), como a rolagem para trás de um chat
+        """
+        start, end = 0, self._len
+        if before is not None:
+            end = min(end, self.position_of_seq(before))
+        if before_timestamp is not None:
+            end = min(end, bisect_left(self, before_timestamp, key=_index_ts))
+        if after is not None:
+            start = max(start, self.position_of_seq(after + 1))
+        if after_timestamp is not None:
+            start = max(start, bisect_right(self, after_timestamp, key=_index_ts))
+
+        limit = max(limit, 0)
+        if start >= end:
+            start = end = min(start, self._len)
+        elif (after is not None or after_timestamp is not None) and before is None and before_timestamp is None:
+            end = min(end, start + limit)
+        else:
+            start = max(start, end - limit)
+
+        records = self.slice(start, end)
+        before_cursor = records[0].seq if records and start > 0 else None
+        after_cursor = records[-1].seq if records and end < self._len else None
+        return HistoryPage(records, before_cursor, after_cursor)
+
+    def __iter__(self) -> Iterator[MessageRecord]:
+        for i in range(self._len):
+            yield self._items[(self._start + i) % self.capacity]
+
+    def __reversed__(self) -> Iterator[MessageRecord]:
+        for i in range(self._len - 1, -1, -1):
+            yield self._items[(self._start + i) % self.capacity]
+
+    def resize(self, capacity: int) -> List[MessageRecord]:
+        """Muda a capacidade mantendo as mensagens mais recentes; devolve as descartadas"""
+        records = list(self)
+        capacity = max(1, capacity)
+        dropped = records[:max(0, len(records) - capacity)]
+        kept = records[len(dropped):]
+        self.capacity = capacity
+        self._items = kept
+        # Mantém os seqs: o buffer continua terminando em next_seq - 1
+        self._start = 0
+        self._len = len(kept)
+        self.bytes = sum(record.size for record in kept)
+        return dropped
+
+
+def _index_ts(record: MessageRecord) -> float:
+    return record.index_ts
+
+
+class HistoryStore:
+    """Históricos por sala com capacidade configurável e orçamento global de memória"""
+
+    def __init__(self, default_capacity: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 room_capacities: Optional[Dict[str, int]] = None, log: Optional[HistoryLog] = None):
+        self.default_capacity = default_capacity
+        self.max_bytes = max_bytes
+        self.room_capacities = dict(room_capacities or {})
+        self.log = log
+        self.total_bytes = 0
+        self._rooms: Dict[str, RoomHistory] = {}
+
+    @classmethod
+    def from_env(cls) -> "HistoryStore":
+        # HISTORY_ROOM_CAPACITIES="global:5000,suporte:200"
+        room_capacities = {}
+        for item in os.getenv('HISTORY_ROOM_CAPACITIES', '').split(','):
+            room_id, _, capacity = item.strip().rpartition(':')
+            if room_id and capacity.isdigit():
+                room_capacities[room_id] = int(capacity)
+        return cls(
+            default_capacity=int(os.getenv('HISTORY_ROOM_CAPACITY', '1000')),
+            max_bytes=int(os.getenv('HISTORY_MAX_BYTES', str(64 * 1024 * 1024))),
+            room_capacities=room_capacities,
+            log=HistoryLog.from_env()
+        )
+
+    def capacity_for(self, room_id: str) -> int:
+        return self.room_capacities.get(room_id, self.default_capacity)
+
+    async def restore(self) -> int:
+        """Recarrega do log a janela em memória de cada sala; devolve o total de mensagens lidas"""
+        if self.log is None:
+            return 0
+        tails = await asyncio.to_thread(self.log.load_tails, self.capacity_for)
+        restored = 0
+        for room_id, (last_seq, records) in tails.items():
+            room = RoomHistory(self.capacity_for(room_id))
+            for seq, _, message in records:
+                if seq != room.next_seq:
+                    # Primeiro registro ou salto no log (eventos perdidos): a janela recomeça nele
+                    room.clear()
+                    room.next_seq = seq
+                room.append(MessageRecord.from_dict(message))
+            room.next_seq = last_seq + 1
+            self._rooms[room_id] = room
+            self.total_bytes += room.bytes
+            restored += len(records)
+        self._enforce_budget()
+        message_history_bytes.set(self.total_bytes)
+        logger.info(f"🗄️ Histórico restaurado do log: {restored} mensagem(ns) em {len(tails)} sala(s)")
+        return restored
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    def rooms(self) -> List[str]:
+        return list(self._rooms)
+
+    def room(self, room_id: str) -> Optional[RoomHistory]:
+        return self._rooms.get(room_id)
+
+    def ensure_room(self, room_id: str) -> RoomHistory:
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = RoomHistory(self.capacity_for(room_id))
+            self._rooms[room_id] = room
+        return room
+
+    def set_capacity(self, room_id: str, capacity: int):
+        """Altera a capacidade de uma sala (descarta as mensagens mais antigas que não couberem)"""
+        self.room_capacities[room_id] = capacity
+        room = self._rooms.get(room_id)
+        if room is not None:
+            for record in room.resize(capacity):
+                self.total_bytes -= record.size
+                message_history_evictions_total.labels(reason="capacity").inc()
+            message_history_bytes.set(self.total_bytes)
+
+    def append(self, room_id: str, message: dict, seq: Optional[int] = None) -> Optional[MessageRecord]:
+        """
+        Armazena a mensagem; o seq atribuído também é gravado nela (cursor para os clientes)
+        Com `seq` (reservado pelo backplane), mensagens repetidas são ignoradas e um salto
+        na sequência (eventos perdidos) reinicia a janela da sala a partir dele
+        """
+        room = self.ensure_room(room_id)
+        if seq is not None and seq != room.next_seq:
+            if seq < room.next_seq:
+                return None
+            if len(room):
+                logger.warning(f"⚠️ Salto no histórico da sala {room_id} ({room.next_seq} → {seq})")
+                self.total_bytes -= room.clear()
+            room.next_seq = seq
+        record = MessageRecord.from_dict(message)
+        evicted = room.append(record)
+        message["seq"] = record.seq
+        if self.log is not None:
+            self.log.append(room_id, record.seq, record.index_ts, message)
+        self.total_bytes += record.size
+        if evicted is not None:
+            self.total_bytes -= evicted.size
+            message_history_evictions_total.labels(reason="capacity").inc()
+        self._enforce_budget()
+        message_history_bytes.set(self.total_bytes)
+        return record
+
+    def _enforce_budget(self):
+        while self.total_bytes > self.max_bytes:
+            largest = max(self._rooms.values(), key=lambda room: room.bytes, default=None)
+            record = largest.popleft() if largest is not None else None
+            if record is None:
+                break
+            self.total_bytes -= record.size
+            message_history_evictions_total.labels(reason="budget").inc()
+
+    def page(self, room_id: str, limit: int, **cursors) -> HistoryPage:
+        """Página do histórico da sala (ver RoomHistory.page)"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return HistoryPage([], None, None)
+        return room.page(limit, **cursors)
+
+    async def scrollback(self, room_id: str, limit: int, before: Optional[int] = None,
+                         after: Optional[int] = None, before_timestamp: Optional[float] = None,
+                         after_timestamp: Optional[float] = None) -> HistoryPage:
+        """
+        Como page(), mas a rolagem para trás que passa do início da janela em memória
+        é completada com mensagens lidas do log durável (quando configurado)
+        """
+        cursors = dict(before=before, after=after, before_timestamp=before_timestamp, after_timestamp=after_timestamp)
+        page = self.page(room_id, limit, **cursors)
+        room = self._rooms.get(room_id)
+        forward = (after is not None or after_timestamp is not None) and before is None and before_timestamp is None
+        if (self.log is None or room is None or forward or room.first_seq <= 1
+                or len(page.records) >= limit or (page.records and page.records[0].seq > room.first_seq)):
+            return page
+
+        end_seq = page.records[0].seq if page.records else min(before or room.first_seq, room.first_seq)
+        older = await asyncio.to_thread(
+            self.log.read_before, room_id, end_seq, limit - len(page.records),
+            before_timestamp, after, after_timestamp
+        )
+        records = []
+        for seq, index_ts, message in older:
+            record = MessageRecord.from_dict(message)
+            record.seq, record.index_ts = seq, index_ts
+            records.append(record)
+        records.extend(page.records)
+        if not records:
+            return page
+
+        lowest_seq = max(1, (after or 0) + 1)
+        return HistoryPage(
+            records,
+            records[0].seq if records[0].seq > lowest_seq else None,
+            records[-1].seq if records[-1].seq < room.next_seq - 1 else None
+        )
+
+    def recent(self, room_id: str, limit: int) -> List[MessageRecord]:
+        """Últimas `limit` mensagens da sala, da mais antiga para a mais recente"""
+        room = self._rooms.get(room_id)
+        return room.tail(limit) if room is not None else []
+
+    def find(self, room_id: str, message_type: str, field: str, value) -> Optional[MessageRecord]:
+        """Mensagem mais recente da sala com o tipo e o valor de campo dados"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            return None
+        for record in reversed(room):
+            if record.get("type") == message_type and record.get(field) == value:
+                return record
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "rooms": len(self._rooms),
+            "messages": sum(len(room) for room in self._rooms.values()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "log": self.log.stats() if self.log is not None else None,
+        }
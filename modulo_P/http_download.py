@@ -0,0 +1,94 @@
+"""
+Utilitários HTTP do download de arquivos do Módulo P
+Range (um único intervalo de bytes), ETag/If-None-Match e recorte do fluxo de
+chunks vindo do Módulo B. Os arquivos são imutáveis por file_id, então o ETag
+é derivado de file_id + file_size e pode ser calculado sem ler o conteúdo.
+"""
+
+import hashlib
+from typing import AsyncIterator, Optional, Tuple
+
+
+class RangeNotSatisfiable(Exception):
+    """Intervalo pedido fora do arquivo (HTTP 416)"""
+
+
+def make_etag(file_id: str, file_size: int) -> str:
+    digest = hashlib.sha256(file_id.encode("utf-8")).hexdigest()[:16]
+    return f'"{digest}-{file_size}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca do If-None-Match (RFC 9110), aceitando lista e '*'"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta o cabeçalho Range e retorna (início, fim) inclusivos
+    Retorna None (resposta completa) para cabeçalhos ausentes, malformados ou com
+    vários intervalos; levanta RangeNotSatisfiable para intervalos fora do arquivo
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # Sufixo: os últimos N bytes
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(0, file_size - suffix), file_size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else file_size - 1
+    except ValueError:
+        return None
+    if start >= file_size:
+        raise RangeNotSatisfiable()
+    if start < 0 or end < start:
+        return None
+    return start, min(end, file_size - 1)
+
+
+async def slice_pieces(pieces: AsyncIterator[bytes], start: int, end: int) -> AsyncIterator[bytes]:
+    """
+    Recorta [start, end] de um fluxo de pedaços. O ReceiveFiles não aceita offset,
+    então os pedaços anteriores ao início são lidos e descartados; a leitura é
+    encerrada (cancelando o stream gRPC) assim que o fim é alcançado
+    """
+    offset = 0
+    try:
+        async for piece in pieces:
+            piece_end = offset + len(piece)
+            if piece_end > start:
+                lower, upper = max(0, start - offset), min(len(piece), end + 1 - offset)
+                # Pedaços inteiros seguem sem cópia; só as bordas do intervalo são recortadas
+                yield piece if (lower, upper) == (0, len(piece)) else bytes(memoryview(piece)[lower:upper])
+            offset = piece_end
+            if offset > end:
+                break
+    finally:
+        await pieces.aclose()
+
+
+async def iter_range(data: bytes, start: int, end: int, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Intervalo [start, end] de um arquivo já em memória (cache), em blocos de chunk_size"""
+    view = memoryview(data)
+    for offset in range(start, end + 1, chunk_size):
+        yield bytes(view[offset:min(offset + chunk_size, end + 1)])
@@ -0,0 +1,53 @@
+"""
+Codificação JSON dos frames WebSocket do Módulo P
+Usa orjson quando disponível (com fallback para o json da biblioteca padrão)
+e permite codificar uma mensagem uma única vez em um Frame imutável, que é
+então enviado a todos os destinatários de um broadcast sem reserialização.
+"""
+
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# WS_JSON_BACKEND=json força a biblioteca padrão mesmo com orjson instalado
+_requested_backend = os.getenv('WS_JSON_BACKEND', 'orjson').lower()
+BACKEND = "orjson" if orjson is not None and _requested_backend != "json" else "json"
+
+
+def dumps(obj: Any) -> str:
+    """Serializa para texto JSON compacto (frame de texto WebSocket)"""
+    if BACKEND == "orjson":
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: Any) -> Any:
+    """Desserializa um frame recebido (str ou bytes)"""
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Frame:
+    """Mensagem já codificada, compartilhada (somente leitura) por todos os destinatários"""
+
+    __slots__ = ("text", "message")
+
+    def __init__(self, text: str, message: dict):
+        self.text = text
+        # Mantido apenas para inspeção (ex.: coalescência); não deve ser alterado
+        self.message = message
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+
+def encode_frame(message: dict) -> Frame:
+    """Codifica a mensagem uma única vez para envio a N destinatários"""
+    return Frame(dumps(message), message)
+
@@ -0,0 +1,90 @@
+"""
+Pipeline de processamento de mensagens do Módulo P
+Garante que cada mensagem de chat passe pelo Módulo A exatamente uma vez.
+O estado do processamento fica gravado na própria mensagem, de modo que
+WebSocket, POST HTTP e replay de histórico compartilham o mesmo resultado.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de "processing_state" na mensagem
+STATE_PENDING = "pending"
+STATE_PROCESSED = "processed"
+STATE_FALLBACK = "fallback"
+
+# Assinatura de GrpcChatClient.process_message
+MessageProcessor = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+class MessagePipeline:
+    """Etapa do gateway que envia mensagens do tipo MESSAGE ao Módulo A uma única vez"""
+
+    def __init__(self, processor: MessageProcessor):
+        self.processor = processor
+        # Processamentos em andamento {message_id: Future}, para chamadas concorrentes
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def needs_processing(message: dict) -> bool:
+        return (
+            message.get("type") == "MESSAGE"
+            and bool(message.get("content"))
+            and message.get("processing_state", STATE_PENDING) == STATE_PENDING
+        )
+
+    async def process(self, message: dict) -> dict:
+        """
+        Processa a mensagem in-place via Módulo A (se ainda não foi) e a retorna.
+        Mensagens já processadas (ou que caíram no fallback) são devolvidas sem nova chamada.
+        """
+        if not self.needs_processing(message):
+            return message
+
+        message_id = message.get("message_id")
+        if message_id and message_id in self._inflight:
+            # Outra corrotina já está processando esta mensagem: reaproveita o resultado
+            message.update(await asyncio.shield(self._inflight[message_id]))
+            return message
+
+        future = asyncio.get_running_loop().create_future()
+        if message_id:
+            self._inflight[message_id] = future
+        content = message["content"]
+        try:
+            result = await self.processor(
+                username=message.get("username", ""),
+                content=content,
+                room_id=message.get("room_id", "global"),
+                user_id=message.get("user_id", ""),
+                message_id=message_id or ""
+            )
+            success = bool(result.get("success"))
+            fields = {
+                "content": result.get("processed_content", content),
+                "original_content": content,
+                "processed_by_module_a": success,
+                "processing_state": STATE_PROCESSED if success else STATE_FALLBACK,
+            }
+            if success:
+                fields["processed_by"] = "module_a"
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erro no pipeline de mensagens: {e}")
+            fields = {
+                "original_content": content,
+                "processed_by_module_a": False,
+                "processing_state": STATE_FALLBACK,
+            }
+        finally:
+            if message_id:
+                self._inflight.pop(message_id, None)
+
+        message.update(fields)
+        future.set_result(fields)
+        return message
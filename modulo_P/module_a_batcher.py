@@ -0,0 +1,178 @@
+"""
+Micro-batching das chamadas ao Módulo A
+Em vez de um RealizarTarefaA por mensagem de chat, as requisições são
+acumuladas por até MODULE_A_BATCH_MAX_LATENCY_MS (ou até MODULE_A_BATCH_MAX_SIZE
+itens) e enviadas em um único RealizarTarefaALote. Cada chamador aguarda a sua
+própria resposta, entregue pela posição no lote.
+
+Se o Módulo A ainda não implementa o RPC em lote (UNIMPLEMENTED), o batcher
+volta para chamadas unary individuais. MODULE_A_BATCH_MAX_SIZE=1 desliga o lote.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import grpc
+from prometheus_client import Counter, Histogram
+
+import resilience
+import servico_pb2
+
+from aio_clients import AsyncBackendClient
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO MICRO-BATCHING
+# ==============================================================================
+module_a_batch_size = Histogram(
+    'module_a_batch_size',
+    'Requests sent to Module A per RealizarTarefaALote call',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+module_a_batch_wait_seconds = Histogram(
+    'module_a_batch_wait_seconds',
+    'Time a request waited in the batch before being sent to Module A',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+
+module_a_batch_rpcs_saved_total = Counter(
+    'module_a_batch_rpcs_saved_total',
+    'Unary RealizarTarefaA calls avoided by batching'
+)
+# ==============================================================================
+
+# (requisição, futuro do chamador, instante em que entrou no lote)
+PendingRequest = Tuple[servico_pb2.RequestA, asyncio.Future, float]
+
+
+class ModuleABatcher:
+    """Agrupa requisições ao ServicoA em lotes limitados por tamanho e por latência"""
+
+    def __init__(self, backend: AsyncBackendClient, max_batch_size: int = 64,
+                 max_latency: float = 0.005, timeout: float = 10):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.timeout = timeout
+        # Desligado com lote de 1 item ou quando o Módulo A não conhece o RPC em lote
+        self.enabled = max_batch_size > 1
+        self.requests = 0
+        self.batches = 0
+        self._pending: List[PendingRequest] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._sending = set()
+
+    @classmethod
+    def from_env(cls, backend: AsyncBackendClient) -> "ModuleABatcher":
+        return cls(
+            backend,
+            max_batch_size=int(os.getenv('MODULE_A_BATCH_MAX_SIZE', '64')),
+            max_latency=float(os.getenv('MODULE_A_BATCH_MAX_LATENCY_MS', '5')) / 1000
+        )
+
+    async def submit(self, request_id: str, data: str, operation: str) -> servico_pb2.ResponseA:
+        """Envia a requisição no próximo lote e aguarda a resposta correspondente"""
+        if not self.enabled:
+            return await self.backend.realizar_tarefa_a(request_id, data, operation, timeout=self.timeout)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((
+            servico_pb2.RequestA(id=request_id, data=data, operation=operation),
+            future,
+            time.monotonic()
+        ))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_latency, self._flush)
+        # O chamador espera no máximo o que resta do próprio prazo (o futuro cancelado sai do lote)
+        remaining = resilience.remaining()
+        if remaining is None:
+            return await future
+        return await asyncio.wait_for(future, max(remaining, 0))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Cada lote segue em sua própria task: o próximo já pode ir se formando.
+            # Contexto limpo: o lote não herda o prazo de quem por acaso disparou o flush
+            task = asyncio.get_running_loop().create_task(self._send(batch), context=contextvars.Context())
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[PendingRequest]):
+        now = time.monotonic()
+        # Chamadores que desistiram (cancelados) não entram no lote
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        for _, _, enqueued_at in batch:
+            module_a_batch_wait_seconds.observe(now - enqueued_at)
+        module_a_batch_size.observe(len(batch))
+
+        try:
+            response = await self.backend.realizar_tarefa_a_lote(
+                [request for request, _, _ in batch], timeout=self.timeout
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                logger.warning("⚠️ Módulo A sem RealizarTarefaALote: voltando para chamadas unary")
+                self.enabled = False
+                await asyncio.gather(*(self._send_single(request, future) for request, future, _ in batch))
+                return
+            self._fail(batch, e)
+            return
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        self.requests += len(batch)
+        self.batches += 1
+        module_a_batch_rpcs_saved_total.inc(len(batch) - 1)
+        responses = response.responses
+        for index, (request, future, _) in enumerate(batch):
+            if future.done():
+                continue
+            if index < len(responses):
+                future.set_result(responses[index])
+            else:
+                future.set_exception(RuntimeError(f"Lote do Módulo A sem resposta para {request.id}"))
+
+    async def _send_single(self, request: servico_pb2.RequestA, future: asyncio.Future):
+        try:
+            result = await self.backend.realizar_tarefa_a(
+                request.id, request.data, request.operation, timeout=self.timeout
+            )
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _fail(batch: List[PendingRequest], error: Exception):
+        logger.error(f"❌ Falha no lote de {len(batch)} requisição(ões) ao Módulo A: {error}")
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_batch_size": self.max_batch_size,
+            "max_latency_ms": self.max_latency * 1000,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+            "pending": len(self._pending),
+        }
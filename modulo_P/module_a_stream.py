@@ -0,0 +1,244 @@
+"""
+Canal ChatStream persistente com o Módulo A
+O gateway mantém MODULE_A_CHAT_STREAMS streams bidirecionais de longa duração
+(cada um ocupa um canal do pool, ou seja, uma conexão com o Módulo A) e envia
+as mensagens de chat por eles em pipeline, sem abrir um RPC por mensagem. As
+respostas voltam pelo mesmo stream e são casadas com quem espera pelo
+message_id, em qualquer ordem.
+
+Um stream que cai é reaberto automaticamente, com backoff exponencial. As
+mensagens que ainda não tinham sido escritas nele falham com StreamUnavailable
+e o chamador cai no caminho em lote (ModuleABatcher); as já escritas falham com
+StreamInterrupted, pois o Módulo A pode tê-las processado, e não são reenviadas. Se o Módulo A não implementa ChatStream
+(UNIMPLEMENTED), o canal é desligado. MODULE_A_CHAT_STREAMS=0 desliga o canal.
+Cada mensagem respeita o orçamento "ChatStream" da camada de resiliência e o
+circuit breaker do Módulo A (respostas atrasadas contam como falha); com o
+circuito aberto a reabertura do stream só espera e tenta de novo.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Set
+
+import grpc
+from prometheus_client import Counter, Gauge, Histogram
+
+import servico_pb2
+
+from aio_clients import AsyncBackendClient, MODULO_A
+from resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO CHATSTREAM
+# ==============================================================================
+module_a_chat_streams_connected = Gauge(
+    'module_a_chat_streams_connected',
+    'Open ChatStream channels to Module A'
+)
+
+module_a_chat_stream_reconnects_total = Counter(
+    'module_a_chat_stream_reconnects_total',
+    'ChatStream channels to Module A reopened after a failure'
+)
+
+module_a_chat_stream_inflight = Gauge(
+    'module_a_chat_stream_inflight',
+    'Messages sent over ChatStream still waiting for Module A'
+)
+
+module_a_chat_stream_latency_seconds = Histogram(
+    'module_a_chat_stream_latency_seconds',
+    'Round trip of a chat message through the Module A ChatStream',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+# ==============================================================================
+
+
+class StreamUnavailable(ConnectionError):
+    """Nenhum ChatStream aberto (ou o stream caiu antes de a mensagem ser escrita)"""
+
+
+class StreamInterrupted(ConnectionError):
+    """O stream caiu depois de a mensagem ser escrita: reenviá-la pode processá-la duas vezes"""
+
+
+class _StreamConnection:
+    """Um ChatStream aberto: fila de envio e mensagens aguardando resposta"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.connected = False
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Dict[str, asyncio.Future] = {}
+        # Chaves das mensagens pendentes já entregues ao escritor (podem ter chegado ao Módulo A)
+        self.written: Set[str] = set()
+
+    def fail_pending(self, reason: str):
+        for key, future in self.pending.items():
+            if not future.done():
+                error = StreamInterrupted if key in self.written else StreamUnavailable
+                future.set_exception(error(reason))
+        self.pending.clear()
+        self.written.clear()
+
+
+class ChatStreamClient:
+    """Pool de ChatStreams persistentes com correlação por message_id e reconexão automática"""
+
+    def __init__(self, backend: AsyncBackendClient, streams: int = 2, timeout: float = 10,
+                 reconnect_interval: float = 0.5, max_reconnect_interval: float = 10.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.enabled = streams > 0
+        self.connections: List[_StreamConnection] = [_StreamConnection(i) for i in range(streams)]
+        self.sent = 0
+        self.reconnects = 0
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, backend: AsyncBackendClient) -> "ChatStreamClient":
+        return cls(backend, streams=int(os.getenv('MODULE_A_CHAT_STREAMS', '2')))
+
+    def start(self):
+        if self.enabled:
+            self._tasks = [asyncio.create_task(self._run(conn)) for conn in self.connections]
+
+    def available(self) -> bool:
+        return self.enabled and any(conn.connected for conn in self.connections)
+
+    async def process(self, message_id: str, user_id: str, username: str,
+                      content: str, room_id: str) -> servico_pb2.ChatMessage:
+        """Envia a mensagem pelo stream menos ocupado e aguarda a versão processada"""
+        connected = [conn for conn in self.connections if conn.connected] if self.enabled else []
+        if not connected:
+            raise StreamUnavailable("Nenhum ChatStream aberto com o Módulo A")
+        breaker = self.backend.resilience.breaker(MODULO_A)
+        breaker.check()
+        # Orçamento por mensagem ("ChatStream"), limitado pelo prazo da requisição
+        timeout = self.backend.resilience.timeout_for("ChatStream", self.timeout)
+        conn = min(connected, key=lambda c: len(c.pending))
+
+        # O message_id é a chave de correlação no stream: precisa ser único entre os que estão em voo
+        key = message_id if message_id and message_id not in conn.pending else str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        conn.pending[key] = future
+        conn.queue.put_nowait(servico_pb2.ChatMessage(
+            message_id=key,
+            user_id=user_id,
+            username=username,
+            content=content,
+            timestamp=int(time.time() * 1000),
+            type=servico_pb2.MESSAGE,
+            room_id=room_id
+        ))
+        self.sent += 1
+        started = time.perf_counter()
+        module_a_chat_stream_inflight.inc()
+        try:
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # Módulo A conectado mas lento: conta para o circuit breaker
+            breaker.record_failure()
+            raise
+        finally:
+            module_a_chat_stream_inflight.dec()
+            conn.pending.pop(key, None)
+            conn.written.discard(key)
+        breaker.record_success()
+        module_a_chat_stream_latency_seconds.observe(time.perf_counter() - started)
+        return response
+
+    async def _run(self, conn: _StreamConnection):
+        delay = self.reconnect_interval
+        while True:
+            call = None
+            writer = None
+            try:
+                # A abertura também pode falhar: entra no mesmo backoff das quedas do stream
+                call = self.backend.open_chat_stream()
+                conn.queue = asyncio.Queue()
+                writer = asyncio.create_task(self._write(conn, call))
+                await call.wait_for_connection()
+                conn.connected = True
+                module_a_chat_streams_connected.inc()
+                delay = self.reconnect_interval
+                logger.info(f"🔗 ChatStream #{conn.index} aberto com o Módulo A")
+                while True:
+                    response = await call.read()
+                    if response is grpc.aio.EOF:
+                        logger.warning(f"⚠️ Módulo A encerrou o ChatStream #{conn.index}")
+                        break
+                    future = conn.pending.get(response.message_id)
+                    if future is not None and not future.done():
+                        future.set_result(response)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # Chamada cancelada pelo escritor (falha de escrita): reabre o stream
+                logger.warning(f"⚠️ ChatStream #{conn.index} cancelado após falha de escrita")
+            except CircuitOpenError:
+                # Módulo A com o circuito aberto: aguarda o backoff e tenta de novo (nunca desiste)
+                logger.info(f"⏳ ChatStream #{conn.index} aguardando o circuito do Módulo A fechar")
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                    logger.warning("⚠️ Módulo A sem ChatStream: usando chamadas em lote")
+                    self.enabled = False
+                    return
+                logger.warning(f"⚠️ ChatStream #{conn.index} interrompido: {e.code().name}")
+            except Exception as e:
+                logger.warning(f"⚠️ ChatStream #{conn.index} interrompido: {e}")
+            finally:
+                if conn.connected:
+                    conn.connected = False
+                    module_a_chat_streams_connected.dec()
+                if writer is not None:
+                    writer.cancel()
+                if call is not None:
+                    call.cancel()
+                conn.fail_pending(f"ChatStream #{conn.index} encerrado")
+
+            self.reconnects += 1
+            module_a_chat_stream_reconnects_total.inc()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_interval)
+
+    @staticmethod
+    async def _write(conn: _StreamConnection, call: grpc.aio.StreamStreamCall):
+        # Único escritor do stream: as escritas não podem ser concorrentes
+        try:
+            while True:
+                message = await conn.queue.get()
+                # A partir daqui a mensagem pode chegar ao Módulo A mesmo que a escrita falhe
+                if message.message_id in conn.pending:
+                    conn.written.add(message.message_id)
+                await call.write(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao escrever no ChatStream #{conn.index}: {e}")
+            call.cancel()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def inflight(self) -> int:
+        return sum(len(conn.pending) for conn in self.connections)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "streams": len(self.connections),
+            "connected": sum(1 for conn in self.connections if conn.connected),
+            "inflight": self.inflight(),
+            "sent": self.sent,
+            "reconnects": self.reconnects,
+        }
@@ -0,0 +1,469 @@
+"""
+Presença dos usuários no Módulo P
+Um único armazenamento em memória substitui as duas fontes que existiam
+(online_users do ConnectionManager e um GetOnlineUsers no Módulo A a cada
+consulta), e tanto o WebSocket quanto a API HTTP leem dele:
+
+- PresenceStore: {sala: {username: PresenceEntry}} com índice pelas sessões
+  (conexões) de cada usuário e uma versão por sala que cresce a cada mudança;
+  o usuário só sai da sala quando a última sessão dele termina
+- deltas para os clientes: quem entra recebe um ONLINE_USERS (snapshot com a
+  versão da sala); daí em diante só recebe PRESENCE_DELTA com as mudanças
+  (join/leave/status), acumuladas por sala durante PRESENCE_DELTA_INTERVAL_MS
+  e enviadas como um único frame. Uma rajada de N entradas em uma sala custa
+  um frame por membro, e não N frames (nem N listas completas) por membro
+- sincronização com o Módulo A: as mudanças das conexões deste processo são
+  acumuladas (a última por usuário) e enviadas a cada
+  PRESENCE_SYNC_INTERVAL_MS em um único SyncPresence, que devolve as mudanças
+  do Módulo A desde a última versão vista (ou tudo, se o log dele não cobre)
+
+Cada sessão guarda a sua origem: uma conexão deste processo (local), de outro
+worker pelo backplane (peer) ou o Módulo A (module_a). Uma origem só encerra
+sessões de origem igual ou inferior, então o eco de um evento nunca derruba
+um usuário que continua conectado.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import grpc
+from prometheus_client import Counter, Gauge
+
+import servico_pb2
+
+from aio_clients import AsyncBackendClient
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DE PRESENÇA
+# ==============================================================================
+presence_users = Gauge(
+    'presence_users',
+    'Users in the gateway presence store (all rooms)'
+)
+
+presence_deltas_total = Counter(
+    'presence_deltas_total',
+    'Presence changes sent to clients',
+    ['op']  # join, leave ou status
+)
+
+presence_delta_frames_total = Counter(
+    'presence_delta_frames_total',
+    'PRESENCE_DELTA frames fanned out to a room'
+)
+
+presence_sync_total = Counter(
+    'presence_sync_total',
+    'SyncPresence calls to Module A',
+    ['result']  # ok ou error
+)
+
+presence_sync_changes_total = Counter(
+    'presence_sync_changes_total',
+    'Presence changes exchanged with Module A',
+    ['direction']  # sent ou received
+)
+# ==============================================================================
+
+STATUS_ONLINE = "ONLINE"
+STATUS_OFFLINE = "OFFLINE"
+
+OP_JOIN = "join"
+OP_LEAVE = "leave"
+OP_STATUS = "status"
+
+ORIGIN_LOCAL = "local"
+ORIGIN_PEER = "peer"
+ORIGIN_MODULE_A = "module_a"
+
+# Uma origem só encerra sessões de prioridade igual ou menor
+_ORIGIN_PRIORITY = {ORIGIN_MODULE_A: 0, ORIGIN_PEER: 1, ORIGIN_LOCAL: 2}
+
+DeliverCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class PresenceEntry:
+    __slots__ = ("user_id", "username", "status", "joined_at", "origin", "version", "sessions")
+
+    def __init__(self, user_id: str, username: str, status: str, joined_at: float, origin: str):
+        self.user_id = user_id
+        self.username = username
+        self.status = status
+        self.joined_at = joined_at
+        self.origin = origin
+        # Versão da sala na última mudança desta entrada
+        self.version = 0
+        # Conexões (ou ids do Módulo A) que mantêm o usuário na sala {id: origem}
+        self.sessions: Dict[str, str] = {user_id: origin}
+
+    def refresh(self):
+        """user_id e origem exibidos: a primeira sessão da origem mais confiável"""
+        priority = max(_ORIGIN_PRIORITY[origin] for origin in self.sessions.values())
+        for session_id, origin in self.sessions.items():
+            if _ORIGIN_PRIORITY[origin] == priority:
+                self.user_id, self.origin = session_id, origin
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "status": self.status,
+            "joined_at": self.joined_at,
+        }
+
+
+class PresenceStore:
+    """Usuários online por sala (um por username), indexados também por sessão"""
+
+    def __init__(self):
+        self._rooms: Dict[str, Dict[str, PresenceEntry]] = {}
+        self._sessions: Dict[str, Dict[str, PresenceEntry]] = {}
+        self.versions: Dict[str, int] = {}
+        self.total = 0
+
+    def get(self, room_id: str, user_id: str) -> Optional[PresenceEntry]:
+        return self._sessions.get(room_id, {}).get(user_id)
+
+    def resolve(self, room_id: str, user_id: str, username: str = "") -> Optional[PresenceEntry]:
+        """Entrada pela sessão ou, se não houver, pelo username na sala (o login e a conexão têm ids diferentes)"""
+        entry = self.get(room_id, user_id)
+        if entry is None and username:
+            entry = self._rooms.get(room_id, {}).get(username)
+        return entry
+
+    def _bump(self, room_id: str, entry: PresenceEntry) -> int:
+        version = self.versions.get(room_id, 0) + 1
+        self.versions[room_id] = version
+        entry.version = version
+        return version
+
+    def upsert(self, room_id: str, user_id: str, username: str, status: str = STATUS_ONLINE,
+               origin: str = ORIGIN_LOCAL, joined_at: Optional[float] = None) -> Optional[Tuple[str, PresenceEntry]]:
+        """Insere ou atualiza o usuário; retorna (op, entrada) se algo visível mudou"""
+        entry = self.resolve(room_id, user_id, username)
+        if entry is None:
+            entry = PresenceEntry(user_id, username, status, joined_at or time.time(), origin)
+            self._rooms.setdefault(room_id, {})[username] = entry
+            self._sessions.setdefault(room_id, {})[user_id] = entry
+            self.total += 1
+            self._bump(room_id, entry)
+            return OP_JOIN, entry
+
+        # Mais uma conexão do mesmo usuário (outra aba, outro worker): a entrada continua uma só
+        current = entry.sessions.get(user_id)
+        if current is None or _ORIGIN_PRIORITY[origin] > _ORIGIN_PRIORITY[current]:
+            entry.sessions[user_id] = origin
+            self._sessions[room_id][user_id] = entry
+            entry.refresh()
+        if entry.status == status:
+            return None
+        entry.status = status
+        self._bump(room_id, entry)
+        return OP_STATUS, entry
+
+    def remove(self, room_id: str, user_id: str, username: str = "",
+               origin: str = ORIGIN_LOCAL) -> Optional[PresenceEntry]:
+        """
+        Encerra a sessão; retorna a entrada só quando o usuário sai de fato da sala
+        (a última sessão foi embora). Uma origem nunca encerra sessões de origem mais confiável.
+        """
+        entry = self.resolve(room_id, user_id, username)
+        if entry is None:
+            return None
+        priority = _ORIGIN_PRIORITY[origin]
+        current = entry.sessions.get(user_id)
+        if current is not None:
+            ended = [user_id] if _ORIGIN_PRIORITY[current] <= priority else []
+        elif origin == ORIGIN_MODULE_A:
+            # O Módulo A identifica o usuário pelo username: encerra o que veio dele
+            ended = [session_id for session_id, o in entry.sessions.items() if o == ORIGIN_MODULE_A]
+        else:
+            ended = []
+        if not ended:
+            return None
+
+        sessions = self._sessions[room_id]
+        for session_id in ended:
+            del entry.sessions[session_id]
+            sessions.pop(session_id, None)
+        if origin != ORIGIN_MODULE_A and all(o == ORIGIN_MODULE_A for o in entry.sessions.values()):
+            # Sem conexões no gateway: o que resta do Módulo A é o reflexo delas, ainda não sincronizado
+            for session_id in list(entry.sessions):
+                del entry.sessions[session_id]
+                sessions.pop(session_id, None)
+        if entry.sessions:
+            entry.refresh()
+            return None
+
+        room = self._rooms[room_id]
+        del room[entry.username]
+        if not room:
+            del self._rooms[room_id]
+            del self._sessions[room_id]
+        self.total -= 1
+        self._bump(room_id, entry)
+        return entry
+
+    def room(self, room_id: str) -> List[PresenceEntry]:
+        return list(self._rooms.get(room_id, {}).values())
+
+    def rooms(self) -> List[str]:
+        return list(self._rooms)
+
+    def count(self, room_id: str) -> int:
+        return len(self._rooms.get(room_id, ()))
+
+    def version(self, room_id: str) -> int:
+        return self.versions.get(room_id, 0)
+
+    def __len__(self) -> int:
+        return self.total
+
+
+class PresenceService:
+    """Presença da sala para os clientes (snapshot + deltas) e sincronização em lote com o Módulo A"""
+
+    def __init__(self, deliver: Optional[DeliverCallback] = None, delta_interval: float = 0.1,
+                 sync_interval: float = 1.0, timeout: float = 10):
+        self.store = PresenceStore()
+        # Entrega um frame aos membros da sala conectados a este processo
+        self.deliver = deliver
+        self.delta_interval = delta_interval
+        self.sync_interval = sync_interval
+        self.timeout = timeout
+        self.backend: Optional[AsyncBackendClient] = None
+        # {sala: {username: [status antes da janela, status atual, user_id, versão]}} (None = ausente)
+        self._pending: Dict[str, Dict[str, list]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Mudanças das conexões locais ainda não enviadas ao Módulo A {(sala, username): (user_id, status)}
+        self._dirty: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self.since_version = 0
+        self.sync_enabled = sync_interval > 0
+        self.syncs = 0
+        self.sync_errors = 0
+        self.delta_frames = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, deliver: Optional[DeliverCallback] = None) -> "PresenceService":
+        return cls(
+            deliver=deliver,
+            delta_interval=float(os.getenv('PRESENCE_DELTA_INTERVAL_MS', '100')) / 1000,
+            sync_interval=float(os.getenv('PRESENCE_SYNC_INTERVAL_MS', '1000')) / 1000
+        )
+
+    def start(self, backend: AsyncBackendClient):
+        self.backend = backend
+        if self.sync_enabled:
+            self._task = asyncio.create_task(self._run_sync())
+
+    # ================================
+    # MUDANÇAS DE PRESENÇA
+    # ================================
+
+    def join(self, room_id: str, user_id: str, username: str,
+             origin: str = ORIGIN_LOCAL, joined_at: Optional[float] = None) -> Optional[PresenceEntry]:
+        return self.set_status(room_id, user_id, username, STATUS_ONLINE, origin, joined_at)
+
+    def leave(self, room_id: str, user_id: str, username: str = "",
+              origin: str = ORIGIN_LOCAL) -> Optional[PresenceEntry]:
+        entry = self.store.remove(room_id, user_id, username, origin)
+        if entry is not None:
+            status, entry.status = entry.status, STATUS_OFFLINE
+            self._record(room_id, entry, status, origin)
+        return entry
+
+    def set_status(self, room_id: str, user_id: str, username: str, status: str,
+                   origin: str = ORIGIN_LOCAL, joined_at: Optional[float] = None) -> Optional[PresenceEntry]:
+        if status == STATUS_OFFLINE:
+            return self.leave(room_id, user_id, username, origin)
+        before = self.store.resolve(room_id, user_id, username)
+        before_status = before.status if before is not None else None
+        change = self.store.upsert(room_id, user_id, username, status, origin, joined_at)
+        if change is not None:
+            self._record(room_id, change[1], before_status, origin)
+        return self.store.resolve(room_id, user_id, username)
+
+    def apply_peer(self, room_id: str, user_id: str, user_info: Optional[Dict[str, Any]]):
+        """Presença publicada por outro processo do gateway (ou o eco da nossa) no backplane"""
+        if user_info is None:
+            self.leave(room_id, user_id, origin=ORIGIN_PEER)
+        else:
+            self.join(room_id, user_id, user_info["username"], ORIGIN_PEER, user_info.get("joined_at"))
+
+    def _record(self, room_id: str, entry: PresenceEntry, before_status: Optional[str], origin: str):
+        presence_users.set(len(self.store))
+        if origin == ORIGIN_LOCAL and self.sync_enabled:
+            self._dirty[(room_id, entry.username)] = (entry.user_id, entry.status)
+
+        room = self._pending.setdefault(room_id, {})
+        pending = room.get(entry.username)
+        after_status = None if entry.status == STATUS_OFFLINE else entry.status
+        if pending is None:
+            room[entry.username] = [before_status, after_status, entry.user_id, entry.version]
+        else:
+            pending[1], pending[2], pending[3] = after_status, entry.user_id, entry.version
+        if self.delta_interval <= 0:
+            self._flush_deltas()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.delta_interval, self._flush_deltas)
+
+    def _flush_deltas(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        now = time.time()
+        for room_id, users in pending.items():
+            changes = []
+            for username, (before, after, user_id, version) in users.items():
+                if before is None and after is None:
+                    # Entrou e saiu na mesma janela: ninguém precisa saber
+                    continue
+                if before is None:
+                    op = OP_JOIN
+                elif after is None:
+                    op = OP_LEAVE
+                elif before != after:
+                    op = OP_STATUS
+                else:
+                    continue
+                presence_deltas_total.labels(op=op).inc()
+                changes.append({
+                    "op": op, "user_id": user_id, "username": username,
+                    "status": after or STATUS_OFFLINE, "version": version
+                })
+            if not changes or self.deliver is None:
+                continue
+            self.delta_frames += 1
+            presence_delta_frames_total.inc()
+            self.deliver(room_id, {
+                "type": "PRESENCE_DELTA",
+                "room_id": room_id,
+                "version": self.store.version(room_id),
+                "changes": changes,
+                "total_count": self.store.count(room_id),
+                "timestamp": now
+            })
+
+    # ================================
+    # CONSULTAS
+    # ================================
+
+    def users(self, room_id: str) -> List[Dict[str, Any]]:
+        return [entry.to_dict() for entry in self.store.room(room_id)]
+
+    def snapshot(self, room_id: str) -> Dict[str, Any]:
+        """ONLINE_USERS de quem entra; deltas com version <= a deste snapshot já estão nele"""
+        users = [
+            {"user_id": entry.user_id, "username": entry.username, "status": entry.status}
+            for entry in self.store.room(room_id)
+        ]
+        return {
+            "type": "ONLINE_USERS",
+            "room_id": room_id,
+            "version": self.store.version(room_id),
+            "users": users,
+            "total_count": len(users)
+        }
+
+    # ================================
+    # SINCRONIZAÇÃO COM O MÓDULO A
+    # ================================
+
+    async def _run_sync(self):
+        while self.sync_enabled:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def sync(self):
+        """Um SyncPresence: envia as mudanças locais acumuladas e aplica as do Módulo A"""
+        dirty, self._dirty = self._dirty, {}
+        changes = [
+            servico_pb2.PresenceChange(room_id=room_id, user=servico_pb2.UserInfo(
+                user_id=user_id, username=username, status=servico_pb2.UserStatus.Value(status),
+                last_seen=int(time.time() * 1000)
+            ))
+            for (room_id, username), (user_id, status) in dirty.items()
+        ]
+        try:
+            response = await self.backend.sync_presence(changes, self.since_version, timeout=self.timeout)
+        except asyncio.CancelledError:
+            self._restore_dirty(dirty)
+            raise
+        except Exception as e:
+            self._restore_dirty(dirty)
+            presence_sync_total.labels(result="error").inc()
+            self.sync_errors += 1
+            if isinstance(e, grpc.RpcError) and e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                logger.warning("⚠️ Módulo A sem SyncPresence: presença fica restrita ao gateway")
+                self.sync_enabled = False
+                self._dirty.clear()
+            elif self.sync_errors == 1 or self.sync_errors % 60 == 0:
+                logger.warning(f"⚠️ Falha ao sincronizar presença com o Module A ({self.sync_errors}x): {e}")
+            return
+        presence_sync_total.labels(result="ok").inc()
+        presence_sync_changes_total.labels(direction="sent").inc(len(changes))
+        presence_sync_changes_total.labels(direction="received").inc(len(response.changes))
+        self.syncs += 1
+        self.sync_errors = 0
+        self._apply_remote(response)
+        self.since_version = response.version
+
+    def _restore_dirty(self, dirty: Dict[Tuple[str, str], Tuple[str, str]]):
+        # Mudanças que chegaram durante a chamada são mais novas e prevalecem
+        for key, value in dirty.items():
+            self._dirty.setdefault(key, value)
+
+    def _apply_remote(self, response: servico_pb2.PresenceSyncResponse):
+        seen = set()
+        for change in response.changes:
+            user = change.user
+            if (change.room_id, user.username) in self._dirty:
+                # Há uma mudança local mais nova ainda não enviada
+                continue
+            seen.add((change.room_id, user.username))
+            self.set_status(change.room_id, user.user_id, user.username,
+                            servico_pb2.UserStatus.Name(user.status), ORIGIN_MODULE_A)
+        if response.full:
+            # Snapshot completo: quem só o Módulo A conhecia e não está mais nele saiu
+            for room_id in self.store.rooms():
+                for entry in self.store.room(room_id):
+                    if entry.origin == ORIGIN_MODULE_A and (room_id, entry.username) not in seen:
+                        self.leave(room_id, entry.user_id, entry.username, ORIGIN_MODULE_A)
+
+    async def close(self):
+        self.sync_enabled = False
+        if self._task is not None:
+            self._task.cancel()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def stats(self) -> Dict[str, Any]:
+        origins: Dict[str, int] = {}
+        for room_id in self.store.rooms():
+            for entry in self.store.room(room_id):
+                origins[entry.origin] = origins.get(entry.origin, 0) + 1
+        return {
+            "rooms": len(self.store.rooms()),
+            "users": len(self.store),
+            "users_by_origin": origins,
+            "delta_interval_ms": self.delta_interval * 1000,
+            "delta_frames": self.delta_frames,
+            "pending_deltas": sum(len(users) for users in self._pending.values()),
+            "module_a_sync": {
+                "enabled": self.sync_enabled,
+                "interval_ms": self.sync_interval * 1000,
+                "since_version": self.since_version,
+                "syncs": self.syncs,
+                "consecutive_errors": self.sync_errors,
+                "unsent_changes": len(self._dirty),
+            },
+        }
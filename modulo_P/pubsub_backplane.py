@@ -0,0 +1,304 @@
+"""
+Backplane pub/sub do Módulo P (várias réplicas/pods)
+Cada sala é um canal de pub/sub. Um pod assina apenas as salas que têm membros
+conectados a ele, e os eventos publicados (mensagens armazenadas, broadcasts,
+presença, arquivos) são agrupados por sala e enviados em lote: um publish por
+sala a cada GATEWAY_PUBSUB_BATCH_MS (ou ao atingir GATEWAY_PUBSUB_MAX_BATCH).
+Um lote que falha ao publicar volta para a frente da fila da sala e é tentado
+de novo a cada GATEWAY_PUBSUB_RETRY_MS, até GATEWAY_PUBSUB_MAX_PENDING eventos
+pendentes por sala.
+
+Os seqs das mensagens do histórico são reservados no próprio broker, na mesma
+operação atômica do publish (script Lua no Redis), de modo que todos os pods
+que acompanham a sala veem as mensagens na mesma ordem e com os mesmos seqs.
+Um pod guarda o histórico de uma sala a partir do momento em que a assina.
+
+- redis: redis.asyncio (GATEWAY_REDIS_URL), opcional
+- memory: broker falso em processo com a mesma semântica, para testes
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import json_codec
+from backplane import BACKPLANE_MEMORY, BACKPLANE_REDIS, Backplane, split_seq_frame
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# (room_id, primeiro seq do lote, payload)
+PubSubMessage = Tuple[str, int, bytes]
+
+# INCRBY do contador de seqs + PUBLISH, atômicos: a ordem de entrega é a ordem dos seqs
+_PUBLISH_BATCH_SCRIPT = """
+local count = tonumber(ARGV[1])
+local first = redis.call('INCRBY', KEYS[1], count) - count + 1
+redis.call('PUBLISH', KEYS[2], first .. '|' .. ARGV[2])
+return first
+"""
+
+
+class PubSubClient:
+    """Transporte do backplane: publish em lote com reserva de seqs e assinatura por sala"""
+
+    name = ""
+
+    async def publish_batch(self, room_id: str, seq_count: int, payload: bytes):
+        raise NotImplementedError
+
+    async def subscribe(self, room_id: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, room_id: str):
+        raise NotImplementedError
+
+    def messages(self) -> AsyncIterator[PubSubMessage]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class RedisPubSubClient(PubSubClient):
+    """Pub/sub do Redis (ou compatível), um canal por sala"""
+
+    name = BACKPLANE_REDIS
+
+    def __init__(self, url: str, prefix: str = "modulo_p", poll_interval: float = 1.0):
+        if aioredis is None:
+            raise RuntimeError("GATEWAY_BACKPLANE=redis requer o pacote 'redis' (pip install redis)")
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+        self._redis = aioredis.from_url(url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._script = self._redis.register_script(_PUBLISH_BATCH_SCRIPT)
+        self._channels: Set[str] = set()
+
+    def _channel(self, room_id: str) -> str:
+        return f"{self.prefix}:room:{room_id}"
+
+    def _seq_key(self, room_id: str) -> str:
+        return f"{self.prefix}:seq:{room_id}"
+
+    async def publish_batch(self, room_id: str, seq_count: int, payload: bytes):
+        await self._script(keys=[self._seq_key(room_id), self._channel(room_id)], args=[seq_count, payload])
+
+    async def subscribe(self, room_id: str):
+        channel = self._channel(room_id)
+        self._channels.add(channel)
+        await self._pubsub.subscribe(channel)
+
+    async def unsubscribe(self, room_id: str):
+        channel = self._channel(room_id)
+        self._channels.discard(channel)
+        await self._pubsub.unsubscribe(channel)
+
+    async def messages(self) -> AsyncIterator[PubSubMessage]:
+        channel_prefix = f"{self.prefix}:room:"
+        while True:
+            if not self._channels:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            message = await self._pubsub.get_message(timeout=self.poll_interval)
+            if message is None or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode("utf-8")
+            first_seq, payload = split_seq_frame(message["data"])
+            yield channel[len(channel_prefix):], first_seq, payload
+
+    async def close(self):
+        await self._pubsub.close()
+        await self._redis.close()
+
+
+class InMemoryPubSub:
+    """Broker falso em processo (vários clientes simulam vários pods)"""
+
+    def __init__(self):
+        self.seqs: Dict[str, int] = {}
+        self.subscribers: Dict[str, Set["InMemoryPubSubClient"]] = {}
+
+    def publish(self, room_id: str, seq_count: int, payload: bytes) -> int:
+        first_seq = self.seqs.get(room_id, 0) + 1
+        self.seqs[room_id] = first_seq + seq_count - 1
+        for client in list(self.subscribers.get(room_id, ())):
+            client.queue.put_nowait((room_id, first_seq, payload))
+        return first_seq
+
+
+class InMemoryPubSubClient(PubSubClient):
+    name = BACKPLANE_MEMORY
+
+    def __init__(self, broker: InMemoryPubSub):
+        self.broker = broker
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def publish_batch(self, room_id: str, seq_count: int, payload: bytes):
+        self.broker.publish(room_id, seq_count, payload)
+
+    async def subscribe(self, room_id: str):
+        self.broker.subscribers.setdefault(room_id, set()).add(self)
+
+    async def unsubscribe(self, room_id: str):
+        self.broker.subscribers.get(room_id, set()).discard(self)
+
+    async def messages(self) -> AsyncIterator[PubSubMessage]:
+        while True:
+            yield await self.queue.get()
+
+
+class PubSubBackplane(Backplane):
+    """Backplane por sala sobre um PubSubClient, com eventos agrupados em lotes"""
+
+    def __init__(self, client: PubSubClient, batch_interval: float = 0.002, max_batch: int = 256,
+                 retry_interval: float = 0.5, max_pending: int = 10000):
+        super().__init__()
+        self.client = client
+        self.name = client.name
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.retry_interval = retry_interval
+        self.max_pending = max_pending
+        self.rooms: Set[str] = set()
+        self.batches_published = 0
+        self.events_published = 0
+        self.publish_failures = 0
+        self.events_dropped = 0
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._flush_lock = asyncio.Lock()
+        self._reader: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, backend: str) -> "PubSubBackplane":
+        if backend == BACKPLANE_REDIS:
+            client = RedisPubSubClient(
+                os.getenv('GATEWAY_REDIS_URL', 'redis://localhost:6379/0'),
+                prefix=os.getenv('GATEWAY_PUBSUB_PREFIX', 'modulo_p')
+            )
+        else:
+            client = InMemoryPubSubClient(InMemoryPubSub())
+        return cls(
+            client,
+            batch_interval=float(os.getenv('GATEWAY_PUBSUB_BATCH_MS', '2')) / 1000,
+            max_batch=int(os.getenv('GATEWAY_PUBSUB_MAX_BATCH', '256')),
+            retry_interval=float(os.getenv('GATEWAY_PUBSUB_RETRY_MS', '500')) / 1000,
+            max_pending=int(os.getenv('GATEWAY_PUBSUB_MAX_PENDING', '10000'))
+        )
+
+    async def start(self, on_event):
+        await super().start(on_event)
+        self._reader = asyncio.create_task(self._read())
+
+    async def subscribe(self, room_id: str):
+        if room_id not in self.rooms:
+            self.rooms.add(room_id)
+            await self.client.subscribe(room_id)
+
+    async def unsubscribe(self, room_id: str):
+        if room_id in self.rooms:
+            self.rooms.discard(room_id)
+            await self.client.unsubscribe(room_id)
+
+    async def publish(self, event: Dict[str, Any]):
+        """Enfileira o evento no lote da sala; o lote sai no próximo flush"""
+        batch = self._pending.setdefault(event["room_id"], [])
+        batch.append(event)
+        if len(batch) >= self.max_batch:
+            await self.flush()
+        else:
+            self._schedule_flush(self.batch_interval)
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(delay, self._spawn_flush)
+
+    def _spawn_flush(self):
+        """Flush do timer como tarefa mantida até terminar"""
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            failed = False
+            for room_id, events in pending.items():
+                seq_count = sum(1 for event in events if event["kind"] == "message")
+                payload = json_codec.dumps(events).encode("utf-8")
+                try:
+                    await self.client.publish_batch(room_id, seq_count, payload)
+                except Exception as e:
+                    self.publish_failures += 1
+                    # Volta para a frente da fila da sala (antes dos eventos que chegaram nesse meio-tempo)
+                    retry = events + self._pending.get(room_id, [])
+                    if len(retry) > self.max_pending:
+                        self.events_dropped += len(events)
+                        logger.error(f"❌ Falha ao publicar {len(events)} evento(s) da sala {room_id}, "
+                                     f"fila cheia, descartados: {e}")
+                        continue
+                    logger.warning(f"⚠️ Falha ao publicar {len(events)} evento(s) da sala {room_id}, "
+                                   f"nova tentativa em {self.retry_interval}s: {e}")
+                    self._pending[room_id] = retry
+                    failed = True
+                    continue
+                self.batches_published += 1
+                self.events_published += len(events)
+            if failed:
+                self._schedule_flush(self.retry_interval)
+
+    async def _read(self, retry_interval: float = 1.0):
+        while True:
+            try:
+                async for room_id, first_seq, payload in self.client.messages():
+                    await self._apply_batch(room_id, first_seq, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Assinatura do backplane interrompida: {e}")
+                await asyncio.sleep(retry_interval)
+
+    async def _apply_batch(self, room_id: str, first_seq: int, payload: bytes):
+        seq = first_seq
+        for event in json_codec.loads(payload):
+            if event["kind"] == "message":
+                # Seq reservado pelo broker: igual em todos os pods
+                event["seq"] = seq
+                seq += 1
+            try:
+                await self.on_event(event)
+            except Exception as e:
+                logger.error(f"❌ Erro ao aplicar evento da sala {room_id}: {e}")
+
+    async def close(self):
+        await self.flush()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._reader is not None:
+            self._reader.cancel()
+        await self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "subscribed_rooms": len(self.rooms),
+            "batches_published": self.batches_published,
+            "events_published": self.events_published,
+            "publish_failures": self.publish_failures,
+            "events_dropped": self.events_dropped,
+        }
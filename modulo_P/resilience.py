@@ -0,0 +1,351 @@
+"""
+Camada de resiliência das chamadas aos backends do Módulo P
+- Prazos: cada requisição de entrada pode trazer um orçamento de tempo
+  (X-Request-Timeout-Ms ou REQUEST_DEADLINE_MS), guardado em um contextvar e
+  herdado por todas as chamadas feitas a partir dela; cada método também tem o
+  seu orçamento (BACKEND_DEADLINES="Metodo=segundos,..."). O timeout efetivo
+  de um RPC é o menor entre o pedido pelo chamador, o do método e o que resta
+  do prazo, e segue para o backend como deadline gRPC.
+- Circuit breaker por backend: após CIRCUIT_FAILURE_THRESHOLD falhas seguidas
+  (indisponível, deadline, sobrecarga) o circuito abre e as chamadas falham na
+  hora com CircuitOpenError (um grpc.RpcError UNAVAILABLE, tratado pelos
+  fallbacks que já existem); depois de CIRCUIT_RESET_TIMEOUT_MS uma chamada de
+  teste decide se ele fecha ou volta a abrir.
+- Hedging: para métodos unary idempotentes (HEDGED_METHODS), se a resposta não
+  chega em HEDGE_DELAY_MS uma segunda tentativa é disparada e vale a primeira
+  que responder; a outra é cancelada.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Set
+
+import grpc
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DE RESILIÊNCIA
+# ==============================================================================
+backend_circuit_state = Gauge(
+    'backend_circuit_state',
+    'Circuit breaker state per backend (0=closed, 1=half_open, 2=open)',
+    ['backend']
+)
+
+backend_circuit_rejections_total = Counter(
+    'backend_circuit_rejections_total',
+    'Backend calls rejected by an open circuit breaker',
+    ['backend']
+)
+
+backend_deadline_exhausted_total = Counter(
+    'backend_deadline_exhausted_total',
+    'Backend calls not started because the request deadline was already spent',
+    ['method']
+)
+
+backend_hedged_requests_total = Counter(
+    'backend_hedged_requests_total',
+    'Hedged attempts fired for slow idempotent calls',
+    ['method', 'winner']  # primary ou hedge
+)
+# ==============================================================================
+
+STATE_CLOSED = "closed"
+STATE_HALF_OPEN = "half_open"
+STATE_OPEN = "open"
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+# Códigos que indicam backend degradado (erros de aplicação não abrem o circuito)
+FAILURE_CODES = frozenset({
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.INTERNAL,
+    grpc.StatusCode.UNKNOWN,
+})
+
+# Cabeçalho HTTP com o orçamento de tempo da requisição, em milissegundos
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# Prazo absoluto (time.monotonic) da requisição em andamento
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("backend_deadline", default=None)
+
+
+class LocalRpcError(grpc.RpcError):
+    """Erro gerado no próprio gateway, com a interface de um grpc.RpcError"""
+
+    def __init__(self, code: grpc.StatusCode, details: str):
+        super().__init__(details)
+        self._code = code
+        self._details = details
+
+    def code(self) -> grpc.StatusCode:
+        return self._code
+
+    def details(self) -> str:
+        return self._details
+
+    def __str__(self) -> str:
+        return self._details
+
+
+class CircuitOpenError(LocalRpcError):
+    def __init__(self, backend: str):
+        super().__init__(grpc.StatusCode.UNAVAILABLE, f"Circuito aberto para {backend}")
+
+
+class DeadlineExhausted(LocalRpcError):
+    def __init__(self, method: str):
+        super().__init__(grpc.StatusCode.DEADLINE_EXCEEDED, f"Prazo da requisição esgotado antes de {method}")
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """Limita o prazo das chamadas feitas dentro do bloco (nunca estende um prazo já definido)"""
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def detached_scope() -> Iterator[None]:
+    """Ignora o prazo da requisição atual no bloco (streams que sobrevivem à requisição que os abre)"""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Segundos até o prazo da requisição atual (None se não há prazo)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_failure(error: BaseException) -> bool:
+    """Falha que conta para o circuit breaker (os erros gerados localmente não contam)"""
+    if isinstance(error, LocalRpcError):
+        return False
+    if isinstance(error, grpc.RpcError):
+        return error.code() in FAILURE_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError))
+
+
+def is_backend_response(error: BaseException) -> bool:
+    """Erro com status gRPC vindo do backend: ele respondeu, está de pé"""
+    return isinstance(error, grpc.RpcError) and not isinstance(error, LocalRpcError)
+
+
+class CircuitBreaker:
+    """Circuit breaker de um backend: closed -> open -> half_open (uma chamada de teste)"""
+
+    def __init__(self, backend: str, failure_threshold: int = 5, reset_timeout: float = 5.0):
+        self.backend = backend
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejections = 0
+        self._probing = False
+        backend_circuit_state.labels(backend=backend).set(0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"⚡ Circuito de {self.backend}: {self.state} -> {state}")
+            self.state = state
+            backend_circuit_state.labels(backend=self.backend).set(_STATE_VALUES[state])
+
+    def is_open(self) -> bool:
+        """Aberto e ainda dentro do intervalo de espera (chamadas seriam rejeitadas)"""
+        return self.state == STATE_OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def check(self):
+        """Falha na hora com o circuito aberto (sem reservar a chamada de teste)"""
+        if self.is_open():
+            self._reject()
+
+    def before_call(self):
+        if self.state == STATE_OPEN:
+            if self.is_open():
+                self._reject()
+            self._set_state(STATE_HALF_OPEN)
+        if self.state == STATE_HALF_OPEN:
+            if self._probing:
+                self._reject()
+            self._probing = True
+
+    def _reject(self):
+        self.rejections += 1
+        backend_circuit_rejections_total.labels(backend=self.backend).inc()
+        raise CircuitOpenError(self.backend)
+
+    def record_success(self):
+        self._probing = False
+        self.failures = 0
+        self._set_state(STATE_CLOSED)
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(STATE_OPEN)
+
+    def record(self, error: BaseException, classify: Callable[[BaseException], bool] = is_failure,
+               responded: Callable[[BaseException], bool] = is_backend_response):
+        if classify(error):
+            self.record_failure()
+        elif responded(error):
+            # Resposta de erro da aplicação: o backend está de pé
+            self.record_success()
+        else:
+            # Erro do próprio gateway (bug, prazo ou rejeição local): não diz nada sobre o backend
+            self.release()
+
+    def release(self):
+        """Chamada cancelada pelo chamador: não conta como sucesso nem como falha"""
+        self._probing = False
+
+    async def call(self, factory: Callable[[], Awaitable[Any]],
+                   classify: Callable[[BaseException], bool] = is_failure,
+                   responded: Callable[[BaseException], bool] = is_backend_response) -> Any:
+        self.before_call()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception as e:
+            self.record(e, classify, responded)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejections": self.rejections,
+        }
+
+
+def _parse_budgets(spec: str) -> Dict[str, float]:
+    budgets = {}
+    for item in spec.split(","):
+        method, _, seconds = item.strip().partition("=")
+        if method and seconds:
+            budgets[method.strip()] = float(seconds)
+    return budgets
+
+
+class Resilience:
+    """Orçamentos por método, circuit breakers por backend e hedging dos unary idempotentes"""
+
+    # Orçamentos padrão dos métodos no caminho do chat (os demais usam o timeout do chamador)
+    DEFAULT_BUDGETS = {
+        "ChatStream": 2.0,  # por mensagem no stream, não o tempo de vida do stream
+        "RealizarTarefaALote": 2.0,
+        "UpdateUserStatus": 2.0,
+        # Não entra no hedging: o lote de deltas não é idempotente
+        "SyncPresence": 2.0,
+        "LoginUser": 5.0,
+    }
+
+    def __init__(self, budgets: Optional[Dict[str, float]] = None, failure_threshold: int = 5,
+                 reset_timeout: float = 5.0, hedged_methods: Optional[Set[str]] = None,
+                 hedge_delay: float = 0.05):
+        self.budgets = dict(self.DEFAULT_BUDGETS if budgets is None else budgets)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedged_methods = set(hedged_methods or ())
+        self.hedge_delay = hedge_delay
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.hedges = 0
+
+    @classmethod
+    def from_env(cls) -> "Resilience":
+        budgets = dict(cls.DEFAULT_BUDGETS)
+        budgets.update(_parse_budgets(os.getenv('BACKEND_DEADLINES', '')))
+        hedge_delay_ms = float(os.getenv('HEDGE_DELAY_MS', '50'))
+        return cls(
+            budgets=budgets,
+            failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('CIRCUIT_RESET_TIMEOUT_MS', '5000')) / 1000,
+            hedged_methods={
+                method.strip() for method in os.getenv('HEDGED_METHODS', 'ListFiles').split(",")
+                if method.strip()
+            } if hedge_delay_ms > 0 else set(),
+            hedge_delay=hedge_delay_ms / 1000
+        )
+
+    def breaker(self, backend: str) -> CircuitBreaker:
+        if backend not in self.breakers:
+            self.breakers[backend] = CircuitBreaker(backend, self.failure_threshold, self.reset_timeout)
+        return self.breakers[backend]
+
+    def timeout_for(self, method: str, timeout: Optional[float]) -> Optional[float]:
+        """Menor entre o timeout pedido, o orçamento do método e o que resta do prazo da requisição"""
+        candidates = [value for value in (timeout, self.budgets.get(method), remaining()) if value is not None]
+        if not candidates:
+            return None
+        effective = min(candidates)
+        if effective <= 0:
+            backend_deadline_exhausted_total.labels(method=method).inc()
+            raise DeadlineExhausted(method)
+        return effective
+
+    async def call(self, backend: str, method: str, factory: Callable[[], Awaitable[Any]],
+                   classify: Callable[[BaseException], bool] = is_failure) -> Any:
+        """Executa a chamada pelo breaker do backend, com hedging se o método for idempotente"""
+        breaker = self.breaker(backend)
+        if method not in self.hedged_methods:
+            return await breaker.call(factory, classify)
+
+        primary = asyncio.ensure_future(breaker.call(factory, classify))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if done:
+                return primary.result()
+            self.hedges += 1
+            hedge = asyncio.ensure_future(breaker.call(factory, classify))
+            pending.add(hedge)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        backend_hedged_requests_total.labels(
+                            method=method, winner="primary" if task is primary else "hedge"
+                        ).inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budgets": self.budgets,
+            "hedged_methods": sorted(self.hedged_methods),
+            "hedge_delay_ms": self.hedge_delay * 1000,
+            "hedges": self.hedges,
+            "breakers": {backend: breaker.stats() for backend, breaker in self.breakers.items()},
+        }
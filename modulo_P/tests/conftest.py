@@ -0,0 +1,28 @@
+"""
+Configuração dos testes do Módulo P
+Os módulos do gateway importam servico_pb2/servico_pb2_grpc, gerados a partir
+do .proto no build (generate_protos.py). Fora do container, os stubs são
+gerados uma vez em um diretório temporário antes da coleta dos testes.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+MODULO_P = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MODULO_P)
+
+try:
+    import servico_pb2  # noqa: F401
+except ImportError:
+    _stubs = tempfile.mkdtemp(prefix="modulo_p_protos_")
+    _protos = os.path.join(MODULO_P, "protos")
+    subprocess.run([
+        sys.executable, "-m", "grpc_tools.protoc",
+        f"--proto_path={_protos}",
+        f"--python_out={_stubs}",
+        f"--grpc_python_out={_stubs}",
+        os.path.join(_protos, "servico.proto")
+    ], check=True)
+    sys.path.insert(0, _stubs)
@@ -0,0 +1,90 @@
+"""
+Backplane unix: o hub reserva os seqs das mensagens por sala
+"""
+
+import asyncio
+
+from backplane import BackplaneHub, UnixSocketBackplane
+from history_store import HistoryStore
+
+
+class Worker:
+    """Um worker do gateway: histórico próprio alimentado pelo hub"""
+
+    def __init__(self, path: str):
+        self.backplane = UnixSocketBackplane(path, reconnect_interval=0.01)
+        self.history = HistoryStore()
+        self.events = []
+
+    async def start(self):
+        await self.backplane.start(self.apply)
+
+    async def apply(self, event):
+        self.events.append(event)
+        if event["kind"] == "message":
+            self.history.append(event["room_id"], event["message"], event.get("seq"))
+
+    async def publish(self, room_id: str, content: str):
+        room = self.history.room(room_id)
+        await self.backplane.publish({
+            "kind": "message", "room_id": room_id, "message": {"content": content},
+            "next_seq": room.next_seq if room is not None else 1
+        })
+
+    def page(self, room_id: str, **cursors):
+        return [(record.seq, record.get("content")) for record in self.history.page(room_id, 50, **cursors).records]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+def test_late_worker_gets_the_same_seqs_and_cursors(tmp_path):
+    async def scenario():
+        hub = BackplaneHub(str(tmp_path / "bus.sock"))
+        await hub.start()
+        first = Worker(hub.path)
+        await first.start()
+        await first.publish("r", "a")
+        await first.publish("r", "b")
+        await first.backplane.publish({"kind": "broadcast", "room_id": "r", "message": {}})
+        await settle()
+
+        # Conecta depois das duas primeiras mensagens
+        late = Worker(hub.path)
+        await late.start()
+        await late.publish("r", "c")
+        await settle()
+        await first.publish("r", "d")
+        await settle()
+
+        assert first.page("r") == [(1, "a"), (2, "b"), (3, "c"), (4, "d")]
+        assert late.page("r") == [(3, "c"), (4, "d")]
+        # Um cursor de um worker aponta para as mesmas mensagens no outro
+        assert late.page("r", after=3) == first.page("r", after=3) == [(4, "d")]
+        assert "seq" not in first.events[2]
+        for worker in (first, late):
+            await worker.backplane.close()
+        hub._server.close()
+
+    asyncio.run(scenario())
+
+
+def test_hub_restart_continues_from_the_publisher_next_seq(tmp_path):
+    async def scenario():
+        hub = BackplaneHub(str(tmp_path / "bus.sock"))
+        await hub.start()
+        worker = Worker(hub.path)
+        # Histórico restaurado do log: a sala já tem seqs até 41
+        worker.history.append("r", {"content": "antiga"}, seq=41)
+        await worker.start()
+        await worker.publish("r", "nova")
+        await settle()
+
+        assert worker.page("r") == [(41, "antiga"), (42, "nova")]
+        assert hub.seqs == {"r": 42}
+        await worker.backplane.close()
+        hub._server.close()
+
+    asyncio.run(scenario())
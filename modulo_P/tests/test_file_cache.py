@@ -0,0 +1,91 @@
+"""
+Cache de arquivos: LRU limitado em bytes, base64 reaproveitado e despejo em disco
+"""
+
+import asyncio
+
+from file_cache import FileCache
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_lru_evicts_least_recently_used_within_the_byte_limit():
+    async def scenario():
+        cache = FileCache(max_bytes=30)
+        await cache.put("a", b"a" * 10)
+        await cache.put("b", b"b" * 10)
+        await cache.put("c", b"c" * 10)
+        # Acesso a "a" o torna o mais recente: "b" sai primeiro
+        assert (await cache.get("a")).data == b"a" * 10
+        await cache.put("d", b"d" * 10)
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") is not None
+        assert cache.memory_bytes == 30
+        assert cache.stats()["memory_entries"] == 3
+
+    run(scenario())
+
+
+def test_files_larger_than_the_cache_are_not_stored():
+    async def scenario():
+        cache = FileCache(max_bytes=10)
+        assert await cache.put("grande", b"x" * 11) is None
+        assert await cache.put("vazio", b"") is None
+        assert cache.memory_bytes == 0
+
+    run(scenario())
+
+
+def test_base64_is_encoded_once_and_counts_towards_the_limit():
+    async def scenario():
+        cache = FileCache(max_bytes=19)
+        entry = await cache.put("a", b"abcdef")
+        other = await cache.put("b", b"123456")
+        encoded = await cache.base64(entry)
+        assert encoded == "YWJjZGVm"
+        assert await cache.base64(entry) is encoded
+        # 6 + 8 (base64) + 6 > 19: o menos recente ("a") é expulso
+        assert cache.memory_bytes == other.size == 6
+        assert await cache.get("a") is None
+
+    run(scenario())
+
+
+def test_replacing_an_entry_does_not_double_count():
+    async def scenario():
+        cache = FileCache(max_bytes=100)
+        await cache.put("a", b"x" * 40)
+        await cache.put("a", b"y" * 30)
+        assert cache.memory_bytes == 30
+        assert (await cache.get("a")).data == b"y" * 30
+
+    run(scenario())
+
+
+def test_evicted_entries_spill_to_disk_and_are_promoted_back(tmp_path):
+    async def scenario():
+        cache = FileCache(max_bytes=10, spill_dir=str(tmp_path), spill_max_bytes=15)
+        await cache.put("a", b"a" * 8)
+        await cache.put("b", b"b" * 8)
+        assert list(cache._disk) == ["a"] and cache.disk_bytes == 8
+
+        # Acerto em disco: "a" volta para a memória e "b" é despejado; o disco
+        # estoura o limite e perde a entrada mais antiga
+        assert (await cache.get("a")).data == b"a" * 8
+        assert list(cache._memory) == ["a"]
+        assert list(cache._disk) == ["b"] and cache.disk_bytes == 8
+        assert (await cache.get("b")).data == b"b" * 8
+
+        await cache.put("c", b"c" * 8)
+        assert list(cache._disk) == ["b"]
+        assert len(list(tmp_path.iterdir())) == 1
+
+        cache.invalidate("b")
+        assert cache.disk_bytes == 0
+        assert await cache.get("b") is None
+        assert (await cache.get("c")).data == b"c" * 8
+
+    run(scenario())
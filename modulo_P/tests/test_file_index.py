@@ -0,0 +1,82 @@
+"""
+Índice de arquivos por sala: paginação por cursor e filtros por uploader e mime
+"""
+
+import asyncio
+
+import pytest
+
+import servico_pb2
+from file_index import FileIndex
+
+
+def build() -> FileIndex:
+    index = FileIndex()
+    for number in range(1, 8):
+        mime_type = "image/png" if number % 2 else "application/pdf"
+        uploader = ("u1", "ana") if number <= 4 else ("u2", "bia")
+        index.add("r", f"f{number}", f"arquivo{number}", number * 10, mime_type, *uploader, uploaded_at=number)
+    index.add("outra", "x", "x.txt", 1, "text/plain", "u1", "ana", uploaded_at=1)
+    return index
+
+
+def ids(entries):
+    return [entry.file_id for entry in entries]
+
+
+def test_pages_newest_first_until_the_cursor_runs_out():
+    index = build()
+    pages = []
+    cursor = None
+    while True:
+        entries, cursor = index.list("r", limit=3, cursor=cursor)
+        pages.append(ids(entries))
+        if cursor is None:
+            break
+    assert pages == [["f7", "f6", "f5"], ["f4", "f3", "f2"], ["f1"]]
+    assert index.count("r") == 7
+
+
+def test_filters_by_uploader_and_mime_type():
+    index = build()
+    assert ids(index.list("r", uploader="ana")[0]) == ["f4", "f3", "f2", "f1"]
+    assert ids(index.list("r", uploader="u2", mime_type="image/*")[0]) == ["f7", "f5"]
+    entries, cursor = index.list("r", limit=2, mime_type="application/pdf")
+    assert ids(entries) == ["f6", "f4"]
+    assert ids(index.list("r", limit=2, mime_type="application/pdf", cursor=cursor)[0]) == ["f2"]
+    assert index.list("r", mime_type="video/*") == ([], None)
+
+
+def test_reuploaded_file_moves_to_the_top_and_removed_files_disappear():
+    index = build()
+    index.add("r", "f1", "novo", 0, "", "u1", "ana", uploaded_at=9)
+    index.remove("f7")
+    entries, _ = index.list("r", limit=2)
+    assert ids(entries) == ["f1", "f6"]
+    assert index.get("f1").file_size == 0
+    assert index.get("f1").mime_type == "application/octet-stream"
+    assert index.get("f7") is None
+    assert index.count("r") == 6
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        build().list("r", cursor="abc")
+
+
+def test_rebuild_after_live_uploads_keeps_older_files_below_them():
+    class FakeBackend:
+        async def list_files(self, room_id):
+            return servico_pb2.FileListResponse(files=[
+                servico_pb2.StoredFileInfo(file_id=f"b{number}", filename=f"b{number}.png", file_size=1,
+                                           mime_type="image/png", room_id="r", uploaded_at=number * 1000)
+                for number in (2, 1, 3)
+            ] + [servico_pb2.StoredFileInfo(file_id="vivo", room_id="r", uploaded_at=9000)])
+
+    index = FileIndex()
+    index.add("r", "vivo", "vivo.png", 1, "image/png", "u1", "ana", uploaded_at=9)
+    assert asyncio.run(index.rebuild(FakeBackend())) == 3
+    assert ids(index.list("r")[0]) == ["vivo", "b3", "b2", "b1"]
+    entries, cursor = index.list("r", limit=2, mime_type="image/*")
+    assert ids(entries) == ["vivo", "b3"]
+    assert ids(index.list("r", cursor=cursor, mime_type="image/png")[0]) == ["b2", "b1"]
@@ -0,0 +1,92 @@
+"""
+Histórico em ring buffer: paginação por cursor (seq e timestamp) e rolagem pelo log
+"""
+
+import asyncio
+
+from history_log import HistoryLog
+from history_store import HistoryStore
+
+
+def fill(store: HistoryStore, count: int, room_id: str = "r"):
+    for index in range(1, count + 1):
+        store.append(room_id, {"type": "message", "content": f"m{index}", "timestamp": 100.0 + index})
+
+
+def seqs(page):
+    return [record.seq for record in page.records]
+
+
+def test_backward_paging_walks_a_wrapped_buffer_until_the_oldest_message():
+    store = HistoryStore(default_capacity=10)
+    fill(store, 25)
+    room = store.room("r")
+    assert len(room) == 10 and room.first_seq == 16
+
+    page = store.page("r", 4)
+    assert seqs(page) == [22, 23, 24, 25]
+    assert (page.before_cursor, page.after_cursor) == (22, None)
+
+    pages = [seqs(page)]
+    while page.before_cursor is not None:
+        page = store.page("r", 4, before=page.before_cursor)
+        pages.append(seqs(page))
+    assert pages == [[22, 23, 24, 25], [18, 19, 20, 21], [16, 17]]
+    assert page.after_cursor == 17
+
+
+def test_forward_paging_with_after_cursor():
+    store = HistoryStore(default_capacity=10)
+    fill(store, 10)
+    page = store.page("r", 3, after=2)
+    assert seqs(page) == [3, 4, 5]
+    assert (page.before_cursor, page.after_cursor) == (3, 5)
+    page = store.page("r", 10, after=page.after_cursor)
+    assert seqs(page) == [6, 7, 8, 9, 10]
+    assert page.after_cursor is None
+
+    # Cursor já fora da janela: a página começa na mensagem mais antiga guardada
+    assert seqs(store.page("r", 2, after=0)) == [1, 2]
+    assert seqs(store.page("r", 2, after=10)) == []
+
+
+def test_both_cursors_and_timestamp_cursors():
+    store = HistoryStore(default_capacity=20)
+    fill(store, 10)
+    assert seqs(store.page("r", 2, after=3, before=8)) == [6, 7]
+    assert seqs(store.page("r", 10, before_timestamp=104.0)) == [1, 2, 3]
+    assert seqs(store.page("r", 2, after_timestamp=108.0)) == [9, 10]
+    assert seqs(store.page("r", 5, before=3, after=5)) == []
+    assert store.page("desconhecida", 5) == ([], None, None)
+
+
+def test_backplane_seqs_skip_duplicates_and_restart_after_a_gap():
+    store = HistoryStore(default_capacity=10)
+    store.append("r", {"content": "a"}, seq=1)
+    assert store.append("r", {"content": "a de novo"}, seq=1) is None
+    store.append("r", {"content": "b"}, seq=2)
+    message = {"content": "depois do salto"}
+    store.append("r", message, seq=7)
+    assert message["seq"] == 7
+    assert seqs(store.page("r", 10)) == [7]
+    assert store.page("r", 10).before_cursor is None
+
+
+def test_scrollback_continues_into_the_durable_log(tmp_path):
+    async def scenario():
+        log = HistoryLog(str(tmp_path), index_interval=2)
+        store = HistoryStore(default_capacity=5, log=log)
+        fill(store, 12)
+
+        page = await store.scrollback("r", 4)
+        assert seqs(page) == [9, 10, 11, 12]
+        page = await store.scrollback("r", 4, before=page.before_cursor)
+        # Janela em memória começa no seq 8: o restante vem do log, antes mesmo do fsync
+        assert seqs(page) == [5, 6, 7, 8]
+        assert [record.get("content") for record in page.records] == ["m5", "m6", "m7", "m8"]
+        page = await store.scrollback("r", 10, before=page.before_cursor)
+        assert seqs(page) == [1, 2, 3, 4]
+        assert page.before_cursor is None
+        log.close()
+
+    asyncio.run(scenario())
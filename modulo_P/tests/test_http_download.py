@@ -0,0 +1,83 @@
+"""
+Download HTTP: Range, ETag/If-None-Match e recorte do fluxo de chunks
+"""
+
+import asyncio
+
+import pytest
+
+from http_download import RangeNotSatisfiable, etag_matches, iter_range, make_etag, parse_range, slice_pieces
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("BYTES = 10-19", (10, 19)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "bytes=", "bytes=abc-10", "bytes=10", "bytes=20-10",
+    "bytes=0-1,5-9", "items=0-10",
+])
+def test_parse_range_falls_back_to_full_response(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_parse_range_outside_the_file_is_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+def test_etag_is_stable_and_depends_on_size():
+    etag = make_etag("f-1", 10)
+    assert etag == make_etag("f-1", 10)
+    assert etag != make_etag("f-1", 11)
+    assert etag.startswith('"') and etag.endswith('-10"')
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('"outro"', False),
+    ('"outro", {etag}', True),
+    ("W/{etag}", True),
+])
+def test_etag_matches(header, matches):
+    etag = make_etag("f-1", 10)
+    assert etag_matches(header and header.format(etag=etag), etag) is matches
+
+
+def collect(iterator):
+    async def run():
+        return [piece async for piece in iterator]
+    return asyncio.run(run())
+
+
+def test_slice_pieces_cuts_edges_and_stops_at_the_end():
+    closed = []
+
+    async def pieces():
+        try:
+            for index in range(10):
+                yield bytes([index]) * 4
+        finally:
+            closed.append(True)
+
+    sliced = collect(slice_pieces(pieces(), 6, 13))
+    assert b"".join(sliced) == b"\x01\x01\x02\x02\x02\x02\x03\x03"
+    assert closed == [True]
+
+
+def test_iter_range_uses_chunk_size():
+    data = bytes(range(100))
+    blocks = collect(iter_range(data, 10, 49, chunk_size=16))
+    assert [len(block) for block in blocks] == [16, 16, 8]
+    assert b"".join(blocks) == data[10:50]
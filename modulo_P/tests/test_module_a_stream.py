@@ -0,0 +1,162 @@
+"""
+ChatStream persistente com o Módulo A: reabertura depois de o circuito abrir e fechar
+"""
+
+import asyncio
+
+import grpc
+
+import servico_pb2
+from aio_clients import AsyncBackendClient, MODULO_A
+from channel_pool import PooledChannel
+from module_a_stream import ChatStreamClient, StreamInterrupted, StreamUnavailable
+from resilience import STATE_CLOSED, Resilience
+
+
+class FakeModuleA:
+    """Módulo A de mentira: ChatStream que ecoa as mensagens enquanto está no ar"""
+
+    def __init__(self):
+        self.up = True
+        self.opened = 0
+
+
+class FakeStreamCall:
+    def __init__(self, module: FakeModuleA):
+        self.module = module
+        self.responses: asyncio.Queue = asyncio.Queue()
+        self.callbacks = []
+        module.opened += 1
+
+    async def wait_for_connection(self):
+        if not self.module.up:
+            raise grpc.aio.AioRpcError(grpc.StatusCode.UNAVAILABLE, grpc.aio.Metadata(),
+                                       grpc.aio.Metadata(), "Módulo A fora do ar")
+
+    async def write(self, message):
+        self.responses.put_nowait(servico_pb2.ChatMessage(
+            message_id=message.message_id, content=message.content.upper()
+        ))
+
+    async def read(self):
+        return await self.responses.get()
+
+    def cancel(self):
+        self.responses.put_nowait(grpc.aio.EOF)
+        for callback in self.callbacks:
+            callback(self)
+        return True
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+
+class FakeChannel:
+    def __init__(self, module: FakeModuleA):
+        self.module = module
+
+    def stream_stream(self, method, **kwargs):
+        return lambda timeout=None: FakeStreamCall(self.module)
+
+    def __getattr__(self, name):
+        # Demais tipos de RPC dos stubs: não usados nestes testes
+        return lambda method, **kwargs: None
+
+
+class FakeChannels:
+    def __init__(self, module: FakeModuleA):
+        self.pooled = PooledChannel(MODULO_A, 0, FakeChannel(module))
+
+    def acquire(self, backend):
+        return self.pooled
+
+    def release(self, pooled):
+        pass
+
+    async def close(self):
+        pass
+
+
+async def wait_until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condição não atingida a tempo"
+        await asyncio.sleep(0.005)
+
+
+def test_stream_reconnects_after_circuit_opens_and_closes():
+    async def scenario():
+        module = FakeModuleA()
+        resilience = Resilience(failure_threshold=1, reset_timeout=0.05)
+        backend = AsyncBackendClient(FakeChannels(module), resilience)
+        breaker = resilience.breaker(MODULO_A)
+
+        # Módulo A fora do ar e circuito aberto antes de o stream conseguir abrir
+        module.up = False
+        breaker.record_failure()
+        assert breaker.is_open()
+
+        client = ChatStreamClient(backend, streams=1, reconnect_interval=0.01, max_reconnect_interval=0.02)
+        client.start()
+        try:
+            await wait_until(lambda: client.reconnects >= 3)
+            assert client.stats()["connected"] == 0
+            assert not client._tasks[0].done(), "a tarefa de reconexão não pode morrer com o circuito aberto"
+
+            # Módulo A volta: o circuito passa do intervalo de espera e o stream reabre
+            module.up = True
+            await wait_until(client.available)
+
+            response = await client.process("m-1", "u-1", "ana", "olá", "global")
+            assert response.message_id == "m-1"
+            assert response.content == "OLÁ"
+            assert breaker.state == STATE_CLOSED
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_dropped_stream_only_falls_back_for_messages_never_written():
+    async def scenario():
+        module = FakeModuleA()
+        backend = AsyncBackendClient(FakeChannels(module), Resilience())
+        client = ChatStreamClient(backend, streams=1, reconnect_interval=0.01)
+        client.start()
+        try:
+            await wait_until(client.available)
+            conn = client.connections[0]
+            writes = asyncio.Event()
+            calls = []
+
+            # Stream que aceita a escrita mas não responde; a segunda escrita trava
+            original_write = FakeStreamCall.write
+
+            async def write(call, message):
+                calls.append(call)
+                if message.message_id == "escrita":
+                    writes.set()
+                    return
+                await asyncio.Event().wait()
+
+            FakeStreamCall.write = write
+            try:
+                written = asyncio.create_task(client.process("escrita", "u", "ana", "a", "global"))
+                await writes.wait()
+                # Enfileirada atrás de uma escrita que nunca termina: não sai da fila
+                stuck = asyncio.create_task(client.process("travada", "u", "ana", "b", "global"))
+                queued = asyncio.create_task(client.process("na-fila", "u", "ana", "c", "global"))
+                await asyncio.sleep(0.01)
+                calls[0].cancel()
+                results = await asyncio.gather(written, stuck, queued, return_exceptions=True)
+            finally:
+                FakeStreamCall.write = original_write
+
+            assert type(results[0]) is StreamInterrupted
+            assert type(results[1]) is StreamInterrupted
+            assert type(results[2]) is StreamUnavailable
+            assert conn.written == set()
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,143 @@
+"""
+Armazenamento de presença: sessões por usuário, prioridade das origens e deltas
+"""
+
+import asyncio
+
+import servico_pb2
+from presence import (
+    ORIGIN_LOCAL, ORIGIN_MODULE_A, ORIGIN_PEER, OP_JOIN, OP_STATUS, PresenceService, PresenceStore
+)
+
+
+def usernames(store: PresenceStore, room_id: str = "r"):
+    return sorted(entry.username for entry in store.room(room_id))
+
+
+def test_second_connection_keeps_user_until_the_last_one_leaves():
+    store = PresenceStore()
+    assert store.upsert("r", "tab-1", "zed")[0] == OP_JOIN
+    assert store.upsert("r", "tab-2", "zed") is None
+    assert store.count("r") == 1
+
+    assert store.remove("r", "tab-1", "zed") is None
+    assert usernames(store) == ["zed"]
+    assert store.get("r", "tab-2").user_id == "tab-2"
+
+    assert store.remove("r", "tab-2", "zed").username == "zed"
+    assert usernames(store) == []
+    assert len(store) == 0
+
+
+def test_peer_cannot_end_a_local_session():
+    store = PresenceStore()
+    store.upsert("r", "u1", "ana", origin=ORIGIN_LOCAL)
+    # Eco do nosso próprio evento e leave de um id desconhecido: nada muda
+    assert store.upsert("r", "u1", "ana", origin=ORIGIN_PEER) is None
+    assert store.remove("r", "u1", origin=ORIGIN_PEER) is None
+    assert store.remove("r", "outro", "ana", origin=ORIGIN_PEER) is None
+    assert usernames(store) == ["ana"]
+    assert store.get("r", "u1").origin == ORIGIN_LOCAL
+
+
+def test_module_a_only_ends_what_came_from_module_a():
+    store = PresenceStore()
+    store.upsert("r", "login-1", "bia", origin=ORIGIN_MODULE_A)
+    store.upsert("r", "ws-1", "bia", origin=ORIGIN_LOCAL)
+    entry = store.get("r", "ws-1")
+    assert entry is store.get("r", "login-1")
+    assert (entry.user_id, entry.origin) == ("ws-1", ORIGIN_LOCAL)
+
+    # OFFLINE do Módulo A pelo username não derruba a conexão local
+    assert store.remove("r", "login-x", "bia", origin=ORIGIN_MODULE_A) is None
+    assert usernames(store) == ["bia"]
+
+    # A última conexão sai: o reflexo no Módulo A vai junto
+    assert store.remove("r", "ws-1", "bia", origin=ORIGIN_LOCAL) is entry
+    assert usernames(store) == []
+
+
+def test_peer_sessions_are_counted_per_connection():
+    store = PresenceStore()
+    store.upsert("r", "w1-tab", "zed", origin=ORIGIN_PEER)
+    store.upsert("r", "w2-tab", "zed", origin=ORIGIN_PEER)
+    assert store.remove("r", "w2-tab", origin=ORIGIN_PEER) is None
+    assert usernames(store) == ["zed"]
+    assert store.remove("r", "w1-tab", origin=ORIGIN_PEER) is not None
+
+
+def test_status_change_and_versions():
+    store = PresenceStore()
+    store.upsert("r", "u1", "ana")
+    version = store.version("r")
+    op, entry = store.upsert("r", "login", "ana", status="AWAY", origin=ORIGIN_MODULE_A)
+    assert op == OP_STATUS and entry.status == "AWAY"
+    assert store.version("r") == version + 1 == entry.version
+
+
+def test_deltas_are_batched_per_room_and_skip_join_leave_in_same_window():
+    async def scenario():
+        frames = []
+        presence = PresenceService(deliver=lambda room_id, frame: frames.append(frame),
+                                   delta_interval=0.01, sync_interval=0)
+        for index in range(20):
+            presence.join("r", f"u{index}", f"user{index}")
+        presence.join("r", "tab-2", "user0")
+        presence.join("r", "x", "passageiro")
+        presence.leave("r", "x", "passageiro")
+        snapshot = presence.snapshot("r")
+        await asyncio.sleep(0.03)
+
+        assert snapshot["total_count"] == 20
+        assert len(frames) == 1
+        changes = frames[0]["changes"]
+        assert len(changes) == 20
+        assert all(change["op"] == "join" for change in changes)
+        assert all(change["version"] <= snapshot["version"] for change in changes)
+
+        # Uma das duas abas de user0 fecha: ninguém vê saída
+        presence.leave("r", "u0", "user0")
+        await asyncio.sleep(0.03)
+        assert len(frames) == 1
+        presence.leave("r", "tab-2", "user0")
+        await asyncio.sleep(0.03)
+        assert [change["op"] for change in frames[1]["changes"]] == ["leave"]
+        await presence.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_sync_reconciles_entries_known_only_from_module_a():
+    class FakeBackend:
+        def __init__(self, response):
+            self.response = response
+            self.sent = []
+
+        async def sync_presence(self, changes, since_version, timeout):
+            self.sent.append((list(changes), since_version))
+            return self.response
+
+    def change(user_id, username, status):
+        return servico_pb2.PresenceChange(room_id="r", user=servico_pb2.UserInfo(
+            user_id=user_id, username=username, status=servico_pb2.UserStatus.Value(status)
+        ))
+
+    async def scenario():
+        presence = PresenceService(delta_interval=0, sync_interval=1)
+        presence.join("r", "ws-1", "ana")
+        presence.join("r", "old", "fantasma", origin=ORIGIN_MODULE_A)
+        presence.backend = FakeBackend(servico_pb2.PresenceSyncResponse(
+            changes=[change("login-1", "ana", "AWAY"), change("m-2", "remoto", "ONLINE")],
+            version=42, full=True
+        ))
+        await presence.sync()
+
+        sent, since = presence.backend.sent[0]
+        assert since == 0
+        assert [(c.user.username, c.user.status) for c in sent] == [("ana", servico_pb2.ONLINE)]
+        assert presence.since_version == 42
+        assert usernames(presence.store) == ["ana", "remoto"]
+        assert presence.store.get("r", "ws-1").status == "AWAY"
+        await presence.close()
+
+    asyncio.run(scenario())
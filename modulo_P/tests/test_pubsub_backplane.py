@@ -0,0 +1,165 @@
+"""
+Backplane pub/sub: seqs reservados no broker, mesma ordem em todos os pods
+"""
+
+import asyncio
+
+from pubsub_backplane import InMemoryPubSub, InMemoryPubSubClient, PubSubBackplane
+
+
+class Pod:
+    """Uma réplica do gateway: backplane próprio e os eventos que aplicou"""
+
+    def __init__(self, broker: InMemoryPubSub, **kwargs):
+        self.backplane = PubSubBackplane(InMemoryPubSubClient(broker), **kwargs)
+        self.events = []
+
+    async def start(self):
+        await self.backplane.start(self.apply)
+
+    async def apply(self, event):
+        self.events.append(event)
+
+    def seqs(self, room_id):
+        return [(e["seq"], e["id"]) for e in self.events if e["room_id"] == room_id and e["kind"] == "message"]
+
+
+def message(room_id, message_id):
+    return {"kind": "message", "room_id": room_id, "id": message_id}
+
+
+async def settle():
+    # Deixa o timer de flush e as tarefas de leitura rodarem
+    for _ in range(5):
+        await asyncio.sleep(0.005)
+
+
+def test_pods_see_the_same_seqs_in_the_same_order():
+    async def scenario():
+        broker = InMemoryPubSub()
+        pods = [Pod(broker), Pod(broker)]
+        for pod in pods:
+            await pod.start()
+            await pod.backplane.subscribe("r")
+
+        await pods[0].backplane.publish(message("r", "a1"))
+        await pods[1].backplane.publish(message("r", "b1"))
+        await pods[0].backplane.publish({"kind": "broadcast", "room_id": "r", "id": "x"})
+        await pods[0].backplane.publish(message("r", "a2"))
+        await settle()
+        await pods[1].backplane.publish(message("r", "b2"))
+        await settle()
+
+        expected = pods[0].seqs("r")
+        assert [seq for seq, _ in expected] == [1, 2, 3, 4]
+        assert sorted(message_id for _, message_id in expected) == ["a1", "a2", "b1", "b2"]
+        assert pods[1].seqs("r") == expected
+        # Eventos sem seq não consomem a numeração
+        assert [e["id"] for e in pods[0].events] == [e["id"] for e in pods[1].events]
+        assert broker.seqs["r"] == 4
+        for pod in pods:
+            await pod.backplane.close()
+
+    asyncio.run(scenario())
+
+
+def test_seqs_are_reserved_per_room_and_batches_respect_max_batch():
+    async def scenario():
+        broker = InMemoryPubSub()
+        pod = Pod(broker, max_batch=3)
+        await pod.start()
+        await pod.backplane.subscribe("r")
+        await pod.backplane.subscribe("s")
+
+        for index in range(7):
+            await pod.backplane.publish(message("r", f"r{index}"))
+        await pod.backplane.publish(message("s", "s0"))
+        await settle()
+
+        assert pod.seqs("r") == [(index + 1, f"r{index}") for index in range(7)]
+        assert pod.seqs("s") == [(1, "s0")]
+        # Dois lotes cheios de "r", depois o resto de "r" e "s" no flush do timer
+        assert pod.backplane.batches_published == 4
+        await pod.backplane.close()
+
+    asyncio.run(scenario())
+
+
+def test_unsubscribed_pod_stops_receiving_but_seqs_keep_advancing():
+    async def scenario():
+        broker = InMemoryPubSub()
+        publisher, listener = Pod(broker), Pod(broker)
+        for pod in (publisher, listener):
+            await pod.start()
+        await listener.backplane.subscribe("r")
+
+        await publisher.backplane.publish(message("r", "m1"))
+        await settle()
+        await listener.backplane.unsubscribe("r")
+        await publisher.backplane.publish(message("r", "m2"))
+        await settle()
+        await listener.backplane.subscribe("r")
+        await publisher.backplane.publish(message("r", "m3"))
+        await settle()
+
+        assert listener.seqs("r") == [(1, "m1"), (3, "m3")]
+        assert publisher.events == []
+        for pod in (publisher, listener):
+            await pod.backplane.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_retried_in_order():
+    class FlakyClient(InMemoryPubSubClient):
+        def __init__(self, broker):
+            super().__init__(broker)
+            self.failures = 2
+
+        async def publish_batch(self, room_id, seq_count, payload):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("broker fora do ar")
+            await super().publish_batch(room_id, seq_count, payload)
+
+    async def scenario():
+        broker = InMemoryPubSub()
+        pod = Pod(broker, retry_interval=0.005)
+        pod.backplane.client = FlakyClient(broker)
+        await pod.start()
+        await pod.backplane.subscribe("r")
+
+        await pod.backplane.publish(message("r", "m1"))
+        await pod.backplane.publish(message("r", "m2"))
+        await asyncio.sleep(0.003)
+        await pod.backplane.publish(message("r", "m3"))
+        for _ in range(10):
+            await settle()
+
+        assert pod.seqs("r") == [(1, "m1"), (2, "m2"), (3, "m3")]
+        assert pod.backplane.publish_failures == 2
+        assert pod.backplane.stats()["events_dropped"] == 0
+        await pod.backplane.close()
+
+    asyncio.run(scenario())
+
+
+def test_retry_queue_is_bounded():
+    class DownClient(InMemoryPubSubClient):
+        async def publish_batch(self, room_id, seq_count, payload):
+            raise ConnectionError("broker fora do ar")
+
+    async def scenario():
+        pod = Pod(InMemoryPubSub(), max_pending=3, retry_interval=60)
+        pod.backplane.client = DownClient(InMemoryPubSub())
+        await pod.start()
+        for index in range(3):
+            await pod.backplane.publish(message("r", f"m{index}"))
+        await pod.backplane.flush()
+        assert len(pod.backplane._pending["r"]) == 3
+        await pod.backplane.publish(message("r", "m3"))
+        await pod.backplane.flush()
+        assert pod.backplane.events_dropped == 4
+        await pod.backplane.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,141 @@
+"""
+Circuit breaker e prazos da camada de resiliência
+"""
+
+import asyncio
+import time
+
+import grpc
+import pytest
+
+from resilience import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError, DeadlineExhausted,
+    LocalRpcError, Resilience, deadline_scope, detached_scope, remaining
+)
+
+
+def backend_error(code: grpc.StatusCode) -> grpc.aio.AioRpcError:
+    return grpc.aio.AioRpcError(code, grpc.aio.Metadata(), grpc.aio.Metadata(), code.name)
+
+
+def elapse_reset(breaker: CircuitBreaker):
+    # Simula a passagem do intervalo de espera sem dormir
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def fail(error: BaseException):
+    async def factory():
+        raise error
+    return factory
+
+
+async def succeed():
+    return "ok"
+
+
+def test_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker("b", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.rejections == 2
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker("b", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    elapse_reset(breaker)
+    breaker.before_call()
+    assert breaker.state == STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes_and_probe_failure_reopens():
+    breaker = CircuitBreaker("b", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    elapse_reset(breaker)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.is_open()
+
+    elapse_reset(breaker)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.failures == 0
+
+
+def test_application_error_from_backend_counts_as_success():
+    breaker = CircuitBreaker("b", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    with pytest.raises(grpc.RpcError):
+        asyncio.run(breaker.call(fail(backend_error(grpc.StatusCode.INVALID_ARGUMENT))))
+    assert breaker.failures == 0
+
+
+@pytest.mark.parametrize("error", [
+    ValueError("bug no gateway"),
+    KeyError("campo"),
+    LocalRpcError(grpc.StatusCode.DEADLINE_EXCEEDED, "prazo local"),
+    CircuitOpenError("outro"),
+])
+def test_local_errors_do_not_reset_failures_or_close_half_open(error):
+    breaker = CircuitBreaker("b", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    with pytest.raises(type(error)):
+        asyncio.run(breaker.call(fail(error)))
+    assert breaker.failures == 1
+    assert breaker.state == STATE_CLOSED
+
+    breaker.record_failure()
+    elapse_reset(breaker)
+    with pytest.raises(type(error)):
+        asyncio.run(breaker.call(fail(error)))
+    # O erro local só libera a chamada de teste: o circuito continua meio aberto
+    assert breaker.state == STATE_HALF_OPEN
+    assert asyncio.run(breaker.call(succeed)) == "ok"
+    assert breaker.state == STATE_CLOSED
+
+
+def test_backend_unavailable_counts_as_failure():
+    breaker = CircuitBreaker("b", failure_threshold=1, reset_timeout=60)
+    with pytest.raises(grpc.RpcError):
+        asyncio.run(breaker.call(fail(backend_error(grpc.StatusCode.UNAVAILABLE))))
+    assert breaker.state == STATE_OPEN
+
+
+def test_timeout_is_the_smallest_of_caller_budget_and_deadline():
+    resilience = Resilience(budgets={"Metodo": 2.0})
+    assert resilience.timeout_for("Metodo", 10) == 2.0
+    assert resilience.timeout_for("Outro", 10) == 10
+    with deadline_scope(0.5):
+        assert resilience.timeout_for("Metodo", 10) <= 0.5
+        with deadline_scope(5):
+            # Um escopo interno nunca estende o prazo de fora
+            assert remaining() <= 0.5
+    assert remaining() is None
+
+
+def test_spent_deadline_fails_before_calling():
+    resilience = Resilience()
+    with deadline_scope(0.001):
+        time.sleep(0.002)
+        with pytest.raises(DeadlineExhausted):
+            resilience.timeout_for("Metodo", 10)
+
+
+def test_detached_scope_ignores_the_request_deadline_for_long_lived_streams():
+    resilience = Resilience(budgets={"Metodo": 2.0})
+    with deadline_scope(0.5):
+        with detached_scope():
+            assert remaining() is None
+            assert resilience.timeout_for("UploadFile", 600) == 600
+        assert remaining() <= 0.5
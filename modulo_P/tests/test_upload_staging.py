@@ -0,0 +1,85 @@
+"""
+Staging de uploads em disco: gravação por offset, retomada, limite global e TTL
+"""
+
+import pytest
+
+from upload_staging import StagingError, StagingFullError, StagingStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    staging = StagingStore(directory=str(tmp_path), max_total_bytes=1000, ttl_seconds=60, max_file_size=400)
+    yield staging
+    staging.close()
+
+
+def read(staged) -> bytes:
+    with staged.open_view() as view:
+        return bytes(view)
+
+
+def test_resumed_upload_continues_from_the_offset_already_written(store):
+    staged = store.create("f", 10)
+    assert staged.preallocated and staged.capacity == 10
+    staged.write_at(0, b"abcd")
+    # Conexão caiu: o cliente retoma do offset gravado
+    assert staged.size == 4
+    staged.write_at(staged.size, memoryview(b"efghij"))
+    assert staged.size == 10
+    assert read(staged) == b"abcdefghij"
+
+
+def test_chunks_out_of_order_land_at_their_offsets(store):
+    staged = store.create("f")
+    assert not staged.preallocated and staged.capacity == 400
+    staged.write_at(6, b"ghi")
+    staged.write_at(0, b"abc")
+    staged.write_at(3, b"def")
+    assert staged.size == 9
+    assert staged.bytes_written == 9
+    assert read(staged) == b"abcdefghi"
+
+
+def test_write_outside_the_reserved_capacity_is_rejected(store):
+    staged = store.create("f", 4)
+    with pytest.raises(StagingError):
+        staged.write_at(2, b"xyz")
+    with pytest.raises(StagingError):
+        staged.write_at(-1, b"x")
+    assert staged.size == 0
+    assert read(staged) == b""
+
+
+def test_global_cap_counts_reservations_and_discard_returns_them(store):
+    store.create("a", 300)
+    store.create("b")
+    assert store.reserved_bytes == 700
+    with pytest.raises(StagingFullError):
+        store.create("c", 301)
+    with pytest.raises(StagingError):
+        store.create("c", 401)
+
+    store.discard("b")
+    assert store.reserved_bytes == 300
+    store.create("c", 400)
+    assert store.stats()["sessions"] == 2
+
+
+def test_recreating_an_upload_replaces_the_previous_session(store):
+    first = store.create("f", 100)
+    second = store.create("f", 50)
+    assert first.closed and not second.closed
+    assert store.get("f") is second
+    assert store.reserved_bytes == 50
+
+
+def test_sweep_discards_idle_uploads(store):
+    idle = store.create("idle", 10)
+    active = store.create("active", 10)
+    idle.last_activity -= 120
+    assert store.sweep() == ["idle"]
+    assert idle.closed and store.get("idle") is None
+    assert store.get("active") is active
+    with pytest.raises(StagingError):
+        idle.write_at(0, b"x")
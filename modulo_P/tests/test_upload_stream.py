@@ -0,0 +1,101 @@
+"""
+Upload em streaming para o Módulo B: offsets da retomada e re-fatiamento em chunks gRPC
+"""
+
+import asyncio
+
+import pytest
+
+import upload_stream
+from upload_stream import StreamingUpload, UploadOffsetError, UploadStreamError
+
+
+class FakeUploadCall:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.cancelled = False
+
+    async def write(self, chunk):
+        self.chunks.append(chunk)
+
+    async def done_writing(self):
+        self.done = True
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __await__(self):
+        async def response():
+            return "resposta"
+        return response().__await__()
+
+
+class FakeBackend:
+    def __init__(self):
+        self.call = FakeUploadCall()
+
+    def open_upload(self, timeout):
+        return self.call
+
+
+METADATA = {
+    "file_id": "f", "filename": "a.bin", "mime_type": "application/octet-stream",
+    "user_id": "u", "username": "ana", "room_id": "r",
+}
+
+
+def make_upload(file_size, monkeypatch, grpc_chunk_size=4):
+    monkeypatch.setattr(upload_stream, "GRPC_CHUNK_SIZE", grpc_chunk_size)
+    backend = FakeBackend()
+    return StreamingUpload(backend, dict(METADATA, file_size=file_size)), backend.call
+
+
+def test_append_requires_the_current_offset_and_keeps_state_on_mismatch(monkeypatch):
+    async def scenario():
+        upload, call = make_upload(10, monkeypatch)
+        await upload.append(b"abc", 0)
+        with pytest.raises(UploadOffsetError) as error:
+            await upload.append(b"xyz", 5)
+        assert error.value.expected == 3
+        assert upload.bytes_received == 3
+
+        # Retomada a partir do offset informado pelo HEAD
+        await upload.append(b"defghij", upload.bytes_received)
+        assert upload.complete
+        assert await upload.finish() == "resposta"
+        assert call.done
+        assert b"".join(chunk.chunk_data for chunk in call.chunks) == b"abcdefghij"
+        assert [chunk.chunk_index for chunk in call.chunks] == [0, 1, 2]
+        assert {chunk.total_chunks for chunk in call.chunks} == {3}
+
+    asyncio.run(scenario())
+
+
+def test_data_beyond_file_size_and_early_finish_are_rejected(monkeypatch):
+    async def scenario():
+        upload, _ = make_upload(4, monkeypatch)
+        with pytest.raises(UploadStreamError):
+            await upload.append(b"abcde", 0)
+        await upload.append(b"ab", 0)
+        with pytest.raises(UploadStreamError):
+            await upload.finish()
+
+    asyncio.run(scenario())
+
+
+def test_client_chunks_must_arrive_in_order(monkeypatch):
+    async def scenario():
+        upload, _ = make_upload(8, monkeypatch)
+        await upload.write(b"ab", 0)
+        with pytest.raises(UploadStreamError):
+            await upload.write(b"cd", 2)
+        await upload.write(b"cd", 1)
+        assert upload.bytes_received == 4
+
+    asyncio.run(scenario())
+
+
+def test_file_size_is_required():
+    with pytest.raises(UploadStreamError):
+        StreamingUpload(FakeBackend(), dict(METADATA, file_size=0))
@@ -0,0 +1,233 @@
+"""
+Transportes do Módulo P para /api/executar (ServicoA + ServicoB)
+O ServiceClient fala com os módulos A e B através de um Transport, com a mesma
+interface assíncrona para gRPC e REST, de modo que os dois modos de
+MODOP_COMUNICACAO possam ser comparados em pé de igualdade:
+
+- grpc: AsyncBackendClient (canais grpc.aio persistentes do ChannelManager)
+- rest: um único httpx.AsyncClient compartilhado, com keep-alive, pool de
+  conexões limitado e HTTP/2 quando o servidor o negocia
+"""
+
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import grpc
+from prometheus_client import Histogram
+
+from aio_clients import AsyncBackendClient, MODULO_A, MODULO_B
+from resilience import Resilience, is_backend_response, is_failure
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_GRPC = "grpc"
+TRANSPORT_REST = "rest"
+
+# ==============================================================================
+# MÉTRICAS DOS TRANSPORTES
+# ==============================================================================
+backend_call_duration_seconds = Histogram(
+    'backend_call_duration_seconds',
+    'Duration of /api/executar backend calls (unary, or the whole Module B stream)',
+    ['transport', 'backend'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+# ==============================================================================
+
+
+class Transport:
+    """Chamadas de /api/executar aos módulos A (unary) e B (sequência de respostas)"""
+
+    name = ""
+    label = ""
+
+    async def realizar_tarefa_a(self, request_id: str, data: str, operation: str,
+                                timeout: float = 10) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def realizar_tarefa_b(self, request_id: str, data: str, count: int,
+                          timeout: float = 30) -> AsyncIterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @staticmethod
+    def error_detail(error: Exception) -> str:
+        return str(error)
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": self.name}
+
+
+class GrpcTransport(Transport):
+    """ServicoA/ServicoB pelos canais grpc.aio do pool"""
+
+    name = TRANSPORT_GRPC
+    label = "gRPC"
+
+    def __init__(self, backend: AsyncBackendClient):
+        self.backend = backend
+
+    async def realizar_tarefa_a(self, request_id: str, data: str, operation: str,
+                                timeout: float = 10) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            response_a = await self.backend.realizar_tarefa_a(request_id, data, operation, timeout=timeout)
+        finally:
+            backend_call_duration_seconds.labels(transport=self.name, backend=MODULO_A).observe(
+                time.perf_counter() - started
+            )
+        return {
+            "id": response_a.id,
+            "result": response_a.result,
+            "message": response_a.message,
+            "status_code": response_a.status_code
+        }
+
+    async def realizar_tarefa_b(self, request_id: str, data: str, count: int,
+                                timeout: float = 30) -> AsyncIterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            async for response_b in self.backend.realizar_tarefa_b(request_id, data, count, timeout=timeout):
+                yield {
+                    "id": response_b.id,
+                    "result": response_b.result,
+                    "message": response_b.message,
+                    "sequence_number": response_b.sequence_number,
+                    "is_final": response_b.is_final
+                }
+        finally:
+            backend_call_duration_seconds.labels(transport=self.name, backend=MODULO_B).observe(
+                time.perf_counter() - started
+            )
+
+    @staticmethod
+    def error_detail(error: Exception) -> str:
+        return error.details() if isinstance(error, grpc.RpcError) else str(error)
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": self.name, "channel_pools": self.backend.channels.stats()}
+
+
+class RestTransport(Transport):
+    """REST/JSON dos módulos A e B sobre um httpx.AsyncClient compartilhado"""
+
+    name = TRANSPORT_REST
+    label = "REST"
+
+    def __init__(self, modulo_a_url: str, modulo_b_url: str, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 30.0, http2: bool = True,
+                 resilience: Optional[Resilience] = None):
+        if httpx is None:
+            raise RuntimeError("MODOP_COMUNICACAO=rest requer o pacote 'httpx' (pip install httpx[http2])")
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("⚠️ Pacote 'h2' ausente: transporte REST restrito a HTTP/1.1")
+                http2 = False
+        # Mesmos prazos e circuit breakers do transporte gRPC
+        self.resilience = resilience if resilience is not None else Resilience()
+        self.modulo_a_url = modulo_a_url.rstrip("/")
+        self.modulo_b_url = modulo_b_url.rstrip("/")
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        # HTTP/2 é negociado por ALPN (TLS); em http:// o cliente fica no HTTP/1.1 com keep-alive
+        self.client = httpx.AsyncClient(limits=self.limits, http2=http2)
+        self.requests = 0
+        self.http_versions: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls, resilience: Optional[Resilience] = None) -> "RestTransport":
+        modulo_a = f"{os.getenv('MODULO_A_HOST', 'localhost')}:{os.getenv('MODULO_A_PORT_REST', '5001')}"
+        modulo_b = f"{os.getenv('MODULO_B_HOST', 'localhost')}:{os.getenv('MODULO_B_PORT_REST', '5002')}"
+        scheme = os.getenv('REST_SCHEME', 'http')
+        return cls(
+            f"{scheme}://{modulo_a}",
+            f"{scheme}://{modulo_b}",
+            max_connections=int(os.getenv('REST_MAX_CONNECTIONS', '100')),
+            max_keepalive_connections=int(os.getenv('REST_MAX_KEEPALIVE_CONNECTIONS', '20')),
+            keepalive_expiry=float(os.getenv('REST_KEEPALIVE_EXPIRY', '30')),
+            http2=os.getenv('REST_HTTP2', 'true').lower() in ('1', 'true', 'yes'),
+            resilience=resilience
+        )
+
+    @staticmethod
+    def _is_failure(error: BaseException) -> bool:
+        # Erros de transporte e 5xx abrem o circuito; 4xx é erro da requisição
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError) or is_failure(error)
+
+    @staticmethod
+    def _responded(error: BaseException) -> bool:
+        # Qualquer resposta HTTP (inclusive 4xx) mostra que o backend está de pé
+        return isinstance(error, httpx.HTTPStatusError) or is_backend_response(error)
+
+    async def _post(self, backend: str, method: str, url: str, payload: Dict[str, Any],
+                    timeout: float) -> Dict[str, Any]:
+        timeout = self.resilience.timeout_for(method, timeout)
+
+        async def attempt():
+            resp = await self.client.post(url, json=payload, timeout=timeout)
+            resp.raise_for_status()
+            return resp
+
+        started = time.perf_counter()
+        try:
+            resp = await self.resilience.breaker(backend).call(attempt, self._is_failure, self._responded)
+        finally:
+            backend_call_duration_seconds.labels(transport=self.name, backend=backend).observe(
+                time.perf_counter() - started
+            )
+        self.requests += 1
+        self.http_versions[resp.http_version] = self.http_versions.get(resp.http_version, 0) + 1
+        return resp.json()
+
+    async def realizar_tarefa_a(self, request_id: str, data: str, operation: str,
+                                timeout: float = 10) -> Dict[str, Any]:
+        payload = {"id": request_id, "data": data, "operation": operation}
+        return await self._post(MODULO_A, "RealizarTarefaA", f"{self.modulo_a_url}/realizar-tarefa-a", payload, timeout)
+
+    async def realizar_tarefa_b(self, request_id: str, data: str, count: int,
+                                timeout: float = 15) -> AsyncIterator[Dict[str, Any]]:
+        payload = {"id": request_id, "data": data, "count": count}
+        # O REST do Módulo B devolve todas as respostas de uma vez
+        body = await self._post(MODULO_B, "RealizarTarefaB", f"{self.modulo_b_url}/realizar-tarefa-b", payload, timeout)
+        for response_b in body.get("respostas", []):
+            yield response_b
+
+    async def close(self):
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": self.name,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "requests": self.requests,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+def transport_from_env(backend: AsyncBackendClient) -> Transport:
+    """MODOP_COMUNICACAO=grpc (padrão) ou rest"""
+    if os.getenv('MODOP_COMUNICACAO', TRANSPORT_GRPC).lower() == TRANSPORT_REST:
+        return RestTransport.from_env(backend.resilience)
+    return GrpcTransport(backend)
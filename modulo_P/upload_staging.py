@@ -0,0 +1,214 @@
+"""
+Área de staging em disco para uploads do Módulo P
+Uploads que não podem ser encaminhados na hora ao Módulo B (file_size
+desconhecido ou Módulo B indisponível) não ficam mais como `bytes` na memória:
+cada chunk é gravado no seu offset em um arquivo temporário pré-alocado, e a
+remontagem é lida via mmap/memoryview, sem cópias intermediárias.
+
+- O total de bytes reservados é limitado globalmente (UPLOAD_STAGING_MAX_BYTES)
+- Sessões abandonadas expiram após UPLOAD_STAGING_TTL_SECONDS sem atividade
+- Os arquivos são removidos do diretório logo após a criação (só o descritor
+  fica aberto), então nada sobra em disco se o processo morrer
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MÉTRICAS DO STAGING DE UPLOADS
+# ==============================================================================
+upload_staging_reserved_bytes = Gauge(
+    'upload_staging_reserved_bytes',
+    'Bytes reserved on disk by staged uploads'
+)
+
+upload_staging_sessions = Gauge(
+    'upload_staging_sessions',
+    'Uploads currently staged on disk'
+)
+
+upload_staging_rejected_total = Counter(
+    'upload_staging_rejected_total',
+    'Staged uploads rejected because the global byte cap was reached'
+)
+
+upload_staging_expired_total = Counter(
+    'upload_staging_expired_total',
+    'Staged uploads discarded by the TTL sweeper'
+)
+# ==============================================================================
+
+# Mesmo limite de arquivo do Módulo B (maxFileSize)
+DEFAULT_MAX_FILE_SIZE = 25 * 1024 * 1024
+
+
+class StagingError(Exception):
+    """Erro ao gravar um upload na área de staging"""
+
+
+class StagingFullError(StagingError):
+    """Limite global de bytes em staging atingido"""
+
+
+class StagedUpload:
+    """Arquivo temporário de um upload; chunks gravados por offset (os.pwrite)"""
+
+    def __init__(self, file_id: str, fd: int, capacity: int, preallocated: bool):
+        self.file_id = file_id
+        self.capacity = capacity
+        self.preallocated = preallocated
+        self.size = 0
+        self.bytes_written = 0
+        self.closed = False
+        self.last_activity = time.monotonic()
+        self._fd = fd
+
+    def write_at(self, offset: int, data) -> int:
+        """Grava `data` a partir de `offset` (sem copiar o buffer do chamador)"""
+        if self.closed:
+            raise StagingError(f"Upload {self.file_id} expirou")
+        end = offset + len(data)
+        if offset < 0 or end > self.capacity:
+            raise StagingError(f"Chunk fora do limite do upload ({end} > {self.capacity} bytes)")
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += os.pwrite(self._fd, view[written:], offset + written)
+        self.size = max(self.size, end)
+        self.bytes_written += written
+        self.last_activity = time.monotonic()
+        return written
+
+    @contextmanager
+    def open_view(self) -> Iterator[memoryview]:
+        """
+        memoryview somente leitura do conteúdo remontado (mmap do arquivo)
+        Fatias da view não podem ser usadas depois que o bloco `with` termina
+        """
+        if self.closed:
+            raise StagingError(f"Upload {self.file_id} expirou")
+        if self.size == 0:
+            yield memoryview(b"")
+            return
+        mapped = mmap.mmap(self._fd, self.size, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            mapped.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.close(self._fd)
+
+
+class StagingStore:
+    """Registro das sessões em staging com limite global de bytes e expiração por TTL"""
+
+    def __init__(self, directory: Optional[str] = None,
+                 max_total_bytes: int = 1024 * 1024 * 1024,
+                 ttl_seconds: float = 600,
+                 max_file_size: int = DEFAULT_MAX_FILE_SIZE):
+        self.directory = directory or tempfile.gettempdir()
+        self.max_total_bytes = max_total_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_file_size = max_file_size
+        self.reserved_bytes = 0
+        self.uploads: Dict[str, StagedUpload] = {}
+
+    @classmethod
+    def from_env(cls) -> "StagingStore":
+        return cls(
+            directory=os.getenv('UPLOAD_STAGING_DIR') or None,
+            max_total_bytes=int(os.getenv('UPLOAD_STAGING_MAX_BYTES', str(1024 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv('UPLOAD_STAGING_TTL_SECONDS', '600')),
+            max_file_size=int(os.getenv('UPLOAD_MAX_FILE_SIZE', str(DEFAULT_MAX_FILE_SIZE)))
+        )
+
+    def create(self, file_id: str, file_size: int = 0) -> StagedUpload:
+        """
+        Reserva espaço para um upload. Com file_size conhecido o arquivo é pré-alocado;
+        sem ele, reserva-se o tamanho máximo de arquivo e o arquivo cresce conforme os chunks
+        """
+        self.discard(file_id)
+        if file_size > self.max_file_size:
+            raise StagingError(f"Arquivo muito grande (máx {self.max_file_size // (1024 * 1024)}MB)")
+        capacity = file_size if file_size > 0 else self.max_file_size
+        if self.reserved_bytes + capacity > self.max_total_bytes:
+            upload_staging_rejected_total.inc()
+            raise StagingFullError("Área de staging de uploads cheia, tente novamente mais tarde")
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="upload-", dir=self.directory)
+        os.unlink(path)
+        try:
+            if file_size > 0:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, file_size)
+                else:
+                    os.ftruncate(fd, file_size)
+        except OSError as e:
+            os.close(fd)
+            raise StagingError(f"Sem espaço para o upload em staging: {e}")
+
+        staged = StagedUpload(file_id, fd, capacity, preallocated=file_size > 0)
+        self.uploads[file_id] = staged
+        self.reserved_bytes += capacity
+        upload_staging_reserved_bytes.set(self.reserved_bytes)
+        upload_staging_sessions.set(len(self.uploads))
+        return staged
+
+    def get(self, file_id: str) -> Optional[StagedUpload]:
+        return self.uploads.get(file_id)
+
+    def discard(self, file_id: str):
+        """Fecha o arquivo e devolve a reserva ao limite global"""
+        staged = self.uploads.pop(file_id, None)
+        if staged is None:
+            return
+        staged.close()
+        self.reserved_bytes -= staged.capacity
+        upload_staging_reserved_bytes.set(self.reserved_bytes)
+        upload_staging_sessions.set(len(self.uploads))
+
+    def sweep(self) -> List[str]:
+        """Descarta sessões sem atividade há mais de ttl_seconds; retorna os file_ids expirados"""
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [file_id for file_id, staged in self.uploads.items() if staged.last_activity < deadline]
+        for file_id in expired:
+            self.discard(file_id)
+            upload_staging_expired_total.inc()
+            logger.info(f"🧹 Upload em staging {file_id} expirado")
+        return expired
+
+    async def run_sweeper(self, interval: float = 30,
+                          on_expire: Optional[Callable[[str], None]] = None):
+        """Laço do varredor de TTL (executar como tarefa em segundo plano)"""
+        while True:
+            await asyncio.sleep(interval)
+            for file_id in self.sweep():
+                if on_expire is not None:
+                    on_expire(file_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.uploads),
+            "reserved_bytes": self.reserved_bytes,
+            "max_total_bytes": self.max_total_bytes,
+        }
+
+    def close(self):
+        for file_id in list(self.uploads):
+            self.discard(file_id)
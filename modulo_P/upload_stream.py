@@ -0,0 +1,110 @@
+"""
+Upload em streaming do Módulo P para o Módulo B
+Cada chunk recebido do cliente é encaminhado direto para um
+FileService.UploadFile (client-streaming) já aberto. O `await call.write()`
+respeita o controle de fluxo do gRPC/HTTP2, então a leitura do WebSocket
+desacelera quando o Módulo B não acompanha. A memória por upload fica
+limitada a um chunk gRPC pendente, independentemente do tamanho do arquivo.
+"""
+
+import logging
+from typing import Any, Dict
+
+import servico_pb2
+
+logger = logging.getLogger(__name__)
+
+# Limite de chunk aceito pelo Módulo B (maxChunkSize)
+GRPC_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadStreamError(Exception):
+    """Erro de protocolo no upload em streaming (ordem/tamanho dos chunks)"""
+
+
+class UploadOffsetError(UploadStreamError):
+    """Bytes enviados a partir de um offset diferente do já recebido (upload retomável)"""
+
+    def __init__(self, expected: int, received: int):
+        super().__init__(f"Offset inesperado: esperado {expected}, recebido {received}")
+        self.expected = expected
+
+
+class StreamingUpload:
+    """Upload em andamento, encaminhado chunk a chunk para FileService.UploadFile"""
+
+    def __init__(self, backend, metadata: Dict[str, Any], timeout: float = 120):
+        file_size = int(metadata.get("file_size") or 0)
+        if file_size <= 0:
+            raise UploadStreamError("file_size é obrigatório para upload em streaming")
+        self.metadata = metadata
+        self.file_size = file_size
+        # O Módulo B precisa de total_chunks já no primeiro chunk: re-fatiamos em blocos
+        # de GRPC_CHUNK_SIZE, independentemente do tamanho dos chunks do cliente
+        self.total_grpc_chunks = (file_size + GRPC_CHUNK_SIZE - 1) // GRPC_CHUNK_SIZE
+        self.bytes_received = 0
+        self.next_client_chunk = 0
+        self._next_grpc_index = 0
+        self._carry = bytearray()
+        self._call = backend.open_upload(timeout=timeout)
+
+    async def write(self, data, chunk_index: int):
+        """Encaminha um chunk do cliente (em ordem); aguarda o controle de fluxo do gRPC"""
+        if chunk_index != self.next_client_chunk:
+            raise UploadStreamError(
+                f"Chunk fora de ordem: esperado {self.next_client_chunk}, recebido {chunk_index}"
+            )
+        self.next_client_chunk += 1
+        await self.append(data, self.bytes_received)
+
+    async def append(self, data, offset: int):
+        """Encaminha bytes a partir de `offset`, que deve ser o total já recebido (upload HTTP)"""
+        if offset != self.bytes_received:
+            raise UploadOffsetError(self.bytes_received, offset)
+        if self.bytes_received + len(data) > self.file_size:
+            raise UploadStreamError("Dados excedem o file_size declarado")
+
+        self.bytes_received += len(data)
+        self._carry += data
+        while len(self._carry) >= GRPC_CHUNK_SIZE:
+            piece = bytes(self._carry[:GRPC_CHUNK_SIZE])
+            del self._carry[:GRPC_CHUNK_SIZE]
+            await self._send(piece)
+
+    async def _send(self, piece: bytes):
+        metadata = self.metadata
+        await self._call.write(servico_pb2.FileChunk(
+            file_id=metadata['file_id'],
+            filename=metadata['filename'],
+            mime_type=metadata['mime_type'],
+            chunk_data=piece,
+            chunk_index=self._next_grpc_index,
+            total_chunks=self.total_grpc_chunks,
+            file_size=self.file_size,
+            user_id=metadata['user_id'],
+            username=metadata['username'],
+            room_id=metadata['room_id']
+        ))
+        self._next_grpc_index += 1
+
+    @property
+    def complete(self) -> bool:
+        return self.bytes_received == self.file_size
+
+    async def finish(self) -> servico_pb2.FileUploadResponse:
+        """Envia o restante, encerra o stream e retorna a resposta do Módulo B"""
+        if not self.complete:
+            raise UploadStreamError(
+                f"Upload incompleto: {self.bytes_received}/{self.file_size} bytes recebidos"
+            )
+        if self._carry:
+            piece = bytes(self._carry)
+            self._carry.clear()
+            await self._send(piece)
+        await self._call.done_writing()
+        return await self._call
+
+    def abort(self):
+        """Cancela o UploadFile no Módulo B (ex.: cliente desconectou no meio do upload)"""
+        self._carry.clear()
+        self._call.cancel()